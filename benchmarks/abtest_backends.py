@@ -0,0 +1,60 @@
+"""Throughput of abtest participate/convert on the in-process backend and on
+Redis.
+
+    python benchmarks/abtest_backends.py --clients 20000
+    python benchmarks/abtest_backends.py --redis-url redis://localhost:6379/15
+
+The Redis run is skipped when the server cannot be reached. It flushes the
+selected database, so point it at a scratch db.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import redis
+
+from mlopskit.ext.abtest.api import convert, participate
+from mlopskit.ext.abtest.backends import MemoryRedis
+
+
+def run(conn, clients, conversion_every):
+    alternatives = ["control", "variant-a", "variant-b"]
+    start = time.perf_counter()
+    for i in range(clients):
+        client_id = "client-{0}".format(i)
+        participate("bench", alternatives, client_id, redis=conn)
+        if i % conversion_every == 0:
+            convert("bench", client_id, redis=conn)
+    elapsed = time.perf_counter() - start
+    calls = clients + clients // conversion_every + 1
+    return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--conversion-every", type=int, default=5)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    args = parser.parse_args()
+
+    backends = [("memory", MemoryRedis())]
+
+    path = os.path.join(tempfile.mkdtemp(), "sixpack.pkl")
+    backends.append(("memory+file", MemoryRedis(path=path, save_interval=60)))
+
+    conn = redis.StrictRedis.from_url(args.redis_url, decode_responses=True)
+    try:
+        conn.flushdb()
+        backends.append(("redis", conn))
+    except redis.ConnectionError:
+        print("redis: {0} is not reachable, skipping".format(args.redis_url))
+
+    for name, conn in backends:
+        throughput = run(conn, args.clients, args.conversion_every)
+        print("{0:<12} {1:>10,.0f} calls/sec".format(name, throughput))
+
+
+if __name__ == "__main__":
+    main()
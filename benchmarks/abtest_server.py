@@ -0,0 +1,175 @@
+"""Requests/sec per core of the WSGI Sixpack server against the ASGI one.
+
+Both servers are started on localhost against the redis configured through
+``SIXPACK_CONFIG`` (or the ``SIXPACK_CONFIG_*`` environment variables), then
+driven with the same participate/convert mix by an aiohttp load generator:
+
+    SIXPACK_CONFIG=sixpack.yml python benchmarks/abtest_server.py --workers 1
+    SIXPACK_CONFIG=sixpack.yml python benchmarks/abtest_server.py --workers 4 \\
+        --concurrency 256 --duration 30
+
+The WSGI server runs under gunicorn sync workers, the ASGI one under uvicorn.
+The load generator shares the machine, so on small hosts pin it away from the
+server workers (``taskset``) for stable per-core numbers. Experiments are
+written under ``bench-server-*`` names; point the config at a scratch db.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import aiohttp
+
+SERVERS = {
+    "wsgi": [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "--workers",
+        "{workers}",
+        "--bind",
+        "127.0.0.1:{port}",
+        "--log-level",
+        "warning",
+        "mlopskit.ext.abtest.server:start",
+    ],
+    "asgi": [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "--workers",
+        "{workers}",
+        "--host",
+        "127.0.0.1",
+        "--port",
+        "{port}",
+        "--log-level",
+        "warning",
+        "--no-access-log",
+        "mlopskit.ext.abtest.asgi:app",
+    ],
+}
+
+
+def start_server(kind, workers, port):
+    cmd = [arg.format(workers=workers, port=port) for arg in SERVERS[kind]]
+    return subprocess.Popen(cmd, env=dict(os.environ))
+
+
+async def wait_ready(session, url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            async with session.get(url + "/_status") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("{0} did not come up".format(url))
+
+
+async def load(url, experiment, concurrency, duration, conversion_every):
+    alternatives = [("alternatives", alt) for alt in ["control", "a", "b"]]
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + duration
+
+    async def worker(session, worker_id):
+        i = 0
+        while time.perf_counter() < deadline:
+            client_id = "{0}-{1}".format(worker_id, i)
+            requests = [
+                (
+                    "/participate",
+                    [("experiment", experiment), ("client_id", client_id)]
+                    + alternatives,
+                )
+            ]
+            if i % conversion_every == 0:
+                requests.append(
+                    (
+                        "/convert",
+                        [("experiment", experiment), ("client_id", client_id)],
+                    )
+                )
+            for path, params in requests:
+                start = time.perf_counter()
+                async with session.get(url + path, params=params) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        errors[0] += 1
+                latencies.append(time.perf_counter() - start)
+            i += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, url)
+        # create the experiment outside of the measured window
+        async with session.get(
+            url + "/participate",
+            params=[("experiment", experiment), ("client_id", "warmup")]
+            + alternatives,
+        ) as resp:
+            await resp.read()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(session, n) for n in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--conversion-every", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--servers", nargs="+", default=["wsgi", "asgi"])
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    for kind in args.servers:
+        proc = start_server(kind, args.workers, args.port)
+        try:
+            result = asyncio.run(
+                load(
+                    "http://127.0.0.1:{0}".format(args.port),
+                    "bench-server-{0}-{1}".format(kind, run_id),
+                    args.concurrency,
+                    args.duration,
+                    args.conversion_every,
+                )
+            )
+        finally:
+            proc.terminate()
+            proc.wait()
+
+        print(
+            "{0:<5} {1:>9,.0f} req/s {2:>9,.0f} req/s/core "
+            "p50 {3:6.1f}ms p99 {4:6.1f}ms errors {5}".format(
+                kind,
+                result["rps"],
+                result["rps"] / args.workers,
+                result["p50"],
+                result["p99"],
+                result["errors"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
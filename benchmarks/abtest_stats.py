@@ -0,0 +1,105 @@
+"""Benchmark the vectorized abtest statistics against the per-alternative
+methods of ``Alternative``.
+
+Counts are synthetic, so no Redis is needed:
+
+    python benchmarks/abtest_stats.py --experiments 300 --alternatives 4 --periods 30
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from mlopskit.ext.abtest import stats
+from mlopskit.ext.abtest.models import Alternative, Experiment
+
+
+class CountedAlternative(Alternative):
+    """An alternative whose counts come from memory instead of Redis."""
+
+    def __init__(self, name, experiment, participants, conversions):
+        super(CountedAlternative, self).__init__(name, experiment)
+        self._participants = participants
+        self._conversions = conversions
+
+    def participant_count(self):
+        return self._participants
+
+    def completed_count(self):
+        return self._conversions
+
+
+def build_experiments(participants, conversions):
+    experiments = []
+    for row in range(participants.shape[0]):
+        exp = Experiment("bench-{0}".format(row), alternatives=[])
+        exp.alternatives = [
+            CountedAlternative(
+                "alt-{0}".format(col),
+                exp,
+                int(participants[row, col]),
+                int(conversions[row, col]),
+            )
+            for col in range(participants.shape[1])
+        ]
+        exp._winner = None
+        experiments.append(exp)
+    return experiments
+
+
+def scalar_pass(experiments):
+    for exp in experiments:
+        for alt in exp.alternatives:
+            alt.conversion_rate()
+            alt.z_score()
+            alt.g_stat()
+            alt.confidence_level()
+            alt.confidence_level("z")
+            alt.confidence_interval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--experiments", type=int, default=300)
+    parser.add_argument("--alternatives", type=int, default=4)
+    parser.add_argument("--periods", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = (args.experiments, args.alternatives, args.periods)
+    participants = rng.integers(0, 5000, size=shape)
+    conversions = rng.binomial(participants, rng.uniform(0.01, 0.2, size=shape))
+
+    # The scalar methods only know about totals, so time them per period
+    experiments = [
+        build_experiments(participants[:, :, p], conversions[:, :, p])
+        for p in range(args.periods)
+    ]
+
+    best_scalar = float("inf")
+    best_vector = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for period in experiments:
+            scalar_pass(period)
+        best_scalar = min(best_scalar, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        stats.analyze(participants, conversions)
+        best_vector = min(best_vector, time.perf_counter() - start)
+
+    cells = participants.size
+    print("experiments x alternatives x periods: {0}".format(shape))
+    print("per-alternative methods: {0:.4f}s".format(best_scalar))
+    print("vectorized analyze:      {0:.4f}s".format(best_vector))
+    print(
+        "cells/sec: {0:,.0f} vs {1:,.0f} ({2:.1f}x)".format(
+            cells / best_scalar, cells / best_vector, best_scalar / best_vector
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Batch lookup latency of the online feature store.
+
+Materializes one view of ``--entities`` entities with ``--features``
+features into a scratch database, then times ``get_online_features`` for
+batches of 1, 100 and 10k random entities:
+
+    python benchmarks/online_features.py
+    python benchmarks/online_features.py --entities 1000000 --features 50
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from mlopskit.ext.store.sqlite.online_features import OnlineStore
+
+
+def rows(entities, features):
+    for i in range(entities):
+        row = {"feature_{0}".format(j): random.random() for j in range(features)}
+        row["entity_id"] = "user-{0}".format(i)
+        yield row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entities", type=int, default=100000)
+    parser.add_argument("--features", type=int, default=20)
+    parser.add_argument("--requested", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    store = OnlineStore(os.path.join(tempfile.mkdtemp(), "online_features.db"))
+    start = time.perf_counter()
+    store.materialize("bench", rows(args.entities, args.features))
+    print(
+        "materialized {0:,} entities in {1:.2f}s".format(
+            args.entities, time.perf_counter() - start
+        )
+    )
+
+    features = ["bench:feature_{0}".format(j) for j in range(args.requested)]
+    for batch in (1, 100, 10000):
+        timings = []
+        for _ in range(args.repeat):
+            ids = [
+                "user-{0}".format(random.randrange(args.entities)) for _ in range(batch)
+            ]
+            start = time.perf_counter()
+            store.get_online_features(ids, features)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(
+            "{0:>6} entities  p50 {1:8.3f} ms  p99 {2:8.3f} ms".format(
+                batch,
+                statistics.median(timings),
+                timings[int(len(timings) * 0.99) - 1],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Multi-threaded reads and writes on one sfdb database.
+
+Fills a scratch ``sfdb.Database`` with ``--rows`` rows, then runs
+``--readers`` threads doing random ``get``, ``--writers`` threads doing
+random sets and one thread iterating over the whole database again and
+again, for ``--seconds`` seconds. Prints the throughput and the latency
+percentiles of each kind of operation:
+
+    python benchmarks/sfdb_concurrency.py
+    python benchmarks/sfdb_concurrency.py --readers 16 --writers 4 --rows 200000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from mlopskit.io import sfdb
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--no-scan", action="store_true")
+    args = parser.parse_args()
+
+    db = sfdb.Database(os.path.join(tempfile.mkdtemp(), "sfdb.db"))
+    for i in range(args.rows):
+        db["key-{0}".format(i)] = {"value": i, "payload": "x" * 64}
+    db.commit()
+
+    stop = threading.Event()
+    # one list of latencies per thread
+    runs = {"get": [], "set": [], "scan": []}
+    errors = {"get": 0, "set": 0, "scan": 0}
+
+    def timed(kind, out, operation):
+        start = time.perf_counter()
+        try:
+            operation()
+        except Exception:
+            # e.g. databases refusing access while another thread iterates
+            errors[kind] += 1
+            return
+        out.append(time.perf_counter() - start)
+
+    def reader(out):
+        while not stop.is_set():
+            key = "key-{0}".format(random.randrange(args.rows))
+            timed("get", out, lambda: db.get(key))
+
+    def writer(out):
+        while not stop.is_set():
+            key = "key-{0}".format(random.randrange(args.rows))
+            value = {"value": random.random(), "payload": "y" * 64}
+            timed("set", out, lambda: db.__setitem__(key, value))
+
+    def scanner(out):
+        while not stop.is_set():
+            timed("scan", out, lambda: sum(1 for _ in db))
+
+    threads = []
+    for kind, target, count in (
+        ("get", reader, args.readers),
+        ("set", writer, args.writers),
+        ("scan", scanner, 0 if args.no_scan else 1),
+    ):
+        for _ in range(count):
+            out = []
+            runs[kind].append(out)
+            threads.append(threading.Thread(target=target, args=(out,), daemon=True))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    db.close()
+
+    print(
+        "{0} readers, {1} writers, {2} scanner, {3:,} rows, {4:.0f}s".format(
+            args.readers,
+            args.writers,
+            0 if args.no_scan else 1,
+            args.rows,
+            args.seconds,
+        )
+    )
+    for kind in ("get", "set", "scan"):
+        values = [x for run in runs[kind] for x in run]
+        if not values:
+            continue
+        print(
+            "{0:>5}: {1:>10,.0f} ops/s  p50 {2:8.3f} ms  p99 {3:8.3f} ms"
+            "  {4:,} errors".format(
+                kind,
+                len(values) / args.seconds,
+                percentile(values, 0.50) * 1000,
+                percentile(values, 0.99) * 1000,
+                errors[kind],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
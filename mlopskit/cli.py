@@ -2,7 +2,7 @@ from pathlib import Path, PurePosixPath
 import os
 import sys
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import click
 import git
@@ -935,3 +935,126 @@ def list_local(profile):
 
     except Exception as e:
         click.echo(e)
+
+
+@mlopskit_cli.command("monitor_backfill", no_args_is_help=True)
+@click.option(
+    "--path",
+    help="Monitoring database (sqlite_logs.db) or a directory searched for them",
+    required=True,
+)
+def monitor_backfill(path):
+    """
+    Rebuild the hourly prediction aggregates of monitoring databases.
+    """
+    from mlopskit.ext.store.sqlite import prediction_stats
+
+    try:
+        if os.path.isdir(path):
+            db_files = [
+                os.path.join(root, "sqlite_logs.db")
+                for root, _, files in os.walk(path)
+                if "sqlite_logs.db" in files
+            ]
+        else:
+            db_files = [path]
+        for db_file in track(db_files, description="Backfilling..."):
+            count = prediction_stats.backfill(db_file)
+            click.echo(f"{db_file}: {count} predictions")
+
+    except Exception as e:
+        click.echo(e)
+
+
+@mlopskit_cli.command("monitor_partition", no_args_is_help=True)
+@click.option(
+    "--path",
+    help="Monitoring database (sqlite_logs.db) or a directory searched for them",
+    required=True,
+)
+@click.option(
+    "--period",
+    help="Partition period: ['day', 'week']",
+    default="day",
+    show_default=True,
+)
+@click.option("--retention-days", help="Drop partitions older than this", type=int)
+def monitor_partition(path, period, retention_days):
+    """
+    Partition monitoring databases by time and drop expired partitions.
+    """
+    import sqlite3
+    from mlopskit.ext.store.sqlite import prediction_partitions
+
+    try:
+        if os.path.isdir(path):
+            db_files = [
+                os.path.join(root, "sqlite_logs.db")
+                for root, _, files in os.walk(path)
+                if "sqlite_logs.db" in files
+            ]
+        else:
+            db_files = [path]
+        for db_file in track(db_files, description="Partitioning..."):
+            conn = sqlite3.connect(db_file, timeout=30)
+            try:
+                prediction_partitions.install(conn, period)
+                dropped = []
+                if retention_days is not None:
+                    before = datetime.utcnow() - timedelta(days=retention_days)
+                    dropped = prediction_partitions.drop_partitions(conn, before)
+                partitions = prediction_partitions.partitions(conn)
+            finally:
+                conn.close()
+            click.echo(
+                f"{db_file}: {len(partitions)} partitions, {len(dropped)} dropped"
+            )
+
+    except Exception as e:
+        click.echo(e)
+
+
+@mlopskit_cli.command("feature_materialize", no_args_is_help=True)
+@click.option(
+    "--config",
+    help="YAML job: spine, entity_key, timestamp_key, tables, output",
+    required=True,
+)
+@click.option("--chunk-rows", help="Rows per join bucket", type=int, default=1000000)
+def feature_materialize(config, chunk_rows):
+    """
+    Build a point-in-time correct training set from Parquet feature tables.
+
+    \b
+    spine: labels.parquet
+    entity_key: user_id
+    timestamp_key: label_ts
+    output: training.parquet
+    tables:
+      - name: user_stats
+        path: features/user_stats/
+        entity_key: user_id
+        timestamp_key: ts
+        features: [clicks_7d, orders_30d]
+        ttl: 2592000
+    """
+    from mlopskit.ext.store.parquet.point_in_time import FeatureTable, materialize
+
+    try:
+        job = YAMLDataSet(config).load()
+        start = time.time()
+        rows = materialize(
+            job["spine"],
+            [FeatureTable(**table) for table in job["tables"]],
+            job["output"],
+            entity_key=job.get("entity_key", "entity_id"),
+            timestamp_key=job.get("timestamp_key", "event_timestamp"),
+            chunk_rows=chunk_rows,
+            full_feature_names=job.get("full_feature_names", False),
+        )
+        click.echo(
+            f"{rows} rows written to {job['output']} in {time.time() - start:.1f}s"
+        )
+
+    except Exception as e:
+        click.echo(e)
@@ -0,0 +1,381 @@
+# -*- coding:utf-8 -*-
+"""asyncio flavour of the experiment operations used on the request path.
+
+``participate`` and ``convert`` mirror ``api.participate`` and ``api.convert``
+on a ``redis.asyncio`` client and run the same Lua scripts, so they can be
+awaited inside an ``AsyncModel._predict`` without blocking the event loop::
+
+    from mlopskit.ext.abtest import aio
+
+    class Ranker(AsyncModel):
+        async def _predict(self, item):
+            alt = await aio.participate("ranker", ["control", "v2"], item["uid"])
+            ...
+
+Experiments loaded here prefetch their settings and state in one round trip,
+so the ``traffic_fraction``, ``assignment`` and ``winner`` properties inherited
+from ``Experiment`` never touch redis. Only the participate/convert operations
+are asynchronous; reporting stays on ``models.Experiment``.
+"""
+
+from datetime import datetime
+import random
+
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+
+from .config import CONFIG as cfg
+from .db import _key
+from .models import Alternative, Client, Experiment, _is_deleting
+from .scripts import FIRST_KEY_WITH_BIT_SET, MONOTONIC_ZADD, MSETBIT
+
+_REDIS = None
+_SCRIPTS = {}
+
+
+def create_redis():
+    """A ``redis.asyncio`` client with its own pool, configured like ``db.REDIS``."""
+    if cfg.get("redis_sentinels"):
+        from redis.asyncio.sentinel import Sentinel
+
+        sentinel = Sentinel(
+            sentinels=cfg.get("redis_sentinels"),
+            password=cfg.get("redis_password", None),
+            socket_timeout=cfg.get("redis_socket_timeout"),
+        )
+        return sentinel.master_for(
+            cfg.get("redis_sentinel_service_name"),
+            db=cfg.get("redis_db"),
+            max_connections=cfg.get("redis_max_connections"),
+            decode_responses=True,
+        )
+
+    pool = aioredis.ConnectionPool(
+        host=cfg.get("redis_host"),
+        port=cfg.get("redis_port"),
+        password=cfg.get("redis_password", None),
+        db=cfg.get("redis_db"),
+        max_connections=cfg.get("redis_max_connections"),
+        decode_responses=True,
+    )
+    return aioredis.StrictRedis(connection_pool=pool)
+
+
+def get_redis():
+    """The process-wide async client, created on first use."""
+    global _REDIS
+    if _REDIS is None:
+        _REDIS = create_redis()
+    return _REDIS
+
+
+def _script(redis, source):
+    script = _SCRIPTS.get(source)
+    if script is None:
+        script = _SCRIPTS[source] = redis.register_script(source)
+    return script
+
+
+class AsyncExperiment(Experiment):
+    # refreshed by load()/find(), read instead of redis on the request path
+    _archived = False
+    _paused = False
+
+    def initialize_alternatives(self, alternatives):
+        for alternative_name in alternatives:
+            if not Alternative.is_valid(alternative_name):
+                raise ValueError("invalid alternative name")
+
+        return [AsyncAlternative(n, self, redis=self.redis) for n in alternatives]
+
+    def _apply(self, fields, winner):
+        if self._traffic_fraction is False:
+            try:
+                self._traffic_fraction = float(fields.get("traffic_fraction"))
+            except (TypeError, ValueError):
+                self._traffic_fraction = 1
+        if self._assignment is False:
+            self._assignment = fields.get("assignment") or "sticky"
+        if self._winner is False:
+            self._winner = winner
+        self._archived = "archived" in fields
+        self._paused = "paused" in fields
+        return self
+
+    async def load(self):
+        """Prefetch settings and state so the lazy properties stay off redis."""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(self.key())
+        pipe.get(self._winner_key)
+        fields, winner = await pipe.execute()
+        return self._apply(fields, winner)
+
+    async def save(self):
+        key = self.key()
+        async with self.redis.pipeline() as pipe:
+            try:
+                await pipe.watch(key)
+                is_new_record = not await self.redis.exists(key)
+                pipe.multi()
+                if is_new_record:
+                    pipe.sadd(_key("e"), self.name)
+                    pipe.hset(
+                        key, "created_at", datetime.now().strftime("%Y-%m-%d %H:%M")
+                    )
+                    # reverse here and use lpush to keep consistent with using lrange
+                    for alternative in reversed(self.alternatives):
+                        pipe.lpush("{0}:alternatives".format(key), alternative.name)
+                pipe.hset(key, "traffic_fraction", self._traffic_fraction)
+                if self._assignment:
+                    pipe.hset(key, "assignment", self._assignment)
+                await pipe.execute()
+            except WatchError:
+                # see Experiment.save
+                await self.redis.hset(key, "traffic_fraction", self._traffic_fraction)
+                if self._assignment:
+                    await self.redis.hset(key, "assignment", self._assignment)
+
+    async def is_archived(self):
+        return await self.redis.hexists(self.key(), "archived")
+
+    async def is_paused(self):
+        return await self.redis.hexists(self.key(), "paused")
+
+    async def add_kpi(self, kpi):
+        await self.redis.sadd("{0}:kpis".format(self.key(include_kpi=False)), kpi)
+        self.kpi = kpi
+
+    async def sequential_id(self, client):
+        """Return the sequential id for this test for the passed in client"""
+        if client.client_id not in self._sequential_ids:
+            key = _key("e:{0}:users".format(self.name))
+            id_ = await _script(self.redis, MONOTONIC_ZADD)(
+                keys=[key], args=[client.client_id], client=self.redis
+            )
+            self._sequential_ids[client.client_id] = int(id_)
+        return self._sequential_ids[client.client_id]
+
+    async def get_alternative(self, client, dt=None, prefetch=False):
+        """See ``Experiment.get_alternative``; archived/paused come from the
+        state prefetched by ``load``."""
+        if self._archived or self._paused:
+            return self.control
+
+        if await self.is_client_excluded(client):
+            return self.control
+
+        if self.assignment == "hash":
+            chosen_alternative = None
+        else:
+            chosen_alternative = await self.existing_alternative(client)
+        if not chosen_alternative:
+            chosen_alternative, participate = await self.choose_alternative(client)
+            if participate and not prefetch:
+                await chosen_alternative.record_participation(client, dt=dt)
+
+        return chosen_alternative
+
+    async def choose_alternative(self, client):
+        if self.assignment == "hash":
+            alternative, participate = self._hash_choice(client)
+            if not participate:
+                await self.exclude_client(client)
+            return alternative, participate
+
+        rnd = random.random()
+        if rnd >= self.traffic_fraction:
+            await self.exclude_client(client)
+            return self.control, False
+
+        return self._uniform_choice(client), True
+
+    async def exclude_client(self, client):
+        key = _key("e:{0}:excluded".format(self.name))
+        await self.redis.setbit(key, await self.sequential_id(client), 1)
+
+    async def is_client_excluded(self, client):
+        key = _key("e:{0}:excluded".format(self.name))
+        return await self.redis.getbit(key, await self.sequential_id(client))
+
+    async def existing_alternative(self, client):
+        if await self.is_client_excluded(client):
+            return None
+
+        alts = self.get_alternative_names()
+        keys = [_key("p:{0}:{1}:all".format(self.name, alt)) for alt in alts]
+        return await self._first_alternative_with_bit_set(client, alts, keys)
+
+    async def existing_conversion(self, client):
+        alts = self.get_alternative_names()
+        keys = [_key("c:{0}:{1}:users:all".format(self.kpi_key(), alt)) for alt in alts]
+        return await self._first_alternative_with_bit_set(client, alts, keys)
+
+    async def _first_alternative_with_bit_set(self, client, alts, keys):
+        altkey = await _script(self.redis, FIRST_KEY_WITH_BIT_SET)(
+            keys=keys, args=[await self.sequential_id(client)], client=self.redis
+        )
+        if altkey:
+            idx = keys.index(altkey)
+            return AsyncAlternative(alts[idx], self, redis=self.redis)
+
+        return None
+
+    async def convert(self, client, dt=None, kpi=None):
+        if self._archived:
+            raise ValueError("this experiment is archived and can no longer be updated")
+
+        if self._paused:
+            raise ValueError("this experiment is paused and can not receive updates.")
+
+        alternative = await self.existing_alternative(client)
+        if not alternative:
+            raise ValueError("this client was not participating")
+
+        if kpi is not None:
+            if not Experiment.validate_kpi(kpi):
+                raise ValueError("invalid kpi name")
+            await self.add_kpi(kpi)
+
+        if not await self.existing_conversion(client):
+            await alternative.record_conversion(client, dt=dt)
+
+        return alternative
+
+    @classmethod
+    async def find(cls, experiment_name, redis=None):
+        key = _key("e:{0}".format(experiment_name))
+        pipe = redis.pipeline(transaction=False)
+        pipe.sismember(_key("e"), experiment_name)
+        pipe.lrange("{0}:alternatives".format(key), 0, -1)
+        pipe.hgetall(key)
+        pipe.get("{0}:winner".format(key))
+        pipe.hget(_key("deletions"), experiment_name)
+        exists, alternatives, fields, winner, deletion = await pipe.execute()
+
+        if not exists:
+            if _is_deleting(deletion):
+                raise ValueError("this experiment is being deleted")
+            raise ValueError("experiment does not exist")
+
+        return cls(experiment_name, alternatives, redis=redis)._apply(fields, winner)
+
+    @classmethod
+    async def find_or_create(
+        cls,
+        experiment_name,
+        alternatives,
+        traffic_fraction=None,
+        redis=None,
+        assignment=None,
+    ):
+        """See ``Experiment.find_or_create``"""
+        if len(alternatives) < 2:
+            raise ValueError("experiments require at least two alternatives")
+
+        if traffic_fraction is None:
+            traffic_fraction = 1
+
+        is_update = False
+        try:
+            experiment = await cls.find(experiment_name, redis=redis)
+            is_update = True
+        except ValueError:
+            if _is_deleting(await redis.hget(_key("deletions"), experiment_name)):
+                raise
+            experiment = cls(experiment_name, alternatives, redis=redis)
+            experiment.set_traffic_fraction(traffic_fraction)
+            if assignment is not None:
+                experiment.set_assignment(assignment)
+            await experiment.save()
+            await experiment.load()
+
+        if is_update and experiment.traffic_fraction != traffic_fraction:
+            experiment.set_traffic_fraction(traffic_fraction)
+            await experiment.save()
+
+        if is_update and assignment is not None and experiment.assignment != assignment:
+            experiment.set_assignment(assignment)
+            await experiment.save()
+
+        if sorted(experiment.get_alternative_names()) != sorted(alternatives):
+            raise ValueError(
+                "experiment alternatives have changed. please delete in the admin"
+            )
+
+        return experiment
+
+
+class AsyncAlternative(Alternative):
+    async def record_participation(self, client, dt=None):
+        """Record a user's participation in a test along with a given variation"""
+        date = datetime.now() if dt is None else dt
+        sequential_id = await self.experiment.sequential_id(client)
+        await self._record(sequential_id, *self._participation_keys(date))
+
+    async def record_conversion(self, client, dt=None):
+        """Record a user's conversion in a test along with a given variation"""
+        date = datetime.now() if dt is None else dt
+        sequential_id = await self.experiment.sequential_id(client)
+        await self._record(sequential_id, *self._conversion_keys(date))
+
+    async def _record(self, sequential_id, periods, keys):
+        async with self.redis.pipeline() as pipe:
+            for key, period in periods:
+                pipe.sadd(key, period)
+            await _script(self.redis, MSETBIT)(
+                keys=keys, args=([sequential_id, 1] * len(keys)), client=pipe
+            )
+            await pipe.execute()
+
+
+async def participate(
+    experiment,
+    alternatives,
+    client_id,
+    force=None,
+    record_force=False,
+    traffic_fraction=None,
+    prefetch=False,
+    datetime=None,
+    redis=None,
+    assignment=None,
+):
+    redis = redis or get_redis()
+    exp = await AsyncExperiment.find_or_create(
+        experiment,
+        alternatives,
+        traffic_fraction=traffic_fraction,
+        redis=redis,
+        assignment=assignment,
+    )
+
+    alt = None
+    if force and force in alternatives:
+        alt = AsyncAlternative(force, exp, redis=redis)
+
+        if record_force:
+            client = Client(client_id, redis=redis)
+            await alt.record_participation(client, datetime)
+
+    elif not cfg.get("enabled", True):
+        alt = exp.control
+    elif exp.winner is not None:
+        alt = exp.winner
+    else:
+        client = Client(client_id, redis=redis)
+        alt = await exp.get_alternative(client, dt=datetime, prefetch=prefetch)
+
+    return alt
+
+
+async def convert(experiment, client_id, kpi=None, datetime=None, redis=None):
+    redis = redis or get_redis()
+    exp = await AsyncExperiment.find(experiment, redis=redis)
+
+    if cfg.get("enabled", True):
+        client = Client(client_id, redis=redis)
+        alt = await exp.convert(client, dt=datetime, kpi=kpi)
+    else:
+        alt = exp.control
+
+    return alt
@@ -12,10 +12,15 @@ def participate(
     prefetch=False,
     datetime=None,
     redis=None,
+    assignment=None,
 ):
 
     exp = Experiment.find_or_create(
-        experiment, alternatives, traffic_fraction=traffic_fraction, redis=redis
+        experiment,
+        alternatives,
+        traffic_fraction=traffic_fraction,
+        redis=redis,
+        assignment=assignment,
     )
 
     alt = None
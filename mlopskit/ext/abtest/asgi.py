@@ -0,0 +1,275 @@
+"""ASGI flavour of ``server.Sixpack``.
+
+Serves the same ``/participate``, ``/convert`` and ``/_status`` contract (and
+the same JSON bodies) on the ``redis.asyncio`` client from ``aio``, so a
+single worker keeps many requests in flight on one connection pool instead of
+blocking on every redis round trip. Experiment reports are not served here;
+they stay on the synchronous models. Run it with any ASGI server::
+
+    uvicorn mlopskit.ext.abtest.asgi:app --workers 4
+"""
+
+from contextlib import asynccontextmanager
+import json
+import re
+
+import dateutil.parser
+from redis import ConnectionError
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.routing import Route
+
+from . import aio
+from .config import CONFIG as cfg
+from .metrics import init_statsd
+from .server import is_ignored_ip, is_robot
+from .utils import to_bool
+from .version import __version__
+
+
+def json_error(resp, request, status=None):
+    resp = dict(list({"status": "failed"}.items()) + list(resp.items()))
+    return _json_resp(resp, request, status)
+
+
+def json_success(resp, request):
+    resp = dict(list({"status": "ok"}.items()) + list(resp.items()))
+    return _json_resp(resp, request, 200)
+
+
+def _json_resp(in_dict, request, status=None):
+    media_type = "application/json"
+    data = json.dumps(in_dict)
+    callback = request and request.query_params.get("callback")
+    if callback and re.match(r"^\w[\w'\-\.]*$", callback):
+        media_type = "application/javascript"
+        data = "%s(%s)" % (callback, data)
+
+    return Response(data, status_code=status, media_type=media_type)
+
+
+def service_unavailable_on_connection_error(f):
+    async def wrapper(self, request):
+        try:
+            return await f(self, request)
+        except ConnectionError:
+            return json_error({"message": "redis is not available"}, None, 503)
+
+    wrapper.__name__ = f.__name__
+    return wrapper
+
+
+class CORSMiddleware(object):
+    """Add Cross-origin resource sharing headers to every request."""
+
+    def __init__(self, app, origin=None):
+        self.app = app
+        self.origin = origin or cfg.get("cors_origin")
+        self.origin_regexp = None
+        if self.origin is not None and self.origin != "*":
+            self.origin_regexp = re.compile(self.origin.replace("*", "(.*)"))
+
+    def get_origin(self, scope):
+        if self.origin == "*" or self.origin is None:
+            return self.origin
+        origin = dict(scope["headers"]).get(b"origin", b"").decode("latin-1")
+        return origin if self.origin_regexp.match(origin) else "null"
+
+    def cors_headers(self, scope):
+        headers = [
+            ("Access-Control-Allow-Origin", self.get_origin(scope)),
+            ("Access-Control-Allow-Headers", cfg.get("cors_headers")),
+            ("Access-Control-Allow-Credentials", cfg.get("cors_credentials")),
+            ("Access-Control-Allow-Methods", cfg.get("cors_methods")),
+            ("Access-Control-Expose-Headers", cfg.get("cors_expose_headers")),
+        ]
+        return [
+            (name.lower().encode("latin-1"), str(value).encode("latin-1"))
+            for name, value in headers
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if scope["method"] == "OPTIONS":
+            response = Response("200 Ok", media_type="text/plain")
+            response.raw_headers.extend(self.cors_headers(scope))
+            return await response(scope, receive, send)
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", []))
+                message["headers"].extend(self.cors_headers(scope))
+            await send(message)
+
+        return await self.app(scope, receive, send_with_cors)
+
+
+class AsyncSixpack(object):
+    def __init__(self, redis_conn):
+        self.redis = redis_conn
+        self.statsd = init_statsd(cfg) if cfg.get("metrics") else None
+
+        self.config = cfg
+
+        routes = [
+            Route("/", self.dispatch("home")),
+            Route("/_status", self.dispatch("status")),
+            Route("/participate", self.dispatch("participate")),
+            Route("/convert", self.dispatch("convert")),
+            Route("/favicon.ico", self.dispatch("favicon")),
+        ]
+        self.app = Starlette(
+            routes=routes,
+            exception_handlers={HTTPException: self.on_http_exception},
+            lifespan=self.lifespan,
+        )
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+    def dispatch(self, endpoint):
+        handler = getattr(self, "on_" + endpoint)
+        if not self.config.get("metrics"):
+            return handler
+
+        async def dispatch_with_metrics(request):
+            with self.statsd.timer("{}.response_time".format(endpoint)):
+                response = await handler(request)
+                self.statsd.incr("{}.count".format(endpoint))
+                self._incr_status_code(response.status_code)
+                return response
+
+        return dispatch_with_metrics
+
+    def _incr_status_code(self, code):
+        self.statsd.incr("response_code.{}".format(code))
+
+    async def on_http_exception(self, request, exc):
+        if self.statsd is not None:
+            self._incr_status_code(404 if exc.status_code == 404 else 500)
+        if exc.status_code == 404:
+            return json_error({"message": "not found"}, request, 404)
+        return json_error({"message": "an internal error has occurred"}, request, 500)
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        yield
+        await self.redis.connection_pool.disconnect()
+
+    @service_unavailable_on_connection_error
+    async def on_status(self, request):
+        await self.redis.ping()
+        return json_success({"version": __version__}, request)
+
+    async def on_home(self, request):
+        return Response("https://github.com/leepand/algolink")
+
+    async def on_favicon(self, request):
+        return Response()
+
+    @service_unavailable_on_connection_error
+    async def on_convert(self, request):
+        args = request.query_params
+        if should_exclude_visitor(request):
+            return json_success({"excluded": "true"}, request)
+
+        experiment_name = args.get("experiment")
+        client_id = args.get("client_id")
+        kpi = args.get("kpi", None)
+
+        if client_id is None or experiment_name is None:
+            return json_error({"message": "missing arguments"}, request, 400)
+
+        dt = None
+        if args.get("datetime"):
+            dt = dateutil.parser.parse(args.get("datetime"))
+
+        try:
+            alt = await aio.convert(
+                experiment_name, client_id, kpi=kpi, datetime=dt, redis=self.redis
+            )
+        except ValueError as e:
+            return json_error({"message": str(e)}, request, 400)
+
+        resp = {
+            "alternative": {"name": alt.name},
+            "experiment": {
+                "name": alt.experiment.name,
+            },
+            "conversion": {"value": None, "kpi": kpi},
+            "request_id": client_id,
+        }
+
+        return json_success(resp, request)
+
+    @service_unavailable_on_connection_error
+    async def on_participate(self, request):
+        args = request.query_params
+        alts = args.getlist("alternatives")
+        experiment_name = args.get("experiment")
+        force = args.get("force")
+        record_force = to_bool(args.get("record_force", "false"))
+        client_id = args.get("client_id")
+        traffic_fraction = args.get("traffic_fraction")
+
+        if traffic_fraction is not None:
+            traffic_fraction = float(traffic_fraction)
+        prefetch = to_bool(args.get("prefetch", "false"))
+
+        if client_id is None or experiment_name is None or alts is None:
+            return json_error({"message": "missing arguments"}, request, 400)
+
+        dt = None
+        if args.get("datetime"):
+            dt = dateutil.parser.parse(args.get("datetime"))
+        try:
+            if should_exclude_visitor(request):
+                exp = await aio.AsyncExperiment.find(experiment_name, redis=self.redis)
+                if exp.winner is not None:
+                    alt = exp.winner
+                else:
+                    alt = exp.control
+            else:
+                alt = await aio.participate(
+                    experiment_name,
+                    alts,
+                    client_id,
+                    force=force,
+                    record_force=record_force,
+                    traffic_fraction=traffic_fraction,
+                    prefetch=prefetch,
+                    datetime=dt,
+                    redis=self.redis,
+                )
+        except ValueError as e:
+            return json_error({"message": str(e)}, request, 400)
+
+        resp = {
+            "alternative": {"name": alt.name},
+            "experiment": {
+                "name": alt.experiment.name,
+            },
+            "request_id": client_id,
+            "status": "ok",
+        }
+
+        return json_success(resp, request)
+
+
+def should_exclude_visitor(request):
+    user_agent = request.query_params.get("user_agent")
+    ip_address = request.query_params.get("ip_address")
+
+    return is_robot(user_agent) or is_ignored_ip(ip_address)
+
+
+def create_app(redis_conn=None):
+    app = AsyncSixpack(redis_conn or aio.create_redis())
+    return CORSMiddleware(app)
+
+
+#  Application to run with uvicorn / gunicorn's UvicornWorker
+app = create_app()
@@ -0,0 +1,562 @@
+# -*- coding:utf-8 -*-
+"""In-process backend for abtest.
+
+``db.REDIS`` and the ``redis`` argument taken throughout ``models`` can be any
+object exposing the subset of the ``redis.StrictRedis`` API used by abtest.
+``MemoryRedis`` implements that subset (keys, strings, bitmaps, hashes, sets,
+lists, sorted sets, pipelines and the scripts in ``scripts``) inside the
+current process, optionally snapshotting its data to a local file. It answers
+like a client created with ``decode_responses=True``.
+
+Select it with ``backend: memory`` (and optionally ``backend_path``) in the
+sixpack config, or pass an instance as ``redis`` directly.
+"""
+
+import atexit
+import bisect
+from collections import OrderedDict
+import copy
+import fnmatch
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from redis.client import Pipeline
+from redis.exceptions import NoScriptError, ResponseError, WatchError
+
+from .scripts import (
+    BITS_SET_IN_RANGE,
+    FIRST_KEY_WITH_BIT_SET,
+    MONOTONIC_ZADD,
+    MSETBIT,
+)
+
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+# Abandoned scans are forgotten once this many cursors are outstanding
+MAX_CURSORS = 1024
+
+
+def _sha(script):
+    if isinstance(script, str):
+        script = script.encode("utf-8")
+    return hashlib.sha1(script).hexdigest()
+
+
+def _str(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _range(length, start, end):
+    """Translate an inclusive redis range, negative indexes included."""
+    if start < 0:
+        start = max(length + start, 0)
+    if end < 0:
+        end = length + end
+    return start, min(end, length - 1) + 1
+
+
+class _ZSet(dict):
+    """Sorted set stored as a member -> score mapping."""
+
+
+class MemoryScript(object):
+    """Drop-in for ``redis.commands.core.Script`` on a ``MemoryRedis``."""
+
+    def __init__(self, registered_client, script):
+        self.registered_client = registered_client
+        self.script = script
+        self.sha = _sha(script)
+
+    def __call__(self, keys=None, args=None, client=None):
+        keys = keys or []
+        args = args or []
+        if client is None:
+            client = self.registered_client
+        args = tuple(keys) + tuple(args)
+        if isinstance(client, Pipeline):
+            # a redis pipeline loads its scripts before executing
+            client.scripts.add(self)
+        try:
+            return client.evalsha(self.sha, len(keys), *args)
+        except NoScriptError:
+            # a redis server that has not seen the script yet, as in Script
+            self.sha = client.script_load(self.script)
+            return client.evalsha(self.sha, len(keys), *args)
+
+
+class MemoryPipeline(object):
+    """Queues commands and runs them atomically under the backend lock.
+
+    Mirrors redis-py: after ``watch`` commands run immediately until
+    ``multi`` is called, and ``execute`` raises ``WatchError`` if a watched
+    key was written in the meantime.
+    """
+
+    def __init__(self, backend, transaction=True):
+        self.backend = backend
+        self.transaction = transaction
+        self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def __len__(self):
+        return len(self._commands)
+
+    def reset(self):
+        self._commands = []
+        self._watched = {}
+        self._explicit_transaction = False
+
+    def watch(self, *names):
+        with self.backend._lock:
+            for name in names:
+                self._watched[name] = self.backend._versions.get(name)
+
+    def unwatch(self):
+        self._watched = {}
+
+    def multi(self):
+        self._explicit_transaction = True
+
+    def execute(self, raise_on_error=True):
+        backend = self.backend
+        commands = self._commands
+        with backend._lock:
+            try:
+                for name, version in self._watched.items():
+                    if backend._versions.get(name) != version:
+                        raise WatchError("Watched variable changed.")
+
+                results = []
+                for name, args, kwargs in commands:
+                    try:
+                        results.append(getattr(backend, name)(*args, **kwargs))
+                    except ResponseError as e:
+                        if raise_on_error:
+                            raise
+                        results.append(e)
+            finally:
+                self.reset()
+        return results
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        if self._watched and not self._explicit_transaction:
+            return method
+
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+
+class MemoryRedis(object):
+    def __init__(self, path=None, save_interval=None):
+        self.path = path
+        self.save_interval = save_interval
+        self._data = {}
+        self._versions = {}
+        self._clock = 0
+        self._cursors = OrderedDict()
+        self._cursor_id = 0
+        self._lock = threading.RLock()
+        self._last_save = time.time()
+        self._saving = False
+        self._scripts = {
+            _sha(MONOTONIC_ZADD): self._monotonic_zadd,
+            _sha(MSETBIT): self._msetbit,
+            _sha(FIRST_KEY_WITH_BIT_SET): self._first_key_with_bit_set,
+            _sha(BITS_SET_IN_RANGE): self._bits_set_in_range,
+        }
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def __repr__(self):
+        return "<MemoryRedis path={0!r}>".format(self.path)
+
+    # persistence
+
+    def load(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    self._data = pickle.load(f)
+            self._last_save = time.time()
+
+    def save(self):
+        if not self.path:
+            return False
+        with self._lock:
+            # copy under the lock, pickle outside it
+            data = {name: copy.copy(value) for name, value in self._data.items()}
+            self._last_save = time.time()
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sixpack-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+        return True
+
+    def _touch(self, name):
+        self._clock += 1
+        self._versions[name] = self._clock
+        if (
+            self.path
+            and self.save_interval is not None
+            and time.time() - self._last_save >= self.save_interval
+            and not self._saving
+        ):
+            # the caller holds the lock: save from another thread
+            self._saving = True
+            self._last_save = time.time()
+            threading.Thread(
+                target=self._save_in_background, name="sixpack-memory-save", daemon=True
+            ).start()
+
+    def _save_in_background(self):
+        try:
+            self.save()
+        finally:
+            self._saving = False
+
+    def _get(self, name, kind):
+        value = self._data.get(name)
+        if value is not None and type(value) is not kind:
+            raise ResponseError(WRONGTYPE)
+        return value
+
+    def _get_or_create(self, name, kind):
+        value = self._get(name, kind)
+        if value is None:
+            value = self._data[name] = kind()
+        return value
+
+    def _drop_if_empty(self, name):
+        if not self._data.get(name):
+            self._data.pop(name, None)
+
+    # connection and keys
+
+    def ping(self):
+        return True
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return MemoryPipeline(self, transaction=transaction)
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if name in self._data)
+
+    def delete(self, *names):
+        with self._lock:
+            deleted = 0
+            for name in names:
+                if self._data.pop(name, None) is not None:
+                    deleted += 1
+                    self._touch(name)
+            return deleted
+
+    unlink = delete
+
+    def type(self, name):
+        with self._lock:
+            value = self._data.get(name)
+        if value is None:
+            return "none"
+        return {
+            bytearray: "string",
+            dict: "hash",
+            set: "set",
+            list: "list",
+            _ZSet: "zset",
+        }[type(value)]
+
+    def keys(self, pattern="*"):
+        with self._lock:
+            names = list(self._data)
+        return [name for name in names if fnmatch.fnmatchcase(name, pattern)]
+
+    def scan(self, cursor=0, match=None, count=None):
+        # Cursors remember the last key returned rather than a position, so
+        # keys deleted while scanning never cause others to be skipped.
+        with self._lock:
+            names = sorted(self._data)
+            start = 0
+            if int(cursor):
+                start = bisect.bisect_right(names, self._cursors.pop(int(cursor), ""))
+            batch = names[start : start + (count or 10)]
+            next_cursor = 0
+            if start + len(batch) < len(names):
+                self._cursor_id += 1
+                next_cursor = self._cursor_id
+                self._cursors[next_cursor] = batch[-1]
+                while len(self._cursors) > MAX_CURSORS:
+                    self._cursors.popitem(last=False)
+
+        if match is not None:
+            batch = [name for name in batch if fnmatch.fnmatchcase(name, match)]
+        return next_cursor, batch
+
+    def scan_iter(self, match=None, count=None):
+        cursor = None
+        while cursor != 0:
+            cursor, names = self.scan(cursor or 0, match=match, count=count)
+            for name in names:
+                yield name
+
+    def flushdb(self):
+        with self._lock:
+            for name in list(self._data):
+                self._touch(name)
+            self._data.clear()
+        return True
+
+    # strings and bitmaps
+
+    def get(self, name):
+        with self._lock:
+            value = self._get(name, bytearray)
+            return None if value is None else bytes(value).decode("utf-8")
+
+    def set(self, name, value):
+        with self._lock:
+            self._data.pop(name, None)
+            self._data[name] = bytearray(_str(value).encode("utf-8"))
+            self._touch(name)
+        return True
+
+    def setbit(self, name, offset, value):
+        offset = int(offset)
+        byte, bit = offset >> 3, 7 - (offset & 7)
+        with self._lock:
+            bitmap = self._get_or_create(name, bytearray)
+            if len(bitmap) <= byte:
+                bitmap.extend(bytes(byte + 1 - len(bitmap)))
+            old = (bitmap[byte] >> bit) & 1
+            if int(value):
+                bitmap[byte] |= 1 << bit
+            else:
+                bitmap[byte] &= ~(1 << bit) & 0xFF
+            self._touch(name)
+        return old
+
+    def getbit(self, name, offset):
+        offset = int(offset)
+        byte, bit = offset >> 3, 7 - (offset & 7)
+        with self._lock:
+            bitmap = self._get(name, bytearray)
+            if bitmap is None or len(bitmap) <= byte:
+                return 0
+            return (bitmap[byte] >> bit) & 1
+
+    def bitcount(self, name, start=None, end=None):
+        with self._lock:
+            bitmap = self._get(name, bytearray)
+            if bitmap is None:
+                return 0
+            if start is not None and end is not None:
+                start, end = _range(len(bitmap), int(start), int(end))
+                bitmap = bitmap[start:end]
+            return bin(int.from_bytes(bytes(bitmap), "big")).count("1")
+
+    # hashes
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        with self._lock:
+            fields = self._get_or_create(name, dict)
+            added = sum(1 for k in items if _str(k) not in fields)
+            for k, v in items.items():
+                fields[_str(k)] = _str(v)
+            self._touch(name)
+        return added
+
+    def hget(self, name, key):
+        with self._lock:
+            return (self._get(name, dict) or {}).get(_str(key))
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._get(name, dict) or {})
+
+    def hexists(self, name, key):
+        with self._lock:
+            return _str(key) in (self._get(name, dict) or {})
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            fields = self._get(name, dict)
+            if fields is None:
+                return 0
+            deleted = sum(1 for k in keys if fields.pop(_str(k), None) is not None)
+            self._drop_if_empty(name)
+            self._touch(name)
+        return deleted
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            fields = self._get_or_create(name, dict)
+            value = int(fields.get(_str(key), 0)) + int(amount)
+            fields[_str(key)] = str(value)
+            self._touch(name)
+        return value
+
+    # sets
+
+    def sadd(self, name, *values):
+        with self._lock:
+            members = self._get_or_create(name, set)
+            before = len(members)
+            members.update(_str(v) for v in values)
+            self._touch(name)
+            return len(members) - before
+
+    def srem(self, name, *values):
+        with self._lock:
+            members = self._get(name, set)
+            if members is None:
+                return 0
+            before = len(members)
+            members.difference_update(_str(v) for v in values)
+            self._drop_if_empty(name)
+            self._touch(name)
+            return before - len(members)
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self._get(name, set) or ())
+
+    def sismember(self, name, value):
+        with self._lock:
+            return _str(value) in (self._get(name, set) or ())
+
+    def scard(self, name):
+        with self._lock:
+            return len(self._get(name, set) or ())
+
+    # lists
+
+    def lpush(self, name, *values):
+        with self._lock:
+            items = self._get_or_create(name, list)
+            for value in values:
+                items.insert(0, _str(value))
+            self._touch(name)
+            return len(items)
+
+    def rpush(self, name, *values):
+        with self._lock:
+            items = self._get_or_create(name, list)
+            items.extend(_str(v) for v in values)
+            self._touch(name)
+            return len(items)
+
+    def lrange(self, name, start, end):
+        with self._lock:
+            items = self._get(name, list) or []
+            start, end = _range(len(items), int(start), int(end))
+            return items[start:end]
+
+    def llen(self, name):
+        with self._lock:
+            return len(self._get(name, list) or [])
+
+    # sorted sets
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            members = self._get_or_create(name, _ZSet)
+            added = sum(1 for m in mapping if _str(m) not in members)
+            for member, score in mapping.items():
+                members[_str(member)] = float(score)
+            self._touch(name)
+            return added
+
+    def zscore(self, name, value):
+        with self._lock:
+            return (self._get(name, _ZSet) or {}).get(_str(value))
+
+    def zcard(self, name):
+        with self._lock:
+            return len(self._get(name, _ZSet) or {})
+
+    def zrange(self, name, start, end, withscores=False):
+        with self._lock:
+            members = sorted(
+                (self._get(name, _ZSet) or {}).items(), key=lambda i: (i[1], i[0])
+            )
+        start, end = _range(len(members), int(start), int(end))
+        members = members[start:end]
+        return members if withscores else [member for member, _ in members]
+
+    # scripts
+
+    def register_script(self, script):
+        return MemoryScript(self, script)
+
+    def script_load(self, script):
+        sha = _sha(script)
+        if sha not in self._scripts:
+            raise ResponseError("script is not supported by the in-process backend")
+        return sha
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        if sha not in self._scripts:
+            raise NoScriptError("No matching script. Please use EVAL.")
+        keys = list(keys_and_args[:numkeys])
+        args = list(keys_and_args[numkeys:])
+        with self._lock:
+            return self._scripts[sha](keys, args)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        return self.evalsha(self.script_load(script), numkeys, *keys_and_args)
+
+    def _monotonic_zadd(self, keys, args):
+        score = self.zscore(keys[0], args[0])
+        if score is None:
+            score = self.zcard(keys[0])
+            self.zadd(keys[0], {args[0]: score})
+        return int(score)
+
+    def _msetbit(self, keys, args):
+        for index, key in enumerate(keys):
+            self.setbit(key, args[index * 2], args[index * 2 + 1])
+        return "ok"
+
+    def _first_key_with_bit_set(self, keys, args):
+        for key in keys:
+            if self.getbit(key, args[0]) == 1:
+                return key
+        return None
+
+    def _bits_set_in_range(self, keys, args):
+        first, last = int(args[0]), int(args[1])
+        offsets = []
+        for key in keys:
+            bitmap = self._get(key, bytearray) or bytearray()
+            found = []
+            for index, byte in enumerate(bitmap[first : last + 1], first):
+                for bit in range(8):
+                    if byte & (0x80 >> bit):
+                        found.append(index * 8 + bit)
+            offsets.append(found)
+        return offsets
@@ -26,6 +26,11 @@ if config_path:
 else:
     CONFIG = {
         "enabled": to_bool(os.environ.get("SIXPACK_CONFIG_ENABLED", "True")),
+        "backend": os.environ.get("SIXPACK_CONFIG_BACKEND", "redis"),
+        "backend_path": os.environ.get("SIXPACK_CONFIG_BACKEND_PATH", None),
+        "backend_save_interval": float(
+            os.environ.get("SIXPACK_CONFIG_BACKEND_SAVE_INTERVAL", "1")
+        ),
         "redis_port": int(os.environ.get("SIXPACK_CONFIG_REDIS_PORT", REDIS_PORT)),
         "redis_host": os.environ.get("SIXPACK_CONFIG_REDIS_HOST", REDIS_HOST),
         "redis_password": os.environ.get("SIXPACK_CONFIG_REDIS_PASSWORD", None),
@@ -2,11 +2,25 @@ import redis
 from redis.connection import PythonParser
 
 from .config import CONFIG as cfg
+from .scripts import (
+    BITS_SET_IN_RANGE,
+    FIRST_KEY_WITH_BIT_SET,
+    MONOTONIC_ZADD,
+    MSETBIT,
+)
 
 # Because of a bug (https://github.com/andymccurdy/redis-py/issues/318) with
 # script reloading in `redis-py, we need to force the `PythonParser` to prevent
 # sixpack from crashing if redis restarts (or scripts are flushed).
-if cfg.get("redis_sentinels"):
+if cfg.get("backend", "redis") == "memory":
+    # The in-process backend needs neither a connection pool nor a parser.
+    from .backends import MemoryRedis
+
+    REDIS = MemoryRedis(
+        path=cfg.get("backend_path"),
+        save_interval=cfg.get("backend_save_interval"),
+    )
+elif cfg.get("redis_sentinels"):
     from redis.sentinel import Sentinel, SentinelConnectionPool
 
     service_name = cfg.get("redis_sentinel_service_name")
@@ -22,6 +36,7 @@ if cfg.get("redis_sentinels"):
         max_connections=cfg.get("redis_max_connections"),
         parser_class=PythonParser,
     )
+    REDIS = redis.StrictRedis(connection_pool=pool)
 else:
     from redis.connection import ConnectionPool
 
@@ -34,8 +49,8 @@ else:
         parser_class=PythonParser,
         decode_responses=True,
     )
+    REDIS = redis.StrictRedis(connection_pool=pool)
 
-REDIS = redis.StrictRedis(connection_pool=pool)
 DEFAULT_PREFIX = cfg.get("redis_prefix")
 
 
@@ -43,42 +58,19 @@ def _key(k):
     return "{0}:{1}".format(DEFAULT_PREFIX, k)
 
 
-monotonic_zadd = REDIS.register_script(
-    """
-    local sequential_id = redis.call('zscore', KEYS[1], ARGV[1])
-    if not sequential_id then
-        sequential_id = redis.call('zcard', KEYS[1])
-        redis.call('zadd', KEYS[1], sequential_id, ARGV[1])
-    end
-    return sequential_id
-"""
-)
+monotonic_zadd = REDIS.register_script(MONOTONIC_ZADD)
 
 
-def sequential_id(k, identifier):
+def sequential_id(k, identifier, redis=None):
     """Map an arbitrary string identifier to a set of sequential ids"""
     key = _key(k)
-    return int(monotonic_zadd(keys=[key], args=[identifier]))
+    return int(monotonic_zadd(keys=[key], args=[identifier], client=redis))
 
 
-msetbit = REDIS.register_script(
-    """
-    for index, value in ipairs(KEYS) do
-        redis.call('setbit', value, ARGV[(index - 1) * 2 + 1], ARGV[(index - 1) * 2 + 2])
-    end
-    return redis.status_reply('ok')
-"""
-)
+msetbit = REDIS.register_script(MSETBIT)
 
 
-first_key_with_bit_set = REDIS.register_script(
-    """
-    for index, value in ipairs(KEYS) do
-        local bit = redis.call('getbit', value, ARGV[1])
-        if bit == 1 then
-             return value
-        end
-    end
-    return false
-"""
-)
+first_key_with_bit_set = REDIS.register_script(FIRST_KEY_WITH_BIT_SET)
+
+
+bits_set_in_range = REDIS.register_script(BITS_SET_IN_RANGE)
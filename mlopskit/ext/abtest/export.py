@@ -0,0 +1,142 @@
+# -*- coding:utf-8 -*-
+"""Streaming export of the clients of an experiment.
+
+Clients are walked in blocks of ``chunk_size`` sequential ids. Each block is
+one pipelined round trip: a ``ZRANGE`` slice of the ``users`` sorted set and a
+``GETRANGE`` of the matching bytes of every participation, conversion and
+exclusion bitmap (done server side by ``BITS_SET_IN_RANGE``, which only sends
+back the offsets that are set). Memory therefore stays bounded by
+``chunk_size`` whatever the size of the experiment::
+
+    exp = Experiment.find("checkout", redis=db.REDIS)
+    with open("checkout.csv", "w") as f:
+        for chunk in export(exp, format="csv"):
+            f.write(chunk)
+"""
+
+import csv
+import io
+import json
+
+from .db import _key, bits_set_in_range
+
+CHUNK_SIZE = 8192
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def columns(experiment):
+    """Column names of the rows yielded by ``iter_rows``."""
+    return ["client_id", "alternative", "excluded"] + [
+        _conversion_column(kpi) for kpi in _kpis(experiment)
+    ]
+
+
+def iter_rows(experiment, chunk_size=CHUNK_SIZE):
+    """Yield one dict per participating or excluded client of ``experiment``.
+
+    ``alternative`` is empty for excluded clients; there is one
+    ``converted`` column for the default kpi and one ``converted:<kpi>``
+    column per named kpi.
+    """
+    if experiment.is_compacted():
+        raise ValueError("this experiment is compacted, client data was removed")
+
+    # keep whole bytes per block so no bitmap byte is read twice
+    chunk_size = max(8, chunk_size - chunk_size % 8)
+
+    redis = experiment.redis
+    alternatives = experiment.get_alternative_names()
+    kpis = _kpis(experiment)
+    names = [_conversion_column(kpi) for kpi in kpis]
+
+    keys = [_key("e:{0}:excluded".format(experiment.name))]
+    keys += [_key("p:{0}:{1}:all".format(experiment.name, alt)) for alt in alternatives]
+    for kpi in kpis:
+        kpi_key = (
+            experiment.name if kpi is None else "{0}/{1}".format(experiment.name, kpi)
+        )
+        keys += [
+            _key("c:{0}:{1}:users:all".format(kpi_key, alt)) for alt in alternatives
+        ]
+
+    users_key = _key("e:{0}:users".format(experiment.name))
+    start = 0
+    while True:
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrange(users_key, start, start + chunk_size - 1, withscores=True)
+        bits_set_in_range(
+            keys=keys,
+            args=[start // 8, (start + chunk_size) // 8 - 1],
+            client=pipe,
+        )
+        users, offsets = pipe.execute()
+        if not users:
+            return
+
+        excluded = set(offsets[0])
+        participations = offsets[1 : 1 + len(alternatives)]
+        conversions = [
+            set().union(*offsets[idx : idx + len(alternatives)])
+            for idx in range(1 + len(alternatives), len(keys), len(alternatives))
+        ]
+
+        assigned = {}
+        for alt, ids in zip(alternatives, participations):
+            for sequential_id in ids:
+                assigned.setdefault(sequential_id, alt)
+
+        for client_id, sequential_id in users:
+            sequential_id = int(sequential_id)
+            alt = assigned.get(sequential_id)
+            is_excluded = sequential_id in excluded
+            if alt is None and not is_excluded:
+                continue
+
+            row = {
+                "client_id": client_id,
+                "alternative": alt or "",
+                "excluded": is_excluded,
+            }
+            for name, converted in zip(names, conversions):
+                row[name] = sequential_id in converted
+            yield row
+
+        start += chunk_size
+
+
+def export(experiment, format="csv", chunk_size=CHUNK_SIZE):
+    """Yield ``experiment`` as CSV (with a header line) or NDJSON text, one
+    string per block of rows."""
+    if format not in FORMATS:
+        raise ValueError("unsupported export format: {0}".format(format))
+
+    fields = columns(experiment)
+    buf = io.StringIO()
+    if format == "csv":
+        writer = csv.DictWriter(buf, fieldnames=fields)
+        writer.writeheader()
+
+    rows = 0
+    for row in iter_rows(experiment, chunk_size=chunk_size):
+        if format == "csv":
+            writer.writerow(row)
+        else:
+            buf.write(json.dumps(row))
+            buf.write("\n")
+        rows += 1
+
+        if rows % chunk_size == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _kpis(experiment):
+    return [None] + sorted(experiment.kpis)
+
+
+def _conversion_column(kpi):
+    return "converted" if kpi is None else "converted:{0}".format(kpi)
@@ -1,19 +1,45 @@
 # -*- coding:utf-8 -*-
 from datetime import datetime
 from hashlib import sha1
+import json
 from math import log
 import operator
 import random
 import re
+import threading
+import time
 import redis
 from .py3helpers import PY2
 from .config import CONFIG as cfg
-from .db import _key, msetbit, sequential_id, first_key_with_bit_set
+from .db import DEFAULT_PREFIX, _key, msetbit, sequential_id, first_key_with_bit_set
 
 # This is pretty restrictive, but we can always relax it later.
 VALID_EXPERIMENT_ALTERNATIVE_RE = re.compile(r"^[a-z0-9][a-z0-9\-_]*$", re.I)
 VALID_KPI_RE = re.compile(r"^[a-z0-9][a-z0-9\-_]*$", re.I)
 
+# "sticky" stores every participant before answering, "hash" derives the
+# alternative (and traffic split) from the client id alone.
+ASSIGNMENT_MODES = ["sticky", "hash"]
+
+# keys unlinked per SCAN page while deleting an experiment
+DELETE_CHUNK_SIZE = 1000
+
+
+def _deletion_progress(deleted=0, started_at=None, status="deleting"):
+    now = time.time()
+    return {
+        "status": status,
+        "deleted_keys": deleted,
+        "started_at": started_at or now,
+        "updated_at": now,
+    }
+
+
+def _is_deleting(state):
+    """Whether a ``deletions`` entry locks the experiment name: failed
+    purges do not, they are retried by ``resume_deletions``."""
+    return state is not None and json.loads(state).get("status") == "deleting"
+
 
 class Client(object):
     def __init__(self, client_id, redis=None):
@@ -29,6 +55,7 @@ class Experiment(object):
         winner=False,
         traffic_fraction=False,
         redis=None,
+        assignment=False,
     ):
 
         # if len(alternatives) < 2:
@@ -42,6 +69,8 @@ class Experiment(object):
         # False here is a sentinal value for "not looked up yet"
         self._winner = winner
         self._traffic_fraction = traffic_fraction
+        self._assignment = assignment
+        self._summary = False
         self._sequential_ids = dict()
 
     def __repr__(self):
@@ -98,6 +127,8 @@ class Experiment(object):
                 for alternative in reversed(self.alternatives):
                     pipe.lpush("{0}:alternatives".format(self.key()), alternative.name)
             pipe.hset(self.key(), "traffic_fraction", self._traffic_fraction)
+            if self._assignment:
+                pipe.hset(self.key(), "assignment", self._assignment)
             pipe.execute()
         except redis.WatchError:
             # another writer has created this experiment and caused
@@ -105,6 +136,8 @@ class Experiment(object):
             # the traffic_fraction is the same between the two writers
             # and ensure that the traffic_fraction is updated.
             self.redis.hset(self.key(), "traffic_fraction", self._traffic_fraction)
+            if self._assignment:
+                self.redis.hset(self.key(), "assignment", self._assignment)
 
     @property
     def control(self):
@@ -125,6 +158,8 @@ class Experiment(object):
         return not self.redis.exists(self.key())
 
     def total_participants(self):
+        if self.is_compacted():
+            return self._summary_count("p", "_all")
         key = _key("p:{0}:_all:all".format(self.name))
         return self.redis.bitcount(key)
 
@@ -138,6 +173,8 @@ class Experiment(object):
         return self._get_stats("participations", "years")
 
     def total_conversions(self):
+        if self.is_compacted():
+            return self._summary_count("c", "_all")
         key = _key("c:{0}:_all:users:all".format(self.kpi_key()))
         return self.redis.bitcount(key)
 
@@ -163,6 +200,9 @@ class Experiment(object):
         if stat_range not in ["days", "months", "years"]:
             raise ValueError("Unrecognized stat range: {0}".format(stat_range))
 
+        if self.is_compacted():
+            return self._summary_count(stat_type, "_all", stat_range)
+
         pipe = self.redis.pipeline()
 
         stats = {}
@@ -196,47 +236,134 @@ class Experiment(object):
         else:
             return None
 
-    def reset(self):
+    def reset(self, background=False):
+        """Delete every key of the experiment and recreate it empty, keeping
+        its alternatives, description and settings."""
         name = self.name
         desc = self.description
         alts = self.get_alternative_names()
+        traffic_fraction = self.traffic_fraction
+        assignment = self.assignment
 
-        self.delete()
+        def recreate():
+            experiment = Experiment(name, alts, redis=self.redis)
+            experiment.set_traffic_fraction(traffic_fraction)
+            experiment.set_assignment(assignment)
+            experiment.save()
+            experiment.update_description(desc)
+
+        return self.delete(background=background, on_done=recreate)
 
-        experiment = Experiment(name, alts, redis=self.redis)
-        experiment.update_description(desc)
-        experiment.save()
+    def scan_and_delete(self, match=None, count=None, keep=None, progress=None):
+        """UNLINK the keys matching ``match`` one SCAN page at a time.
 
-    def scan_and_delete(self, match=None, count=None):
+        :param keep: optional predicate, keys it rejects are left alone
+        :param progress: called with the running count of deleted keys
+            after every page
+        """
+        deleted = 0
         cursor = 0
         while True:
-            result = self.redis.scan(cursor, match=match, count=count)
-            cursor = result[0]
-            keys = result[1]
-            for key in keys:
-                key_type = self.redis.type(key)
-                if str(key_type) == "zset":
-                    self.redis.unlink(key)
-                else:
-                    self.redis.delete(key)
+            cursor, keys = self.redis.scan(cursor, match=match, count=count)
+            if keep is not None:
+                keys = [key for key in keys if keep(key)]
+            if keys:
+                # UNLINK frees the values off the redis main thread
+                deleted += self.redis.unlink(*keys)
+            if progress is not None:
+                progress(deleted)
             if cursor == 0:
-                break
-
-    def delete(self):
+                return deleted
+
+    def delete(self, background=False, chunk_size=DELETE_CHUNK_SIZE, on_done=None):
+        """Delete the experiment and every key it owns.
+
+        The experiment disappears from ``find`` at once and is listed in
+        ``deletions`` until its keys are gone, so lookups fail fast and it
+        cannot be recreated under the purge. The keys are then UNLINKed in
+        pages of ``chunk_size``, in a daemon thread when ``background`` is
+        set (the thread is returned). A purge that fails is marked
+        ``failed``, which frees the name, and ``resume_deletions`` (run at
+        server start) finishes it.
+        """
         pipe = self.redis.pipeline()
         pipe.srem(_key("e"), self.name)
-        pipe.delete(self.key())
-        pipe.delete(_key(self.name))
-        pipe.delete(_key("e:{0}".format(self.name)))
+        pipe.hset(_key("deletions"), self.name, json.dumps(_deletion_progress()))
+        pipe.unlink(self.key())
+        pipe.unlink(_key("e:{0}".format(self.name)))
         pipe.execute()
 
-        # Consider a 'non-keys' implementation of this
-        match = "*:{0}:*".format(self.name)
-        self.scan_and_delete(match=match, count=100)
+        if not background:
+            return self._purge(chunk_size, on_done)
 
-        # Delete the KPIs as well
-        match = "*:{0}/*".format(self.name)
-        self.scan_and_delete(match=match, count=100)
+        thread = threading.Thread(
+            target=self._purge,
+            args=(chunk_size, on_done),
+            name="abtest-delete-{0}".format(self.name),
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def _purge(self, chunk_size, on_done=None):
+        started = _deletion_progress()
+        done = [0]
+
+        def progress(deleted):
+            done[0] = deleted
+            state = _deletion_progress(deleted, started["started_at"])
+            self.redis.hset(_key("deletions"), self.name, json.dumps(state))
+
+        # One pass over the keyspace: the server-side MATCH is a superset
+        # that is narrowed to exactly this experiment's keys here, so that
+        # e.g. deleting "a" leaves the alternative "a" of another one alone.
+        owned = re.compile(
+            r"^{0}:(?:[epc]:)?{1}(?:$|[:/])".format(
+                re.escape(DEFAULT_PREFIX), re.escape(self.name)
+            )
+        )
+        try:
+            deleted = self.scan_and_delete(
+                match="{0}:*{1}*".format(DEFAULT_PREFIX, self.name),
+                count=chunk_size,
+                keep=owned.match,
+                progress=progress,
+            )
+        except Exception:
+            # release the name, the rest of the keys is deleted on restart
+            state = _deletion_progress(done[0], started["started_at"], "failed")
+            self.redis.hset(_key("deletions"), self.name, json.dumps(state))
+            raise
+
+        self.redis.hdel(_key("deletions"), self.name)
+        if on_done is not None:
+            on_done()
+        return deleted
+
+    @staticmethod
+    def deletions(redis=None):
+        """Progress of the deletions still running, keyed by experiment name."""
+        return dict(
+            (name, json.loads(state))
+            for name, state in redis.hgetall(_key("deletions")).items()
+        )
+
+    @staticmethod
+    def is_deleting(experiment_name, redis=None):
+        return _is_deleting(redis.hget(_key("deletions"), experiment_name))
+
+    @staticmethod
+    def resume_deletions(redis=None, background=True):
+        """Restart deletions interrupted by a process exit or failed."""
+        resumed = []
+        for name in Experiment.deletions(redis=redis):
+            if redis.sismember(_key("e"), name):
+                # recreated after a failed purge, its keys are in use again
+                redis.hdel(_key("deletions"), name)
+                continue
+            experiment = Experiment(name, [], redis=redis)
+            resumed.append(experiment.delete(background=background))
+        return resumed
 
     def delete1(self):
         pipe = self.redis.pipeline()
@@ -257,13 +384,125 @@ class Experiment(object):
 
         pipe.execute()
 
-    def archive(self):
+    def archive(self, compact=False):
         self.redis.hset(self.key(), "archived", 1)
-        self.redis.delete(_key("e:{0}:users".format(self.name)))
+        self.redis.unlink(_key("e:{0}:users".format(self.name)))
+        if compact:
+            self.compact()
 
     def is_archived(self):
         return self.redis.hexists(self.key(), "archived")
 
+    def compact(self):
+        """Freeze the final stats of an archived experiment into a single
+        summary record and free the participation/conversion bitmaps.
+
+        Archived experiments can no longer be updated, so their counts are
+        final. Once compacted, every stat read is answered from the summary.
+        """
+        if not self.is_archived():
+            raise ValueError("only archived experiments can be compacted")
+
+        if self.is_compacted():
+            return self.summary
+
+        buckets = ["_all"] + self.get_alternative_names()
+        participations, stale_keys = self._collect_stats("p", self.name, buckets)
+
+        conversions = {}
+        kpi_keys = [self.name]
+        kpi_keys += ["{0}/{1}".format(self.name, kpi) for kpi in self.kpis]
+        for kpi_key in kpi_keys:
+            conversions[kpi_key], keys = self._collect_stats("c", kpi_key, buckets)
+            stale_keys.extend(keys)
+
+        summary = {
+            "excluded_clients": self.excluded_clients(),
+            "participations": participations,
+            "conversions": conversions,
+        }
+        stale_keys.append(_key("e:{0}:excluded".format(self.name)))
+
+        pipe = self.redis.pipeline()
+        pipe.set(self._summary_key, json.dumps(summary))
+        pipe.unlink(*stale_keys)
+        pipe.execute()
+
+        self._summary = summary
+        return summary
+
+    def _collect_stats(self, stat_type, exp_key, buckets):
+        """Count every bitmap of one stat type, returning the counts and the
+        keys they were read from."""
+        mod = "" if stat_type == "p" else "users:"
+        ranges = {}
+        for stat_range in ["days", "months", "years"]:
+            search_key = _key("{0}:{1}:{2}".format(stat_type, exp_key, stat_range))
+            ranges[stat_range] = sorted(self.redis.smembers(search_key))
+
+        slots = []
+        keys = []
+        for bucket in buckets:
+            slots.append((bucket, "all", None))
+            keys.append(
+                _key("{0}:{1}:{2}:{3}all".format(stat_type, exp_key, bucket, mod))
+            )
+            for stat_range, periods in ranges.items():
+                for period in periods:
+                    slots.append((bucket, stat_range, period))
+                    keys.append(
+                        _key(
+                            "{0}:{1}:{2}:{3}{4}".format(
+                                stat_type, exp_key, bucket, mod, period
+                            )
+                        )
+                    )
+
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.bitcount(key)
+        counts = pipe.execute()
+
+        stats = {}
+        for bucket in buckets:
+            stats[bucket] = {"all": 0, "days": {}, "months": {}, "years": {}}
+        for (bucket, stat_range, period), count in zip(slots, counts):
+            if period is None:
+                stats[bucket]["all"] = count
+            else:
+                stats[bucket][stat_range][period] = count
+
+        for stat_range in ranges:
+            keys.append(_key("{0}:{1}:{2}".format(stat_type, exp_key, stat_range)))
+
+        return stats, keys
+
+    @property
+    def summary(self):
+        if self._summary is False:
+            summary = self.redis.get(self._summary_key)
+            self._summary = json.loads(summary) if summary else None
+        return self._summary
+
+    def is_compacted(self):
+        return self.summary is not None
+
+    @property
+    def _summary_key(self):
+        return _key("e:{0}:summary".format(self.name))
+
+    def _summary_count(self, stat_type, bucket, stat_range="all"):
+        if stat_type == "p":
+            section = self.summary["participations"]
+        else:
+            section = self.summary["conversions"].get(self.kpi_key(), {})
+
+        if stat_range == "all":
+            return section.get(bucket, {}).get("all", 0)
+
+        counts = section.get(bucket, {}).get(stat_range, {})
+        return dict((k, float(v)) for k, v in counts.items())
+
     def pause(self):
         self.redis.hset(self.key(), "paused", 1)
 
@@ -353,10 +592,24 @@ class Experiment(object):
 
         self._traffic_fraction = fraction
 
+    @property
+    def assignment(self):
+        if self._assignment is False:
+            self._assignment = self.redis.hget(self.key(), "assignment") or "sticky"
+        return self._assignment
+
+    def set_assignment(self, assignment):
+        if assignment not in ASSIGNMENT_MODES:
+            raise ValueError("invalid assignment mode")
+
+        self._assignment = assignment
+
     def sequential_id(self, client):
         """Return the sequential id for this test for the passed in client"""
         if client.client_id not in self._sequential_ids:
-            id_ = sequential_id("e:{0}:users".format(self.name), client.client_id)
+            id_ = sequential_id(
+                "e:{0}:users".format(self.name), client.client_id, redis=self.redis
+            )
             self._sequential_ids[client.client_id] = id_
         return self._sequential_ids[client.client_id]
 
@@ -373,7 +626,11 @@ class Experiment(object):
         if self.is_client_excluded(client):
             return self.control
 
-        chosen_alternative = self.existing_alternative(client)
+        if self.assignment == "hash":
+            # the hash always lands on the same alternative, nothing to look up
+            chosen_alternative = None
+        else:
+            chosen_alternative = self.existing_alternative(client)
         if not chosen_alternative:
             chosen_alternative, participate = self.choose_alternative(client)
             if participate and not prefetch:
@@ -390,6 +647,8 @@ class Experiment(object):
         return self.redis.getbit(key, self.sequential_id(client))
 
     def excluded_clients(self):
+        if self.is_compacted():
+            return self.summary["excluded_clients"]
         key = _key("e:{0}:excluded".format(self.name))
         return self.redis.bitcount(key)
 
@@ -399,7 +658,9 @@ class Experiment(object):
 
         alts = self.get_alternative_names()
         keys = [_key("p:{0}:{1}:all".format(self.name, alt)) for alt in alts]
-        altkey = first_key_with_bit_set(keys=keys, args=[self.sequential_id(client)])
+        altkey = first_key_with_bit_set(
+            keys=keys, args=[self.sequential_id(client)], client=self.redis
+        )
         if altkey:
             idx = keys.index(altkey)
             return Alternative(alts[idx], self, redis=self.redis)
@@ -407,6 +668,13 @@ class Experiment(object):
         return None
 
     def choose_alternative(self, client):
+        if self.assignment == "hash":
+            alternative, participate = self._hash_choice(client)
+            if not participate:
+                # recorded like the random split, and like StatelessClient
+                self.exclude_client(client)
+            return alternative, participate
+
         rnd = random.random()
         if rnd >= self.traffic_fraction:
             self.exclude_client(client)
@@ -414,13 +682,26 @@ class Experiment(object):
 
         return self._uniform_choice(client), True
 
+    def _hash_choice(self, client):
+        """Deterministic counterpart of ``choose_alternative``: the traffic
+        split and the alternative only depend on the client id, so nothing
+        is read from or written to redis."""
+        if self._get_hash(client, salt="traffic") / float(0x10000000) >= (
+            self.traffic_fraction
+        ):
+            return self.control, False
+
+        return self._uniform_choice(client), True
+
     # Ported from https://github.com/facebook/planout/blob/master/planout/ops/random.py
     def _uniform_choice(self, client):
         idx = self._get_hash(client) % len(self.alternatives)
         return self.alternatives[idx]
 
-    def _get_hash(self, client):
+    def _get_hash(self, client, salt=None):
         salty = "{0}.{1}".format(self.name, client.client_id)
+        if salt is not None:
+            salty = "{0}.{1}".format(salt, salty)
 
         # We're going to take the first 7 bytes of the client UUID
         # because of the largest integer values that can be represented safely
@@ -434,7 +715,9 @@ class Experiment(object):
     def existing_conversion(self, client):
         alts = self.get_alternative_names()
         keys = [_key("c:{0}:{1}:users:all".format(self.kpi_key(), alt)) for alt in alts]
-        altkey = first_key_with_bit_set(keys=keys, args=[self.sequential_id(client)])
+        altkey = first_key_with_bit_set(
+            keys=keys, args=[self.sequential_id(client)], client=self.redis
+        )
         if altkey:
             idx = keys.index(altkey)
             return Alternative(alts[idx], self, redis=self.redis)
@@ -457,6 +740,8 @@ class Experiment(object):
     def find(cls, experiment_name, redis=None):
 
         if not redis.sismember(_key("e"), experiment_name):
+            if Experiment.is_deleting(experiment_name, redis=redis):
+                raise ValueError("this experiment is being deleted")
             raise ValueError("experiment does not exist")
 
         return cls(
@@ -467,7 +752,12 @@ class Experiment(object):
 
     @classmethod
     def find_or_create(
-        cls, experiment_name, alternatives, traffic_fraction=None, redis=None
+        cls,
+        experiment_name,
+        alternatives,
+        traffic_fraction=None,
+        redis=None,
+        assignment=None,
     ):
 
         if len(alternatives) < 2:
@@ -483,9 +773,13 @@ class Experiment(object):
             experiment = Experiment.find(experiment_name, redis=redis)
             is_update = True
         except ValueError:
+            if Experiment.is_deleting(experiment_name, redis=redis):
+                raise
             experiment = cls(experiment_name, alternatives, redis=redis)
             # TODO: I want to revisit this later.
             experiment.set_traffic_fraction(traffic_fraction)
+            if assignment is not None:
+                experiment.set_assignment(assignment)
             experiment.save()
 
         # Only check traffic fraction if the experiment is being updated
@@ -494,6 +788,10 @@ class Experiment(object):
             experiment.set_traffic_fraction(traffic_fraction)
             experiment.save()
 
+        if is_update and assignment is not None and experiment.assignment != assignment:
+            experiment.set_assignment(assignment)
+            experiment.save()
+
         # Make sure the alternative options are correct. If they are not,
         # raise an error.
         if sorted(experiment.get_alternative_names()) != sorted(alternatives):
@@ -622,6 +920,8 @@ class Alternative(object):
         return winner and winner.name == self.name
 
     def participant_count(self):
+        if self.experiment.is_compacted():
+            return self.experiment._summary_count("p", self.name)
         key = _key("p:{0}:{1}:all".format(self.experiment.name, self.name))
         return self.redis.bitcount(key)
 
@@ -635,6 +935,8 @@ class Alternative(object):
         return self._get_stats("participations", "years")
 
     def completed_count(self):
+        if self.experiment.is_compacted():
+            return self.experiment._summary_count("c", self.name)
         key = _key("c:{0}:{1}:users:all".format(self.experiment.kpi_key(), self.name))
         return self.redis.bitcount(key)
 
@@ -660,6 +962,9 @@ class Alternative(object):
         if stat_range not in ["days", "months", "years"]:
             raise ValueError("Unrecognized stat range: {0}".format(stat_range))
 
+        if self.experiment.is_compacted():
+            return self.experiment._summary_count(stat_type, self.name, stat_range)
+
         stats = {}
 
         pipe = self.redis.pipeline()
@@ -685,15 +990,26 @@ class Alternative(object):
         else:
             date = dt
 
-        experiment_key = self.experiment.name
-
+        sequential_id = self.experiment.sequential_id(client)
         pipe = self.redis.pipeline()
+        self._queue_participation(pipe, sequential_id, date)
+        pipe.execute()
 
-        pipe.sadd(_key("p:{0}:years".format(experiment_key)), date.strftime("%Y"))
-        pipe.sadd(_key("p:{0}:months".format(experiment_key)), date.strftime("%Y-%m"))
-        pipe.sadd(_key("p:{0}:days".format(experiment_key)), date.strftime("%Y-%m-%d"))
+    def _queue_participation(self, pipe, sequential_id, date):
+        periods, keys = self._participation_keys(date)
+        for key, period in periods:
+            pipe.sadd(key, period)
+        msetbit(keys=keys, args=([sequential_id, 1] * len(keys)), client=pipe)
 
-        pipe.execute()
+    def _participation_keys(self, date):
+        """The period sets and bitmaps a participation on ``date`` touches"""
+        experiment_key = self.experiment.name
+
+        periods = [
+            (_key("p:{0}:years".format(experiment_key)), date.strftime("%Y")),
+            (_key("p:{0}:months".format(experiment_key)), date.strftime("%Y-%m")),
+            (_key("p:{0}:days".format(experiment_key)), date.strftime("%Y-%m-%d")),
+        ]
 
         keys = [
             _key("p:{0}:_all:all".format(experiment_key)),
@@ -715,9 +1031,7 @@ class Alternative(object):
                 )
             ),
         ]
-        msetbit(
-            keys=keys, args=([self.experiment.sequential_id(client), 1] * len(keys))
-        )
+        return periods, keys
 
     def record_conversion(self, client, dt=None):
         """Record a user's conversion in a test along with a given variation"""
@@ -726,15 +1040,26 @@ class Alternative(object):
         else:
             date = dt
 
-        experiment_key = self.experiment.kpi_key()
-
+        sequential_id = self.experiment.sequential_id(client)
         pipe = self.redis.pipeline()
+        self._queue_conversion(pipe, sequential_id, date)
+        pipe.execute()
 
-        pipe.sadd(_key("c:{0}:years".format(experiment_key)), date.strftime("%Y"))
-        pipe.sadd(_key("c:{0}:months".format(experiment_key)), date.strftime("%Y-%m"))
-        pipe.sadd(_key("c:{0}:days".format(experiment_key)), date.strftime("%Y-%m-%d"))
+    def _queue_conversion(self, pipe, sequential_id, date):
+        periods, keys = self._conversion_keys(date)
+        for key, period in periods:
+            pipe.sadd(key, period)
+        msetbit(keys=keys, args=([sequential_id, 1] * len(keys)), client=pipe)
 
-        pipe.execute()
+    def _conversion_keys(self, date):
+        """The period sets and bitmaps a conversion on ``date`` touches"""
+        experiment_key = self.experiment.kpi_key()
+
+        periods = [
+            (_key("c:{0}:years".format(experiment_key)), date.strftime("%Y")),
+            (_key("c:{0}:months".format(experiment_key)), date.strftime("%Y-%m")),
+            (_key("c:{0}:days".format(experiment_key)), date.strftime("%Y-%m-%d")),
+        ]
 
         keys = [
             _key("c:{0}:_all:users:all".format(experiment_key)),
@@ -760,9 +1085,7 @@ class Alternative(object):
                 )
             ),
         ]
-        msetbit(
-            keys=keys, args=([self.experiment.sequential_id(client), 1] * len(keys))
-        )
+        return periods, keys
 
     def conversion_rate(self):
         try:
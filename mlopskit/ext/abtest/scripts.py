@@ -0,0 +1,52 @@
+"""Lua scripts run by every abtest backend.
+
+The sources live here, rather than next to their ``register_script`` calls in
+``db``, so that backends which cannot run Lua can map them onto native
+implementations.
+"""
+
+MONOTONIC_ZADD = """
+    local sequential_id = redis.call('zscore', KEYS[1], ARGV[1])
+    if not sequential_id then
+        sequential_id = redis.call('zcard', KEYS[1])
+        redis.call('zadd', KEYS[1], sequential_id, ARGV[1])
+    end
+    return sequential_id
+"""
+
+MSETBIT = """
+    for index, value in ipairs(KEYS) do
+        redis.call('setbit', value, ARGV[(index - 1) * 2 + 1], ARGV[(index - 1) * 2 + 2])
+    end
+    return redis.status_reply('ok')
+"""
+
+FIRST_KEY_WITH_BIT_SET = """
+    for index, value in ipairs(KEYS) do
+        local bit = redis.call('getbit', value, ARGV[1])
+        if bit == 1 then
+             return value
+        end
+    end
+    return false
+"""
+
+BITS_SET_IN_RANGE = """
+    local offsets = {}
+    for index, value in ipairs(KEYS) do
+        local bytes = redis.call('getrange', value, ARGV[1], ARGV[2])
+        local found = {}
+        for i = 1, #bytes do
+            local byte = string.byte(bytes, i)
+            if byte > 0 then
+                for bit = 7, 0, -1 do
+                    if math.floor(byte / 2 ^ bit) % 2 == 1 then
+                        found[#found + 1] = (ARGV[1] + i - 1) * 8 + 7 - bit
+                    end
+                end
+            end
+        end
+        offsets[index] = found
+    end
+    return offsets
+"""
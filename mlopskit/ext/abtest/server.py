@@ -14,20 +14,20 @@ from werkzeug.exceptions import HTTPException, NotFound
 from werkzeug.datastructures import Headers
 
 from .version import __version__
-from abkit.api import participate, convert
+from .api import participate, convert
 
-from abkit.config import CONFIG as cfg
-from abkit.metrics import init_statsd
-from abkit.utils import to_bool
+from .config import CONFIG as cfg
+from .metrics import init_statsd
+from .utils import to_bool
 
 try:
-    from abkit import db
+    from . import db
 except ConnectionError:
     print("Redis is currently unavailable or misconfigured")
     sys.exit()
 
-from abkit.models import Experiment, Client
-from abkit.utils import (
+from .models import Experiment, Client
+from .utils import (
     service_unavailable_on_connection_error,
     json_error,
     json_success,
@@ -62,7 +62,6 @@ class CORSMiddleware(object):
             headers.add("Access-Control-Allow-Credentials", cfg.get("cors_credentials"))
             headers.add("Access-Control-Allow-Methods", cfg.get("cors_methods"))
             headers.add("Access-Control-Expose-Headers", cfg.get("cors_expose_headers"))
-            print(headers, type(headers), "headers")
             return start_response(status, headers.to_wsgi_list(), exc_info)
 
         if environ.get("REQUEST_METHOD") == "OPTIONS":
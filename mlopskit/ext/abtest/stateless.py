@@ -0,0 +1,347 @@
+# -*- coding:utf-8 -*-
+"""Hash-bucket experiments with buffered, asynchronous event logging.
+
+``StatelessClient.participate`` and ``StatelessClient.convert`` answer from
+the client id alone (experiments run with ``assignment="hash"``) and only
+enqueue the event; a background thread writes queued events to the backend
+in pipelined batches. Experiment state (winner, archived, paused) is
+refreshed in the background as well, so once an experiment has been seen by
+the process the request path is a pure CPU operation. Conversions of
+clients not recorded as participating are dropped when written, as
+``Experiment.convert`` would refuse them, and counted as ``rejected``.
+"""
+
+import atexit
+import datetime as dt
+import queue
+import threading
+import time
+
+from redis import ConnectionError, RedisError, TimeoutError
+from structlog import get_logger
+
+from .config import CONFIG as cfg
+from .db import _key, monotonic_zadd
+from .models import Alternative, Client, Experiment
+
+logger = get_logger(__name__)
+
+PARTICIPATION = "participation"
+CONVERSION = "conversion"
+EXCLUSION = "exclusion"
+
+# winner, archived, paused
+DEFAULT_STATE = (None, False, False)
+# seconds the exit handler waits for queued events to be written
+CLOSE_TIMEOUT = 10.0
+
+
+class StatelessClient(object):
+    def __init__(
+        self,
+        redis=None,
+        batch_size=500,
+        flush_interval=1.0,
+        refresh_interval=30.0,
+        max_queue_size=100000,
+        block=False,
+    ):
+        """
+        :param batch_size: maximum number of events written per pipeline
+        :param flush_interval: seconds an event may wait in the queue
+        :param refresh_interval: seconds between experiment state refreshes
+        :param max_queue_size: events buffered before new ones are dropped
+            (or, with ``block=True``, before callers wait for room)
+        """
+        self.redis = redis
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.block = block
+
+        self.flushed = 0
+        self.dropped = 0
+        self.rejected = 0
+
+        self._experiments = {}
+        self._writers = {}
+        self._states = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="abtest-stateless-flusher", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close, CLOSE_TIMEOUT)
+
+    def participate(
+        self,
+        experiment,
+        alternatives,
+        client_id,
+        force=None,
+        traffic_fraction=None,
+        datetime=None,
+    ):
+        exp = self._experiment(experiment, alternatives, traffic_fraction)
+
+        if force and force in alternatives:
+            return Alternative(force, exp, redis=self.redis)
+
+        if not cfg.get("enabled", True):
+            return exp.control
+
+        winner, archived, paused = self._states.get(experiment, DEFAULT_STATE)
+        if winner is not None:
+            return Alternative(winner, exp, redis=self.redis)
+        if archived or paused:
+            return exp.control
+
+        alt, participating = exp._hash_choice(Client(client_id, redis=self.redis))
+        kind = PARTICIPATION if participating else EXCLUSION
+        self._put(kind, experiment, client_id, alt.name, datetime)
+        return alt
+
+    def convert(self, experiment, client_id, kpi=None, datetime=None):
+        exp = self._experiments.get(experiment)
+        if exp is None:
+            exp = self._load(Experiment.find(experiment, redis=self.redis))
+            if exp.assignment != "hash":
+                raise ValueError("this experiment does not use hash assignment")
+
+        if not cfg.get("enabled", True):
+            return exp.control
+
+        winner, archived, paused = self._states.get(experiment, DEFAULT_STATE)
+        if archived:
+            raise ValueError("this experiment is archived and can no longer be updated")
+        if paused:
+            raise ValueError("this experiment is paused and can not receive updates.")
+
+        if kpi is not None and not Experiment.validate_kpi(kpi):
+            raise ValueError("invalid kpi name")
+
+        alt, participating = exp._hash_choice(Client(client_id, redis=self.redis))
+        if not participating:
+            raise ValueError("this client was not participating")
+
+        self._put(CONVERSION, experiment, client_id, alt.name, datetime, kpi)
+        return alt
+
+    def _experiment(self, name, alternatives, traffic_fraction):
+        if traffic_fraction is None:
+            traffic_fraction = 1
+
+        exp = self._experiments.get(name)
+        if exp is not None:
+            if sorted(exp.get_alternative_names()) != sorted(alternatives):
+                raise ValueError(
+                    "experiment alternatives have changed. please delete in the admin"
+                )
+            if exp.traffic_fraction == traffic_fraction:
+                return exp
+
+        # First sight of this experiment (or a new traffic fraction) in this
+        # process: make sure it is stored in hash mode, then serve it locally.
+        exp = Experiment.find_or_create(
+            name,
+            alternatives,
+            traffic_fraction=traffic_fraction,
+            redis=self.redis,
+            assignment="hash",
+        )
+        return self._load(exp)
+
+    def _load(self, exp):
+        # resolve the lazily loaded attributes the request path relies on
+        exp.traffic_fraction
+        exp.assignment
+        self._states[exp.name] = self._fetch_states([exp])[exp.name]
+        with self._lock:
+            self._experiments[exp.name] = exp
+        return exp
+
+    def _fetch_states(self, experiments):
+        pipe = self.redis.pipeline(transaction=False)
+        for exp in experiments:
+            pipe.get(exp._winner_key)
+            pipe.hexists(exp.key(), "archived")
+            pipe.hexists(exp.key(), "paused")
+        results = pipe.execute()
+
+        states = {}
+        for idx, exp in enumerate(experiments):
+            winner, archived, paused = results[idx * 3 : idx * 3 + 3]
+            states[exp.name] = (winner or None, bool(archived), bool(paused))
+        return states
+
+    def refresh(self):
+        """Reload winner/archived/paused state of every known experiment."""
+        with self._lock:
+            experiments = list(self._experiments.values())
+        if experiments:
+            states = dict(self._states)
+            states.update(self._fetch_states(experiments))
+            self._states = states
+
+    def _put(self, kind, experiment, client_id, alternative, date, kpi=None):
+        event = (
+            kind,
+            experiment,
+            client_id,
+            alternative,
+            date or dt.datetime.now(),
+            kpi,
+        )
+        try:
+            self._queue.put(event, block=self.block)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, timeout):
+        batch = []
+        deadline = time.time() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        last_refresh = time.time()
+        while not self._stop.is_set():
+            batch = self._drain(self.flush_interval)
+            if batch:
+                self._flush(batch)
+
+            if time.time() - last_refresh >= self.refresh_interval:
+                last_refresh = time.time()
+                try:
+                    self.refresh()
+                except RedisError:
+                    logger.exception("Failed to refresh experiment states")
+
+        self.flush()
+
+    def flush(self):
+        """Write every queued event now, stopping at the first batch the
+        backend cannot take; those events stay queued."""
+        batch = self._drain(0)
+        while batch and self._flush(batch):
+            batch = self._drain(0)
+
+    def _flush(self, batch):
+        try:
+            self._write(batch)
+            self.flushed += len(batch)
+        except (ConnectionError, TimeoutError):
+            logger.exception("Backend unavailable, requeueing events", size=len(batch))
+            for event in batch:
+                try:
+                    self._queue.put_nowait(event)
+                except queue.Full:
+                    self.dropped += 1
+            self._stop.wait(self.flush_interval)
+            return False
+        except RedisError:
+            logger.exception("Failed to write events, dropping", size=len(batch))
+            self.dropped += len(batch)
+        return True
+
+    def _write(self, batch):
+        pipe = self.redis.pipeline(transaction=False)
+        for _, experiment, client_id, _, _, _ in batch:
+            key = _key("e:{0}:users".format(experiment))
+            monotonic_zadd(keys=[key], args=[client_id], client=pipe)
+        sequential_ids = [int(x) for x in pipe.execute()]
+        converting = self._participated(batch, sequential_ids)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for idx, (event, sequential_id) in enumerate(zip(batch, sequential_ids)):
+            kind, experiment, _, alternative, date, kpi = event
+
+            exp = self._writers.get(experiment)
+            if exp is None:
+                exp = self._writers[experiment] = Experiment(
+                    experiment, [], redis=self.redis
+                )
+
+            if kind == EXCLUSION:
+                key = _key("e:{0}:excluded".format(experiment))
+                pipe.setbit(key, sequential_id, 1)
+            elif kind == PARTICIPATION:
+                alt = Alternative(alternative, exp, redis=self.redis)
+                alt._queue_participation(pipe, sequential_id, date)
+            elif idx not in converting:
+                # same rule as Experiment.convert: only participants convert
+                self.rejected += 1
+            else:
+                exp.kpi = None
+                if kpi is not None:
+                    pipe.sadd("{0}:kpis".format(exp.key(include_kpi=False)), kpi)
+                    exp.kpi = kpi
+                alt = Alternative(alternative, exp, redis=self.redis)
+                alt._queue_conversion(pipe, sequential_id, date)
+        pipe.execute()
+
+    def _participated(self, batch, sequential_ids):
+        """Indexes of the conversions of ``batch`` made by clients recorded as
+        participating in the alternative, and not excluded, before them."""
+        conversions = [idx for idx, event in enumerate(batch) if event[0] == CONVERSION]
+        if not conversions:
+            return set()
+
+        pipe = self.redis.pipeline(transaction=False)
+        for idx in conversions:
+            _, experiment, _, alternative, _, _ = batch[idx]
+            pipe.getbit(_key("e:{0}:excluded".format(experiment)), sequential_ids[idx])
+            pipe.getbit(
+                _key("p:{0}:{1}:all".format(experiment, alternative)),
+                sequential_ids[idx],
+            )
+        bits = pipe.execute()
+        stored = {
+            idx: (bits[i * 2], bits[i * 2 + 1]) for i, idx in enumerate(conversions)
+        }
+
+        # events earlier in the batch are not written yet
+        seen = {}
+        participated = set()
+        for idx, (kind, experiment, _, alternative, _, _) in enumerate(batch):
+            client = (experiment, sequential_ids[idx])
+            if kind == EXCLUSION:
+                seen[client] = None
+            elif kind == PARTICIPATION:
+                seen.setdefault(client, alternative)
+            else:
+                excluded, participating = stored[idx]
+                if client in seen:
+                    excluded = excluded or seen[client] is None
+                    participating = participating or seen[client] == alternative
+                if participating and not excluded:
+                    participated.add(idx)
+        return participated
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+    def close(self, timeout=None):
+        """Stop the background thread after writing every queued event."""
+        # closed clients are not kept alive until exit
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join(timeout)
+        if self._queue.qsize():
+            logger.warning("Closed with unwritten events", size=self._queue.qsize())
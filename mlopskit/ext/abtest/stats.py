@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+"""Vectorized experiment statistics.
+
+Every function takes ``participants`` and ``conversions`` count arrays shaped
+``(n_experiments, n_alternatives, ...)`` where alternative ``0`` is the control
+and any trailing axes are periods. Experiments with fewer alternatives are
+padded with zero counts. Results follow the semantics of the per-alternative
+methods on ``models.Alternative``, with ``NaN`` standing in for ``"N/A"``.
+"""
+
+import json
+
+import numpy as np
+
+from .db import _key
+
+# Critical values of the chi-square distribution with one degree of freedom
+G_CRITICAL_VALUES = [3.841, 6.635, 10.83]
+Z_CRITICAL_VALUES = [1.96, 2.57, 3.27]
+CONFIDENCE_LABELS = [
+    "No Confidence",
+    "95% Confidence",
+    "99% Confidence",
+    "99.9% Confidence",
+]
+
+
+def _as_counts(participants, conversions):
+    participants = np.asarray(participants, dtype=np.float64)
+    conversions = np.asarray(conversions, dtype=np.float64)
+    if participants.shape != conversions.shape:
+        raise ValueError("participants and conversions must have the same shape")
+    if participants.ndim < 2:
+        raise ValueError("counts must be shaped (experiments, alternatives, ...)")
+    return participants, conversions
+
+
+def _control(values):
+    return np.take(values, [0], axis=1)
+
+
+def _is_control(values):
+    is_control = np.zeros(values.shape, dtype=bool)
+    is_control[:, 0] = True
+    return is_control
+
+
+def conversion_rate(participants, conversions):
+    participants, conversions = _as_counts(participants, conversions)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = conversions / participants
+    return np.where(participants > 0, rate, 0.0)
+
+
+def z_score(participants, conversions):
+    participants, conversions = _as_counts(participants, conversions)
+    ctr_e = conversion_rate(participants, conversions)
+    ctr_c = _control(ctr_e)
+    e = participants
+    c = _control(participants)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = (
+            (ctr_e / ctr_c**3)
+            * ((e * ctr_e) + (c * ctr_c) - (ctr_c * ctr_e) * (c + e))
+            / (c * e)
+        )
+        std_dev = np.sqrt(variance)
+        score = ((ctr_e / ctr_c) - 1) / std_dev
+
+    valid = (ctr_c > 0) & (c * e > 0) & (std_dev > 0)
+    score = np.where(valid, score, 0.0)
+    return np.where(_is_control(score), np.nan, score)
+
+
+def g_stat(participants, conversions, min_conversions=20):
+    # http://en.wikipedia.org/wiki/G-test
+    participants, conversions = _as_counts(participants, conversions)
+    control_participants = _control(participants)
+    control_conversions = _control(conversions)
+
+    alt_failures = participants - conversions
+    control_failures = control_participants - control_conversions
+    total_conversions = conversions + control_conversions
+    total_participants = participants + control_participants
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected_alt_conversions = participants * total_conversions / total_participants
+        expected_control_conversions = (
+            control_participants * total_conversions / total_participants
+        )
+        expected_alt_failures = participants - expected_alt_conversions
+        expected_control_failures = control_participants - expected_control_conversions
+
+        observed = [conversions, alt_failures, control_conversions, control_failures]
+        expected = [
+            expected_alt_conversions,
+            expected_alt_failures,
+            expected_control_conversions,
+            expected_control_failures,
+        ]
+        stat = 2 * sum(o * np.log(o / x) for o, x in zip(observed, expected))
+
+    # The scalar version gives up (returns 0) as soon as one cell is empty
+    valid = np.ones(stat.shape, dtype=bool)
+    for values in observed + expected:
+        valid &= values > 0
+    stat = np.round(np.where(valid, stat, 0.0), 2)
+
+    # small sample size of conversions, see where it goes for a bit
+    stat = np.where(total_conversions < min_conversions, np.nan, stat)
+    return np.where(_is_control(stat), np.nan, stat)
+
+
+def confidence_interval(participants, conversions):
+    # 80% confidence
+    participants, conversions = _as_counts(participants, conversions)
+    p = conversion_rate(participants, conversions)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        interval = np.sqrt(p * (1 - p) / participants) * 1.28 * 100
+    return np.where(participants > 0, interval, 0.0)
+
+
+def confidence_level(stat, critical_values):
+    """Label each test statistic the way ``Alternative.confidence_level`` does."""
+    stat = np.abs(np.asarray(stat, dtype=np.float64))
+    labels = np.array(CONFIDENCE_LABELS, dtype=object)[
+        np.searchsorted(critical_values, np.nan_to_num(stat), side="right")
+    ]
+    labels = np.where(stat == 0.0, "No Change", labels)
+    return np.where(np.isnan(stat), "N/A", labels)
+
+
+def analyze(participants, conversions, min_conversions=20):
+    """Compute every statistic of the dashboard in one vectorized pass."""
+    participants, conversions = _as_counts(participants, conversions)
+    g = g_stat(participants, conversions, min_conversions=min_conversions)
+    z = z_score(participants, conversions)
+    return {
+        "participants": participants,
+        "conversions": conversions,
+        "conversion_rate": conversion_rate(participants, conversions),
+        "z_score": z,
+        "z_confidence_level": confidence_level(np.round(z, 3), Z_CRITICAL_VALUES),
+        "g_stat": g,
+        "g_confidence_level": confidence_level(g, G_CRITICAL_VALUES),
+        "confidence_interval": confidence_interval(participants, conversions),
+    }
+
+
+def fetch_counts(experiments, redis=None):
+    """Fetch the total counts of many experiments with a single pipeline.
+
+    Returns ``(participants, conversions)`` arrays shaped
+    ``(len(experiments), max_alternatives)``, padded with zeros.
+    """
+    width = max([len(exp.alternatives) for exp in experiments] or [0])
+    participants = np.zeros((len(experiments), width))
+    conversions = np.zeros((len(experiments), width))
+
+    # compaction flags and bitmap counts of every experiment in one round
+    # trip; the bitmaps of a compacted experiment are gone and count 0
+    pipe = redis.pipeline()
+    for exp in experiments:
+        pipe.get(exp._summary_key)
+        for alt in exp.alternatives:
+            pipe.bitcount(_key("p:{0}:{1}:all".format(exp.name, alt.name)))
+            pipe.bitcount(_key("c:{0}:{1}:users:all".format(exp.kpi_key(), alt.name)))
+
+    results = iter(pipe.execute())
+    for row, exp in enumerate(experiments):
+        summary = next(results)
+        if exp._summary is False:
+            exp._summary = json.loads(summary) if summary else None
+        for col, alt in enumerate(exp.alternatives):
+            participants[row, col] = next(results)
+            conversions[row, col] = next(results)
+            if exp.is_compacted():
+                participants[row, col] = exp._summary_count("p", alt.name)
+                conversions[row, col] = exp._summary_count("c", alt.name)
+
+    return participants, conversions
+
+
+def analyze_experiments(experiments, redis=None):
+    """Statistics of every alternative of many experiments, keyed by name."""
+    participants, conversions = fetch_counts(experiments, redis=redis)
+    stats = analyze(participants, conversions)
+
+    analyzed = {}
+    for row, exp in enumerate(experiments):
+        alternatives = {}
+        for col, alt in enumerate(exp.alternatives):
+            alternatives[alt.name] = dict(
+                (name, _scalar(values[row, col])) for name, values in stats.items()
+            )
+        analyzed[exp.name] = alternatives
+    return analyzed
+
+
+def _scalar(value):
+    if isinstance(value, str):
+        return value
+    if np.isnan(value):
+        return "N/A"
+    return value.item()
@@ -0,0 +1,316 @@
+"""Point-in-time correct training sets from Parquet feature tables.
+
+A training set starts from a spine: one row per (entity, event timestamp)
+to label. ``materialize`` adds to every spine row the latest value of each
+feature that was known at that timestamp (``feature timestamp <= event
+timestamp``, within the table's ``ttl`` when set), so no feature leaks from
+the future into the training data::
+
+    materialize(
+        "labels.parquet",
+        [
+            FeatureTable("user_stats", "features/user_stats/", "user_id",
+                         features=["clicks_7d", "orders_30d"], ttl=30 * 86400),
+            FeatureTable("user_profile", "features/profile.parquet", "user_id"),
+        ],
+        "training.parquet",
+        entity_key="user_id",
+        timestamp_key="label_ts",
+    )
+
+Nothing is loaded whole. The spine and the feature tables are first
+streamed, batch by batch, into buckets by hash of the entity key, sized so
+that one bucket holds about ``chunk_rows`` rows. Each bucket then holds the
+whole history of its entities and is joined on its own: sorted by time and
+merged as-of (``pandas.merge_asof``, a sorted merge), then appended to the
+output as one Parquet row group. Memory is bounded by the largest bucket
+and the runtime is two passes over the rows involved plus the per-bucket
+sorts. Output rows are grouped by bucket and sorted by event time within
+it, not in spine order; of feature rows with the same timestamp, the last
+one read wins.
+
+Needs ``pyarrow`` (``pip install pyarrow``); ``mlopskit feature_materialize``
+runs a job described in YAML.
+"""
+
+import collections
+import math
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1000000
+BATCH_ROWS = 65536
+MAX_OPEN_FILES = 256
+# internal sort key, timezone-naive UTC nanoseconds on both sides
+_TS = "__pit_ts"
+
+FeatureTable = collections.namedtuple(
+    "FeatureTable",
+    ("name", "path", "entity_key", "timestamp_key", "features", "ttl"),
+)
+FeatureTable.__new__.__defaults__ = ("event_timestamp", None, None)
+FeatureTable.__doc__ = """A Parquet file or directory of feature rows.
+
+``features`` defaults to every column but the entity and timestamp keys,
+``ttl`` (seconds) drops values older than that at the event time."""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "pyarrow not installed, which is needed to materialize features. "
+            "Please install it with `pip install pyarrow`."
+        )
+    return pyarrow
+
+
+def _dataset(source):
+    pa = _pyarrow()
+    if isinstance(source, pd.DataFrame):
+        return pa.dataset.dataset(pa.Table.from_pandas(source, preserve_index=False))
+    return pa.dataset.dataset(source, format="parquet")
+
+
+def _features(table, schema):
+    if table.features is not None:
+        return list(table.features)
+    return [
+        name
+        for name in schema.names
+        if name not in (table.entity_key, table.timestamp_key)
+    ]
+
+
+def _sort_key(column):
+    values = pd.Series(column)
+    if isinstance(values.dtype, pd.DatetimeTZDtype):
+        values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+    return values.astype("datetime64[ns]")
+
+
+class _Buckets(object):
+    # Arrow IPC streams, unbuffered unlike Parquet writers; at most
+    # MAX_OPEN_FILES are kept open, a bucket reopened gets a new part file
+    def __init__(self, directory, prefix, count, schema):
+        self.directory = directory
+        self.prefix = prefix
+        self.count = count
+        self.schema = schema
+        self.parts = collections.defaultdict(list)
+        self.writers = collections.OrderedDict()
+        self.latest = None
+
+    def _writer(self, idx):
+        pa = _pyarrow()
+        writer = self.writers.pop(idx, None)
+        if writer is None:
+            if len(self.writers) >= MAX_OPEN_FILES:
+                self.writers.popitem(last=False)[1].close()
+            path = os.path.join(
+                self.directory,
+                "{0}-{1}-{2}.arrow".format(self.prefix, idx, len(self.parts[idx])),
+            )
+            self.parts[idx].append(path)
+            writer = pa.ipc.new_stream(path, self.schema)
+        self.writers[idx] = writer
+        return writer
+
+    def write(self, batch, entity_key):
+        pa = _pyarrow()
+        entities = batch.column(entity_key).to_numpy(zero_copy_only=False)
+        buckets = pd.util.hash_array(entities) % self.count
+        order = np.argsort(buckets, kind="stable")
+        ids, starts = np.unique(buckets[order], return_index=True)
+        ends = list(starts[1:]) + [len(order)]
+        for idx, start, end in zip(ids, starts, ends):
+            self._writer(idx).write_batch(batch.take(pa.array(order[start:end])))
+
+    def close(self):
+        while self.writers:
+            self.writers.popitem()[1].close()
+
+    def read(self, idx):
+        if idx not in self.parts:
+            return None
+        pa = _pyarrow()
+        tables = []
+        for path in self.parts[idx]:
+            with pa.ipc.open_stream(path) as reader:
+                tables.append(reader.read_all())
+        return pa.concat_tables(tables).to_pandas()
+
+
+def _spill(
+    dataset, columns, entity_key, directory, prefix, count, keep=None, latest=None
+):
+    # latest: column whose maximum is kept in buckets.latest
+    pa = _pyarrow()
+    buckets = _Buckets(
+        directory, prefix, count, pa.schema([dataset.schema.field(c) for c in columns])
+    )
+    options = {}
+    if isinstance(dataset, pa.dataset.FileSystemDataset):
+        # pre-buffering reads whole row groups ahead
+        options["fragment_scan_options"] = pa.dataset.ParquetFragmentScanOptions(
+            pre_buffer=False
+        )
+    try:
+        # no read-ahead: memory stays at one record batch per source
+        for batch in dataset.to_batches(
+            columns=columns,
+            filter=keep,
+            batch_size=BATCH_ROWS,
+            batch_readahead=0,
+            fragment_readahead=0,
+            use_threads=False,
+            **options
+        ):
+            if batch.num_rows:
+                buckets.write(batch, entity_key)
+                if latest is not None:
+                    value = pa.compute.max(batch.column(latest))
+                    if value.is_valid and (
+                        buckets.latest is None or value.as_py() > buckets.latest.as_py()
+                    ):
+                        buckets.latest = value
+    finally:
+        buckets.close()
+    return buckets
+
+
+def materialize(
+    spine,
+    tables,
+    output,
+    entity_key="entity_id",
+    timestamp_key="event_timestamp",
+    chunk_rows=CHUNK_ROWS,
+    full_feature_names=False,
+    compression="zstd",
+    spill_dir=None,
+):
+    """Join the features of ``tables`` as of the rows of ``spine`` and write
+    the result to ``output``.
+
+    :param spine: Parquet file/directory or ``pandas.DataFrame`` with
+        ``entity_key`` and ``timestamp_key`` columns, kept in the output
+    :param tables: ``FeatureTable`` list; their entity keys must hold the
+        same values, of the same type, as the spine's
+    :param output: Parquet file written
+    :param chunk_rows: rows aimed at per bucket, the unit of memory use
+    :param full_feature_names: name output columns ``<table>__<feature>``
+    :param spill_dir: directory for the temporary buckets, the system
+        temporary directory by default
+    :returns: the number of rows written
+    """
+    pa = _pyarrow()
+    spine_data = _dataset(spine)
+    sources = [(table, _dataset(table.path)) for table in tables]
+
+    schema = list(spine_data.schema)
+    joins = []
+    for table, data in sources:
+        features = _features(table, data.schema)
+        names = [
+            "{0}__{1}".format(table.name, f) if full_feature_names else f
+            for f in features
+        ]
+        schema += [data.schema.field(f).with_name(n) for f, n in zip(features, names)]
+        joins.append((table, data, features, names))
+    output_schema = pa.schema(schema)
+    duplicates = [
+        name for name, n in collections.Counter(output_schema.names).items() if n > 1
+    ]
+    if duplicates:
+        raise ValueError(
+            "duplicate output columns {0}, use full_feature_names=True".format(
+                ", ".join(duplicates)
+            )
+        )
+
+    total = spine_data.count_rows() + sum(data.count_rows() for _, data in sources)
+    count = max(1, int(math.ceil(total / float(chunk_rows))))
+
+    written = 0
+    with tempfile.TemporaryDirectory(dir=spill_dir) as directory:
+        spine_buckets = _spill(
+            spine_data,
+            spine_data.schema.names,
+            entity_key,
+            directory,
+            "spine",
+            count,
+            latest=timestamp_key,
+        )
+        latest = spine_buckets.latest
+        table_buckets = []
+        for idx, (table, data, features, _) in enumerate(joins):
+            # feature rows newer than every event cannot be joined
+            keep = None
+            if latest is not None:
+                ts_type = data.schema.field(table.timestamp_key).type
+                keep = pa.dataset.field(table.timestamp_key) <= pa.scalar(
+                    latest.as_py(), type=ts_type
+                )
+            table_buckets.append(
+                _spill(
+                    data,
+                    [table.entity_key, table.timestamp_key] + features,
+                    table.entity_key,
+                    directory,
+                    "table{0}".format(idx),
+                    count,
+                    keep=keep,
+                )
+            )
+
+        with pa.parquet.ParquetWriter(
+            output, output_schema, compression=compression
+        ) as writer:
+            for idx in range(count):
+                frame = spine_buckets.read(idx)
+                if frame is None:
+                    continue
+                frame[_TS] = _sort_key(frame[timestamp_key])
+                frame = frame.sort_values(_TS, kind="stable")
+                for (table, _, features, names), buckets in zip(joins, table_buckets):
+                    frame = _join(
+                        frame, buckets.read(idx), entity_key, table, features, names
+                    )
+                writer.write_table(
+                    pa.Table.from_pandas(
+                        frame[output_schema.names],
+                        schema=output_schema,
+                        preserve_index=False,
+                    )
+                )
+                written += len(frame)
+    return written
+
+
+def _join(frame, rows, entity_key, table, features, names):
+    if rows is None:
+        for name in names:
+            frame[name] = None
+        return frame
+    rows = rows.rename(columns=dict(zip(features, names)))
+    rows[_TS] = _sort_key(rows[table.timestamp_key])
+    rows = rows.drop(columns=[table.timestamp_key]).sort_values(_TS, kind="stable")
+    joined = pd.merge_asof(
+        frame,
+        rows.rename(columns={table.entity_key: "__pit_entity"}),
+        on=_TS,
+        left_by=entity_key,
+        right_by="__pit_entity",
+        direction="backward",
+        tolerance=pd.Timedelta(seconds=table.ttl) if table.ttl else None,
+    )
+    return joined.drop(columns=["__pit_entity"])
@@ -0,0 +1,376 @@
+"""Online serving of materialized feature views.
+
+A feature view is a named group of features keyed by one entity (a user id,
+an item id...). ``materialize`` writes the latest feature vector of every
+entity into a sqlite table keyed by entity, ``online_<view>`` with one
+column per feature, so serving a batch is one primary key lookup per entity
+reading only the requested columns, instead of a query against the offline
+source::
+
+    store = OnlineStore("online_features.db")
+    store.materialize("user_stats", df, entity_key="user_id")
+    store.get_online_features(["u1", "u2"], ["user_stats:clicks_7d", "age"])
+    # {"entity_id": ["u1", "u2"], "user_stats:clicks_7d": [3, None],
+    #  "age": [31, 25]}
+
+Features are referenced as ``view:feature``, or by name alone when a single
+view has it. Unknown entities get ``None``. Numbers are stored as they are,
+anything else (strings, booleans, lists...) as JSON text.
+
+The database is in WAL mode: lookups run on per-thread connections, in one
+read transaction per batch, and never wait for a materialization, which
+swaps the rows of a view in a single transaction.
+
+The server keeps its store in ``online_features.db`` next to the feature
+metadata, behind ``/api/features/online``.
+"""
+
+import collections
+import datetime
+import json
+import re
+import sqlite3
+import string
+import threading
+
+VIEWS_TABLE = "online_feature_views"
+FEATURES_TABLE = "online_feature_columns"
+CREATE_VIEWS_TABLE = """
+CREATE TABLE IF NOT EXISTS online_feature_views (
+    name VARCHAR(64) NOT NULL,
+    entity_key VARCHAR(64) NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    materialized_at VARCHAR(26),
+    PRIMARY KEY (name)
+)
+"""
+CREATE_FEATURES_TABLE = """
+CREATE TABLE IF NOT EXISTS online_feature_columns (
+    view VARCHAR(64) NOT NULL,
+    feature VARCHAR(64) NOT NULL,
+    PRIMARY KEY (view, feature)
+)
+"""
+VIEW_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    entity_id TEXT NOT NULL,
+    PRIMARY KEY (entity_id)
+) WITHOUT ROWID
+"""
+# sqlite builds before 3.32 allow 999 parameters per statement
+LOOKUP_CHUNK = 500
+VIEW_NAME_RE = re.compile(r"^\w{1,64}$")
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _table(view):
+    if not VIEW_NAME_RE.match(view or ""):
+        raise ValueError("invalid feature view name: {0}".format(view))
+    return "online_{0}".format(view)
+
+
+# sqlite compares column names ignoring the case of ASCII letters
+_FOLD = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _column(feature):
+    if not feature or feature.translate(_FOLD) == "entity_id":
+        raise ValueError("invalid feature name: {0!r}".format(feature))
+    return '"{0}"'.format(feature.replace('"', '""'))
+
+
+def _encode(value):
+    if value is None or type(value) in (int, float):
+        # NaN is how pandas says missing
+        return None if value != value else value
+    if hasattr(value, "item") and not hasattr(value, "__len__"):
+        # numpy scalars
+        return _encode(value.item())
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+
+def _json_default(value):
+    # numpy scalars, timestamps
+    if hasattr(value, "item"):
+        return value.item()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _records(rows):
+    if hasattr(rows, "itertuples"):
+        # pandas.DataFrame, without building every row dict up front
+        columns = [str(column) for column in rows.columns]
+        return (
+            dict(zip(columns, values))
+            for values in rows.itertuples(index=False, name=None)
+        )
+    return rows
+
+
+class OnlineStore(object):
+    def __init__(self, db_file, timeout=30):
+        """
+        :param db_file: path of the sqlite online store, created if missing
+        :param timeout: seconds a write waits for the lock of another process
+        """
+        self.db_file = db_file
+        self.timeout = timeout
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        # creates the file and the catalog before the first lookup
+        with self._write_lock:
+            self._connect_writer()
+
+    def _connect_writer(self):
+        if self._writer is None:
+            conn = sqlite3.connect(
+                self.db_file,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(CREATE_VIEWS_TABLE)
+            conn.execute(CREATE_FEATURES_TABLE)
+            self._writer = conn
+        return self._writer
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_file, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA query_only=1")
+            self._local.conn = conn
+        return conn
+
+    def materialize(
+        self, view, rows, entity_key="entity_id", replace=True, batch_size=10000
+    ):
+        """Write the feature vectors of ``rows`` into ``view``.
+
+        :param rows: mappings or a ``pandas.DataFrame``, one per entity; every
+            column but ``entity_key`` is a feature
+        :param replace: swap the whole view for ``rows``; otherwise upsert,
+            entities not in ``rows`` keep their vector
+        :param batch_size: rows encoded and inserted per ``executemany``
+        :returns: the number of rows written
+        """
+        table = _table(view)
+        written = 0
+        with self._write_lock:
+            conn = self._connect_writer()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if replace:
+                    conn.execute("DROP TABLE IF EXISTS {0}".format(table))
+                    conn.execute(
+                        "DELETE FROM online_feature_columns WHERE view = ?", (view,)
+                    )
+                conn.execute(VIEW_DDL.format(table=table))
+                columns = {
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT feature FROM online_feature_columns WHERE view = ?",
+                        (view,),
+                    )
+                }
+                batch = []
+                for row in _records(rows):
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        written += self._insert(conn, view, batch, entity_key, columns)
+                        batch = []
+                if batch:
+                    written += self._insert(conn, view, batch, entity_key, columns)
+                conn.execute(
+                    "INSERT OR REPLACE INTO online_feature_views "
+                    "(name, entity_key, rows, materialized_at) "
+                    "VALUES (?, ?, (SELECT count(*) FROM {0}), ?)".format(table),
+                    (
+                        view,
+                        entity_key,
+                        datetime.datetime.utcnow().strftime(DATETIME_FORMAT),
+                    ),
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return written
+
+    def _insert(self, conn, view, batch, entity_key, columns):
+        folded = {feature.translate(_FOLD): feature for feature in columns}
+        added = []
+        for row in batch:
+            for feature in row:
+                if feature == entity_key or feature in columns:
+                    continue
+                other = folded.setdefault(feature.translate(_FOLD), feature)
+                if other != feature:
+                    raise ValueError(
+                        "features {0!r} and {1!r} of view {2} differ only by "
+                        "case, sqlite column names do not".format(other, feature, view)
+                    )
+                _column(feature)
+                added.append(feature)
+                columns.add(feature)
+        for feature in added:
+            conn.execute(
+                "ALTER TABLE {0} ADD COLUMN {1}".format(_table(view), _column(feature))
+            )
+            conn.execute(
+                "INSERT INTO online_feature_columns (view, feature) VALUES (?, ?)",
+                (view, feature),
+            )
+        features = sorted(columns)
+        conn.executemany(
+            "INSERT OR REPLACE INTO {0} (entity_id, {1}) VALUES (?, {2})".format(
+                _table(view),
+                ", ".join(_column(feature) for feature in features),
+                ", ".join("?" * len(features)),
+            ),
+            [
+                [str(row[entity_key])]
+                + [_encode(row.get(feature)) for feature in features]
+                for row in batch
+            ],
+        )
+        return len(batch)
+
+    def drop_view(self, view):
+        table = _table(view)
+        with self._write_lock:
+            conn = self._connect_writer()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DROP TABLE IF EXISTS {0}".format(table))
+                conn.execute("DELETE FROM online_feature_views WHERE name = ?", (view,))
+                conn.execute(
+                    "DELETE FROM online_feature_columns WHERE view = ?", (view,)
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def views(self):
+        """``{view: {"entity_key", "rows", "materialized_at", "features"}}``"""
+        conn = self._reader()
+        result = collections.OrderedDict()
+        for name, entity_key, rows, materialized_at in conn.execute(
+            "SELECT name, entity_key, rows, materialized_at "
+            "FROM online_feature_views ORDER BY name"
+        ):
+            result[name] = {
+                "entity_key": entity_key,
+                "rows": rows,
+                "materialized_at": materialized_at,
+                "features": [],
+            }
+        for view, feature in conn.execute(
+            "SELECT view, feature FROM online_feature_columns ORDER BY view, feature"
+        ):
+            if view in result:
+                result[view]["features"].append(feature)
+        return result
+
+    def _resolve(self, conn, features):
+        # view -> [(reference, feature)], in the order of first use
+        bare = [ref for ref in features if ":" not in ref]
+        owners = collections.defaultdict(list)
+        if bare:
+            for view, feature in conn.execute(
+                "SELECT view, feature FROM online_feature_columns "
+                "WHERE feature IN ({0})".format(", ".join("?" * len(set(bare)))),
+                sorted(set(bare)),
+            ):
+                owners[feature].append(view)
+
+        by_view = collections.OrderedDict()
+        for ref in features:
+            if ":" in ref:
+                view, feature = ref.split(":", 1)
+            elif len(owners[ref]) == 1:
+                view, feature = owners[ref][0], ref
+            elif owners[ref]:
+                raise ValueError(
+                    "feature {0} is in several views ({1}), "
+                    "use view:feature".format(ref, ", ".join(sorted(owners[ref])))
+                )
+            else:
+                raise KeyError("unknown feature: {0}".format(ref))
+            _table(view)
+            by_view.setdefault(view, []).append((ref, feature))
+        return by_view
+
+    def get_online_features(self, entity_ids, features):
+        """Feature values of ``entity_ids``, column by column.
+
+        :param entity_ids: entity keys, converted to ``str``
+        :param features: ``view:feature`` or feature names
+        :returns: ``{"entity_id": [...], reference: [...], ...}`` with the
+            values in the order of ``entity_ids``, ``None`` when missing
+        """
+        entity_ids = [str(entity_id) for entity_id in entity_ids]
+        result = collections.OrderedDict(entity_id=entity_ids)
+        for ref in features:
+            result[ref] = [None] * len(entity_ids)
+        if not entity_ids or not features:
+            return result
+
+        positions = {}
+        for idx, entity_id in enumerate(entity_ids):
+            positions.setdefault(entity_id, []).append(idx)
+        keys = list(positions)
+
+        conn = self._reader()
+        # one snapshot across views and chunks
+        conn.execute("BEGIN")
+        try:
+            by_view = self._resolve(conn, features)
+            for view, refs in by_view.items():
+                available = {
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT feature FROM online_feature_columns WHERE view = ?",
+                        (view,),
+                    )
+                }
+                for ref, feature in refs:
+                    if feature not in available:
+                        raise KeyError("unknown feature: {0}:{1}".format(view, feature))
+                columns = [result[ref] for ref, _ in refs]
+                select = "SELECT entity_id, {0} FROM {1} WHERE entity_id IN ".format(
+                    ", ".join(_column(feature) for _, feature in refs), _table(view)
+                )
+                for start in range(0, len(keys), LOOKUP_CHUNK):
+                    chunk = keys[start : start + LOOKUP_CHUNK]
+                    for row in conn.execute(
+                        "{0}({1})".format(select, ", ".join("?" * len(chunk))), chunk
+                    ):
+                        idxs = positions[row[0]]
+                        for column, value in zip(columns, row[1:]):
+                            if type(value) is str:
+                                value = json.loads(value)
+                            for idx in idxs:
+                                column[idx] = value
+        finally:
+            conn.execute("COMMIT")
+        return result
+
+    def close(self):
+        """Close the writer and the calling thread's reader."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,210 @@
+"""Columnar export of the ``predictions`` monitoring table.
+
+Rows are read straight from sqlite with ``fetchmany`` (no ORM objects), in
+``(created_at, id)`` order and, on a partitioned database, only from the
+partitions overlapping the requested time range. Every ``row_group_size``
+rows become one Arrow record batch, written as one Parquet row group or one
+Arrow IPC (Feather v2) batch, so memory stays bounded by a single row group
+whatever the size of the export::
+
+    export("sqlite_logs.db", "predictions.parquet",
+           since=datetime.datetime(2024, 1, 1), log_type="errors")
+
+    pandas.read_parquet("predictions.parquet")
+    pyarrow.feather.read_table("predictions.arrow")
+
+Needs ``pyarrow`` (``pip install pyarrow``).
+"""
+
+import contextlib
+import os
+import pathlib
+import sqlite3
+
+from . import prediction_logger, prediction_partitions
+
+ROW_GROUP_SIZE = 65536
+FORMATS = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+COLUMNS = ("id",) + prediction_logger.COLUMNS
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "pyarrow not installed, which is needed to export predictions. "
+            "Please install it with `pip install pyarrow`."
+        )
+    return pyarrow
+
+
+def schema():
+    pa = _pyarrow()
+    return pa.schema(
+        [("id", pa.int64())]
+        + [(column, pa.string()) for column in prediction_logger.COLUMNS[:-1]]
+        + [("created_at", pa.timestamp("us"))]
+    )
+
+
+def iter_batches(
+    db_file, since=None, until=None, log_type=None, row_group_size=ROW_GROUP_SIZE
+):
+    """Yield ``pyarrow.RecordBatch`` of ``row_group_size`` rows (the last one
+    may be shorter) with the predictions created in ``[since, until)``."""
+    pa = _pyarrow()
+    arrow_schema = schema()
+    where, params = [], []
+    if since is not None:
+        where.append("created_at >= ?")
+        params.append(_format(since))
+    if until is not None:
+        where.append("created_at < ?")
+        params.append(_format(until))
+    if log_type is not None:
+        where.append("log_type = ?")
+        params.append(log_type)
+
+    def to_batch(rows):
+        columns = list(zip(*rows))
+        arrays = [
+            pa.array(values, type=field.type)
+            for values, field in zip(columns[:-1], arrow_schema)
+        ]
+        # sqlite keeps DateTime as "YYYY-MM-DD HH:MM:SS.ffffff" text
+        arrays.append(pa.array(columns[-1], type=pa.string()).cast(pa.timestamp("us")))
+        return pa.RecordBatch.from_arrays(arrays, schema=arrow_schema)
+
+    uri = "{0}?mode=ro".format(pathlib.Path(os.path.abspath(db_file)).as_uri())
+    with contextlib.closing(sqlite3.connect(uri, uri=True)) as conn:
+        rows = []
+        for partition in prediction_partitions.partitions(conn, since, until):
+            cursor = conn.execute(
+                "SELECT {0} FROM {1} {2} ORDER BY created_at, id".format(
+                    ", ".join(COLUMNS),
+                    partition.name,
+                    "WHERE " + " AND ".join(where) if where else "",
+                ),
+                params,
+            )
+            while True:
+                chunk = cursor.fetchmany(row_group_size - len(rows))
+                if not chunk:
+                    break
+                rows += chunk
+                if len(rows) == row_group_size:
+                    yield to_batch(rows)
+                    rows = []
+        if rows:
+            yield to_batch(rows)
+
+
+def _format(value):
+    if isinstance(value, str):
+        return value
+    return value.strftime(prediction_logger.DATETIME_FORMAT)
+
+
+def _writer(sink, format, compression):
+    if format not in FORMATS:
+        raise ValueError("unsupported export format: {0}".format(format))
+    pa = _pyarrow()
+    if format == "parquet":
+        return pa.parquet.ParquetWriter(sink, schema(), compression=compression)
+    return pa.ipc.new_file(
+        sink, schema(), options=pa.ipc.IpcWriteOptions(compression=compression)
+    )
+
+
+def write(sink, batches, format="parquet", compression="zstd"):
+    """Write ``batches`` to ``sink`` (a path or a writable file object) one
+    row group at a time. Returns the number of rows written."""
+    rows = 0
+    with _writer(sink, format, compression) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def export(
+    db_file,
+    sink,
+    format="parquet",
+    since=None,
+    until=None,
+    log_type=None,
+    row_group_size=ROW_GROUP_SIZE,
+    compression="zstd",
+):
+    """Export the predictions of ``db_file`` created in ``[since, until)``
+    to ``sink``. Returns the number of rows written."""
+    batches = iter_batches(
+        db_file,
+        since=since,
+        until=until,
+        log_type=log_type,
+        row_group_size=row_group_size,
+    )
+    return write(sink, batches, format=format, compression=compression)
+
+
+class _ChunkSink(object):
+    # write-only file object handing what pyarrow wrote over to a generator
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream(
+    db_file,
+    format="parquet",
+    since=None,
+    until=None,
+    log_type=None,
+    row_group_size=ROW_GROUP_SIZE,
+    compression="zstd",
+):
+    """Like ``export`` but yields the file as bytes, one row group at a time,
+    for streaming HTTP responses."""
+    batches = iter_batches(
+        db_file,
+        since=since,
+        until=until,
+        log_type=log_type,
+        row_group_size=row_group_size,
+    )
+    sink = _ChunkSink()
+    with _writer(sink, format, compression) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.drain()
+    # footer
+    yield sink.drain()
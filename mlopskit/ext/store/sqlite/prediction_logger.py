@@ -0,0 +1,288 @@
+"""Buffered, asynchronous writer for the ``predictions`` monitoring table.
+
+``PredictionLogger.log`` only puts the record on an in-memory queue; a
+background thread writes queued records with one ``executemany`` per batch
+into the model version's monitoring database (``sqlite_logs.db``), opened in
+WAL mode so the dashboard can read while predictions are being written. The
+rows match ``SPrediction`` in ``mlopskit.server.models.monitormodels``.
+Hourly counts and, when ``latency`` is passed, latency histograms are kept in
+``prediction_stats`` in the same transaction (see ``prediction_stats``). With
+``partition="day"`` or ``"week"`` rows go to time partitions that
+``retention_days`` drops as they expire (see ``prediction_partitions``).
+
+    predictions = make("db/recomserver-v1").prediction_logger()
+
+    def _predict(self, items):
+        start = time.time()
+        ...
+        predictions.log(result, items["request_id"], experiment="home",
+                        alternative="v2", latency=time.time() - start)
+"""
+
+import atexit
+import datetime
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from structlog import get_logger
+
+from . import prediction_partitions, prediction_stats
+
+logger = get_logger(__name__)
+
+TABLE = "predictions"
+COLUMNS = (
+    "experiment",
+    "predict_type",
+    "log_type",
+    "alternative",
+    "content",
+    "request_id",
+    "created_at",
+)
+# Same DDL as SQLAlchemy emits for SPrediction, so either side may create it;
+# partition tables (see ``prediction_partitions``) are created from it too.
+TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER NOT NULL,
+    experiment VARCHAR(50) NOT NULL,
+    predict_type VARCHAR(50) NOT NULL,
+    log_type VARCHAR(50) NOT NULL,
+    alternative VARCHAR(50) NOT NULL,
+    content VARCHAR(200) NOT NULL,
+    request_id VARCHAR(100) NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id)
+)
+"""
+INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_{table}_created_at_id "
+    "ON {table} (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_{table}_log_type_created_at_id "
+    "ON {table} (log_type, created_at, id)",
+)
+CREATE_TABLE = TABLE_DDL.format(table=TABLE)
+CREATE_INDEXES = tuple(ddl.format(table=TABLE) for ddl in INDEX_DDL)
+INSERT = "INSERT INTO {0} ({1}) VALUES ({2})".format(
+    TABLE, ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))
+)
+# SQLAlchemy's storage format for DateTime on SQLite
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class PredictionLogger:
+    def __init__(
+        self,
+        db_file,
+        batch_size=500,
+        flush_interval=1.0,
+        max_queue_size=100000,
+        block=False,
+        partition=None,
+        retention_days=None,
+    ):
+        """
+        :param db_file: path of the sqlite monitoring database
+        :param batch_size: maximum number of rows written per transaction
+        :param flush_interval: seconds a record may wait in the queue
+        :param max_queue_size: records buffered before new ones are dropped
+            (or, with ``block=True``, before callers wait for room)
+        :param partition: ``"day"`` or ``"week"`` to partition the database
+            by time, converting an existing ``predictions`` table
+        :param retention_days: drop partitions older than this many days
+        """
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = block
+        self.partition = partition
+        self.retention_days = retention_days
+
+        self.logged = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        self.max_queue_seconds = 0.0
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._conn = None
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="prediction-logger", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(
+        self,
+        content,
+        request_id,
+        experiment="",
+        alternative="",
+        predict_type="predict",
+        log_type="info",
+        created_at=None,
+        latency=None,
+    ):
+        """Queue one prediction record; never touches the database.
+
+        :param latency: seconds spent serving the prediction, added to the
+            hourly latency aggregates when given
+        """
+        if not isinstance(content, str):
+            content = json.dumps(content, default=str)
+        record = (
+            experiment,
+            predict_type,
+            log_type,
+            alternative,
+            content,
+            str(request_id),
+            (created_at or datetime.datetime.utcnow()).strftime(DATETIME_FORMAT),
+        )
+        try:
+            self._queue.put((time.time(), record, latency), block=self.block)
+            self.logged += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        if self.partition is not None:
+            # only applies to new databases: dropped partitions give their
+            # pages back to the file system
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps NORMAL durable against application crashes
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if self.partition is not None:
+            prediction_partitions.install(conn, self.partition)
+        elif not prediction_partitions.is_partitioned(conn):
+            conn.execute(CREATE_TABLE)
+            for ddl in CREATE_INDEXES:
+                conn.execute(ddl)
+            conn.commit()
+        prediction_stats.install(conn)
+        self._apply_retention(conn)
+        return conn
+
+    def _apply_retention(self, conn):
+        if self.retention_days is None:
+            return
+        before = datetime.datetime.utcnow() - datetime.timedelta(
+            days=self.retention_days
+        )
+        try:
+            dropped = prediction_partitions.drop_partitions(conn, before)
+        except sqlite3.Error:
+            logger.exception("Failed to drop expired prediction partitions")
+            return
+        if dropped:
+            logger.info("Dropped expired prediction partitions", partitions=dropped)
+
+    def _drain(self, timeout):
+        batch = []
+        deadline = time.time() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain(self.flush_interval)
+            if batch:
+                self._flush(batch)
+        self.flush()
+
+    def flush(self):
+        """Write every queued record now."""
+        batch = self._drain(0)
+        while batch and self._flush(batch):
+            batch = self._drain(0)
+
+    def _flush(self, batch):
+        start = time.time()
+        try:
+            with self._write_lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+                records = [record for _, record, _ in batch]
+                created = []
+                with self._conn:
+                    if prediction_partitions.is_partitioned(self._conn):
+                        created = prediction_partitions.insert(self._conn, records)
+                    else:
+                        self._conn.executemany(INSERT, records)
+                    latencies = prediction_stats.aggregate_latencies(
+                        (record[6][:13], record[2], latency)
+                        for _, record, latency in batch
+                        if latency is not None
+                    )
+                    if latencies:
+                        self._conn.executemany(
+                            prediction_stats.UPSERT_LATENCY, latencies
+                        )
+                if created:
+                    self._apply_retention(self._conn)
+        except sqlite3.OperationalError:
+            # typically "database is locked": keep the rows for the next round
+            logger.exception("Failed to write predictions, requeueing", size=len(batch))
+            for item in batch:
+                try:
+                    self._queue.put_nowait(item)
+                except queue.Full:
+                    self.dropped += 1
+            self._stop.wait(self.flush_interval)
+            return False
+        except sqlite3.Error:
+            logger.exception("Failed to write predictions, dropping", size=len(batch))
+            self.dropped += len(batch)
+            return False
+
+        end = time.time()
+        elapsed = end - start
+        self.flushed += len(batch)
+        self.batches += 1
+        self.last_flush_seconds = elapsed
+        self.total_flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.max_queue_seconds = max(self.max_queue_seconds, end - batch[0][0])
+        return True
+
+    def stats(self):
+        """Queue and flush metrics, latencies in seconds."""
+        return {
+            "queued": self._queue.qsize(),
+            "logged": self.logged,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "last_flush_seconds": self.last_flush_seconds,
+            "avg_flush_seconds": self.total_flush_seconds / max(self.batches, 1),
+            "max_flush_seconds": self.max_flush_seconds,
+            "max_queue_seconds": self.max_queue_seconds,
+        }
+
+    def close(self, timeout=None):
+        """Stop the background thread after writing every queued record."""
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join(timeout)
+        with self._write_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,416 @@
+"""Time partitioned storage of the ``predictions`` monitoring table.
+
+Once a monitoring database (``sqlite_logs.db``) is partitioned, predictions
+are written to one table per day or per week, ``predictions_YYYYMMDD`` named
+after the first day it holds, and ``predictions`` becomes a ``UNION ALL``
+view over them, so ``SPrediction`` reads and ad hoc SQL keep working. The
+ranges live in ``prediction_partitions``; queries for a time range only open
+the partitions overlapping it (see ``partitions``). Ids are handed out from
+``prediction_partitioning`` and stay unique across partitions.
+
+Other writers (``SPrediction`` inserts, ``make("db/...")``, ad hoc SQL) keep
+inserting into ``predictions``: an ``INSTEAD OF INSERT`` trigger on the view
+takes the id from ``prediction_partitioning`` and routes the row to its
+partition, or to the catch-all ``predictions_default`` when no partition
+covers its ``created_at``, as a trigger cannot create tables. Rows parked
+there are moved to partitions of their own by the next ``PredictionLogger``
+flush, ``install`` or ``drop_partitions``; until then ``partitions`` answers
+with the whole view, so readers still see every row in order.
+
+Retention drops whole partitions instead of deleting rows::
+
+    conn = sqlite3.connect("sqlite_logs.db")
+    install(conn, "week")  # moves the rows of an existing predictions table
+    drop_partitions(conn, datetime.datetime.utcnow() - datetime.timedelta(90))
+
+``PredictionLogger(db_file, partition="day", retention_days=30)`` does both
+while logging, ``mlopskit monitor_partition`` for existing databases.
+"""
+
+import bisect
+import collections
+import datetime
+
+from . import prediction_logger, prediction_stats
+
+PERIODS = ("day", "week")
+META_TABLE = "prediction_partitions"
+CREATE_META_TABLE = """
+CREATE TABLE IF NOT EXISTS prediction_partitions (
+    name VARCHAR(64) NOT NULL,
+    start_at VARCHAR(26) NOT NULL,
+    end_at VARCHAR(26) NOT NULL,
+    PRIMARY KEY (name)
+)
+"""
+# one row: the period of new partitions and the last id handed out
+CREATE_SETTINGS_TABLE = """
+CREATE TABLE IF NOT EXISTS prediction_partitioning (
+    period VARCHAR(8) NOT NULL,
+    last_id INTEGER NOT NULL
+)
+"""
+# same as prediction_logger.DATETIME_FORMAT
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# rows written through the view outside every partition
+DEFAULT_PARTITION = "predictions_default"
+DEFAULT_BOUNDS = ("0000-01-01 00:00:00.000000", "9999-12-31 23:59:59.999999")
+INSERT_TRIGGER = "predictions_insert"
+
+Partition = collections.namedtuple("Partition", ("name", "start_at", "end_at"))
+
+
+def _has_table(conn, name):
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone()
+        is not None
+    )
+
+
+def is_partitioned(conn):
+    return _has_table(conn, META_TABLE)
+
+
+def period_bounds(created_at, period):
+    """``[start, end)`` of the ``period`` holding ``created_at``."""
+    if period not in PERIODS:
+        raise ValueError("unsupported partition period: {0}".format(period))
+    start = datetime.datetime(created_at.year, created_at.month, created_at.day)
+    if period == "week":
+        start -= datetime.timedelta(days=start.weekday())
+        return start, start + datetime.timedelta(days=7)
+    return start, start + datetime.timedelta(days=1)
+
+
+def partitions(conn, since=None, until=None):
+    """Partitions overlapping ``[since, until)``, oldest first.
+
+    An unpartitioned database, or one with rows waiting in the catch-all
+    partition, has a single ``predictions`` partition with no bounds.
+    """
+    if not is_partitioned(conn) or _parked(conn):
+        return [Partition(prediction_logger.TABLE, None, None)]
+    where, params = ["name != ?"], [DEFAULT_PARTITION]
+    if since is not None:
+        where.append("end_at > ?")
+        params.append(_format(since))
+    if until is not None:
+        where.append("start_at < ?")
+        params.append(_format(until))
+    return [
+        Partition(*row)
+        for row in conn.execute(
+            "SELECT name, start_at, end_at FROM prediction_partitions WHERE {0} "
+            "ORDER BY start_at".format(" AND ".join(where)),
+            params,
+        )
+    ]
+
+
+def _registered(conn):
+    # every partition table, the catch-all included
+    return [
+        Partition(*row)
+        for row in conn.execute(
+            "SELECT name, start_at, end_at FROM prediction_partitions "
+            "ORDER BY start_at"
+        )
+    ]
+
+
+def _parked(conn):
+    # whether writes through the view left rows in the catch-all partition
+    return (
+        _has_table(conn, DEFAULT_PARTITION)
+        and conn.execute(
+            "SELECT 1 FROM {0} LIMIT 1".format(DEFAULT_PARTITION)
+        ).fetchone()
+        is not None
+    )
+
+
+def install(conn, period="day"):
+    """Partition the database behind ``conn`` by ``period``.
+
+    Rows of an existing ``predictions`` table are moved into partitions, in
+    one transaction; on a database that is already partitioned only the
+    period of new partitions changes.
+    """
+    period_bounds(datetime.datetime.utcnow(), period)
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if is_partitioned(conn):
+            conn.execute("UPDATE prediction_partitioning SET period = ?", (period,))
+            if not _has_table(conn, DEFAULT_PARTITION):
+                # partitioned before writes through the view were routed
+                _create_default(conn)
+                _refresh_view(conn)
+            else:
+                _rehome(conn)
+        else:
+            _convert(conn, period)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _convert(conn, period):
+    table = prediction_logger.TABLE
+    legacy = _has_table(conn, table)
+    conn.execute(CREATE_META_TABLE)
+    conn.execute(CREATE_SETTINGS_TABLE)
+    last_id = 0
+    if legacy:
+        last_id = conn.execute(
+            "SELECT coalesce(max(id), 0) FROM {0}".format(table)
+        ).fetchone()[0]
+    conn.execute(
+        "INSERT INTO prediction_partitioning (period, last_id) VALUES (?, ?)",
+        (period, last_id),
+    )
+    _create_default(conn, triggers=not legacy)
+
+    if legacy:
+        created = []
+        row = conn.execute("SELECT min(created_at) FROM {0}".format(table)).fetchone()
+        while row[0] is not None:
+            start, end = period_bounds(_parse(row[0]), period)
+            name = _create(conn, start, end, triggers=False)
+            conn.execute(
+                "INSERT INTO {0} SELECT * FROM {1} "
+                "WHERE created_at >= ? AND created_at < ?".format(name, table),
+                (_format(start), _format(end)),
+            )
+            created.append(name)
+            row = conn.execute(
+                "SELECT min(created_at) FROM {0} WHERE created_at >= ?".format(table),
+                (_format(end),),
+            ).fetchone()
+        # the aggregate triggers of the old table go with it
+        conn.execute("DROP TABLE {0}".format(table))
+        if _has_table(conn, prediction_stats.STATS_TABLE):
+            for name in created + [DEFAULT_PARTITION]:
+                prediction_stats.create_triggers(conn, name)
+    _refresh_view(conn)
+    if legacy and _has_table(conn, prediction_stats.STATS_TABLE):
+        prediction_stats.rebuild(conn)
+
+
+def _create(conn, start, end, triggers=True, name=None):
+    name = name or "{0}_{1}".format(prediction_logger.TABLE, start.strftime("%Y%m%d"))
+    conn.execute(prediction_logger.TABLE_DDL.format(table=name))
+    for ddl in prediction_logger.INDEX_DDL:
+        conn.execute(ddl.format(table=name))
+    if triggers and _has_table(conn, prediction_stats.STATS_TABLE):
+        prediction_stats.create_triggers(conn, name)
+    conn.execute(
+        "INSERT INTO prediction_partitions (name, start_at, end_at) VALUES (?, ?, ?)",
+        (name, _format(start), _format(end)),
+    )
+    return name
+
+
+def _create_default(conn, triggers=True):
+    _create(conn, *DEFAULT_BOUNDS, triggers=triggers, name=DEFAULT_PARTITION)
+
+
+def _refresh_view(conn):
+    existing = _registered(conn)
+    names = [partition.name for partition in existing]
+    columns = ("id",) + prediction_logger.COLUMNS
+    if names:
+        select = " UNION ALL ".join("SELECT * FROM {0}".format(name) for name in names)
+    else:
+        select = "SELECT {0} WHERE 0".format(
+            ", ".join("NULL AS {0}".format(column) for column in columns)
+        )
+    conn.execute("DROP VIEW IF EXISTS {0}".format(prediction_logger.TABLE))
+    conn.execute("CREATE VIEW {0} AS {1}".format(prediction_logger.TABLE, select))
+    if DEFAULT_PARTITION in names:
+        conn.execute(_insert_trigger(existing))
+
+
+def _insert_trigger(existing):
+    # one INSERT per partition, guarded by its bounds, then the catch-all;
+    # dropping the view drops the previous trigger
+    values = "SELECT coalesce(NEW.id, (SELECT last_id FROM prediction_partitioning)), "
+    values += ", ".join(
+        "NEW.{0}".format(column) for column in prediction_logger.COLUMNS
+    )
+    insert = "INSERT INTO {0} (id, {1}) ".format(
+        "{0}", ", ".join(prediction_logger.COLUMNS)
+    )
+    ranged = [
+        partition for partition in existing if partition.name != DEFAULT_PARTITION
+    ]
+    statements = [
+        "UPDATE prediction_partitioning SET last_id = CASE WHEN NEW.id IS NULL "
+        "THEN last_id + 1 ELSE max(last_id, NEW.id) END"
+    ]
+    for partition in ranged:
+        statements.append(
+            insert.format(partition.name)
+            + values
+            + " WHERE NEW.created_at >= '{0}' AND NEW.created_at < '{1}'".format(
+                partition.start_at, partition.end_at
+            )
+        )
+    statements.append(
+        insert.format(DEFAULT_PARTITION)
+        + values
+        + " WHERE NOT EXISTS (SELECT 1 FROM prediction_partitions WHERE name != '{0}'"
+        " AND start_at <= NEW.created_at AND end_at > NEW.created_at)".format(
+            DEFAULT_PARTITION
+        )
+    )
+    return "CREATE TRIGGER {0} INSTEAD OF INSERT ON {1} BEGIN {2}; END".format(
+        INSERT_TRIGGER, prediction_logger.TABLE, "; ".join(statements)
+    )
+
+
+def insert(conn, records):
+    """Write ``prediction_logger`` records into their partitions, creating
+    the missing ones, inside the caller's transaction. Rows parked in the
+    catch-all partition are moved along.
+
+    Returns the names of the partitions created.
+    """
+    # bumping the counter first takes the write lock before anything is read
+    conn.execute(
+        "UPDATE prediction_partitioning SET last_id = last_id + ?", (len(records),)
+    )
+    last_id = conn.execute("SELECT last_id FROM prediction_partitioning").fetchone()[0]
+    next_id = last_id - len(records) + 1
+    rows = [
+        (next_id + offset,) + tuple(record) for offset, record in enumerate(records)
+    ]
+    return _rehome(conn, rows)
+
+
+def _rehome(conn, rows=()):
+    """Write ``rows`` (id first) and the rows of the catch-all partition into
+    their partitions, creating the missing ones; the view is refreshed when
+    partitions are created. Returns their names."""
+    rows = list(rows)
+    if _parked(conn):
+        rows += conn.execute(
+            "SELECT id, {0} FROM {1}".format(
+                ", ".join(prediction_logger.COLUMNS), DEFAULT_PARTITION
+            )
+        ).fetchall()
+        conn.execute("DELETE FROM {0}".format(DEFAULT_PARTITION))
+    if not rows:
+        return []
+
+    period = conn.execute("SELECT period FROM prediction_partitioning").fetchone()[0]
+    existing = [
+        partition
+        for partition in _registered(conn)
+        if partition.name != DEFAULT_PARTITION
+    ]
+    starts = [partition.start_at for partition in existing]
+    created = []
+    routed = collections.defaultdict(list)
+    # ids come first in rows
+    created_at_idx = prediction_logger.COLUMNS.index("created_at") + 1
+    for row in rows:
+        created_at = _format(row[created_at_idx])
+        idx = bisect.bisect_right(starts, created_at) - 1
+        if idx < 0 or existing[idx].end_at <= created_at:
+            # fit the period between the neighbouring partitions, they may
+            # have been created with another period
+            start, end = period_bounds(_parse(created_at), period)
+            if idx >= 0:
+                start = max(start, _parse(existing[idx].end_at))
+            if idx + 1 < len(existing):
+                end = min(end, _parse(existing[idx + 1].start_at))
+            name = _create(conn, start, end)
+            created.append(name)
+            idx += 1
+            existing.insert(idx, Partition(name, _format(start), _format(end)))
+            starts.insert(idx, _format(start))
+        routed[existing[idx].name].append(row)
+
+    if created:
+        _refresh_view(conn)
+    for name, values in routed.items():
+        conn.executemany(
+            "INSERT INTO {0} (id, {1}) VALUES (?, {2})".format(
+                name,
+                ", ".join(prediction_logger.COLUMNS),
+                ", ".join("?" * len(prediction_logger.COLUMNS)),
+            ),
+            values,
+        )
+    return created
+
+
+def drop_partitions(conn, before):
+    """Drop the partitions holding only predictions older than ``before``,
+    with their aggregates. Returns the names of the partitions dropped."""
+    if not is_partitioned(conn):
+        return []
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _rehome(conn)
+        expired = [
+            Partition(*row)
+            for row in conn.execute(
+                "SELECT name, start_at, end_at FROM prediction_partitions "
+                "WHERE end_at <= ?",
+                (_format(before),),
+            )
+        ]
+        has_stats = _has_table(conn, prediction_stats.STATS_TABLE)
+        for partition in expired:
+            conn.execute("DROP TABLE {0}".format(partition.name))
+            conn.execute(
+                "DELETE FROM prediction_partitions WHERE name = ?", (partition.name,)
+            )
+            if has_stats:
+                conn.execute(
+                    "DELETE FROM prediction_stats WHERE hour >= ? AND hour < ?",
+                    (partition.start_at[:13], partition.end_at[:13]),
+                )
+        if expired:
+            _refresh_view(conn)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    if expired:
+        # hands the freed pages back to the file system when the database
+        # was created with auto_vacuum=INCREMENTAL, otherwise they are reused
+        conn.execute("PRAGMA incremental_vacuum")
+    return [partition.name for partition in expired]
+
+
+def truncate(conn):
+    """Delete every prediction, keeping the partitions and the view.
+
+    Deleting row by row lets the aggregate triggers count the rows out.
+    """
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for partition in _registered(conn):
+            conn.execute("DELETE FROM {0}".format(partition.name))
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _format(value):
+    if isinstance(value, str):
+        return value
+    return value.strftime(DATETIME_FORMAT)
+
+
+def _parse(value):
+    return datetime.datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,276 @@
+"""Hourly aggregates of the ``predictions`` monitoring table.
+
+Every monitoring database (``sqlite_logs.db``) belongs to one model version,
+so the aggregates are kept next to the rows they describe, one row of
+``prediction_stats`` per hour and ``log_type``. Counts are maintained by
+triggers on ``predictions`` (on each partition once the database is
+partitioned, see ``prediction_partitions``), whichever process inserts rows;
+``PredictionLogger`` adds the request latencies it was given to the same
+rows, as a count, a sum and one counter per bucket of ``LATENCY_BUCKETS``.
+
+Reading the totals of a model version is then a scan of a few rows per hour
+instead of a ``GROUP BY`` over every logged prediction::
+
+    summary("/path/to/sqlite_logs.db")
+    # {"predictions": {"info": 1200, "errors": 3},
+    #  "latency": {"count": 1203, "sum": 14.2, "buckets": [[0.005, 40], ...]}}
+
+Databases written before the aggregates existed are backfilled on first use,
+or explicitly with ``backfill`` (``mlopskit monitor_backfill``).
+"""
+
+import os
+import sqlite3
+
+STATS_TABLE = "prediction_stats"
+# upper bounds in seconds; the last bucket counts everything slower
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKET_COLUMNS = tuple(
+    "le_{0:g}ms".format(bound * 1000) for bound in LATENCY_BUCKETS
+) + ("le_inf",)
+
+CREATE_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS prediction_stats (
+    hour VARCHAR(13) NOT NULL,
+    log_type VARCHAR(50) NOT NULL,
+    predictions INTEGER NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    latency_sum FLOAT NOT NULL DEFAULT 0,
+    {0},
+    PRIMARY KEY (hour, log_type)
+)
+""".format(
+    ",\n    ".join(
+        "{0} INTEGER NOT NULL DEFAULT 0".format(column) for column in BUCKET_COLUMNS
+    )
+)
+# created_at is stored as "YYYY-MM-DD HH:MM:SS.ffffff", its first 13
+# characters are the hour
+TRIGGER_DDL = (
+    """
+CREATE TRIGGER IF NOT EXISTS {insert}
+AFTER INSERT ON {table}
+BEGIN
+    INSERT INTO prediction_stats (hour, log_type, predictions)
+    VALUES (substr(NEW.created_at, 1, 13), NEW.log_type, 1)
+    ON CONFLICT (hour, log_type) DO UPDATE SET predictions = predictions + 1;
+END
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS {delete}
+AFTER DELETE ON {table}
+BEGIN
+    UPDATE prediction_stats SET predictions = predictions - 1
+    WHERE hour = substr(OLD.created_at, 1, 13) AND log_type = OLD.log_type;
+END
+""",
+)
+UPSERT_LATENCY = """
+INSERT INTO prediction_stats (hour, log_type, latency_count, latency_sum, {0})
+VALUES (?, ?, ?, ?, {1})
+ON CONFLICT (hour, log_type) DO UPDATE SET
+    latency_count = latency_count + excluded.latency_count,
+    latency_sum = latency_sum + excluded.latency_sum,
+    {2}
+""".format(
+    ", ".join(BUCKET_COLUMNS),
+    ", ".join("?" * len(BUCKET_COLUMNS)),
+    ",\n    ".join(
+        "{0} = {0} + excluded.{0}".format(column) for column in BUCKET_COLUMNS
+    ),
+)
+BACKFILL = """
+INSERT INTO prediction_stats (hour, log_type, predictions)
+SELECT substr(created_at, 1, 13), log_type, count(*) FROM predictions
+WHERE true GROUP BY 1, 2
+ON CONFLICT (hour, log_type) DO UPDATE SET predictions = excluded.predictions
+"""
+
+
+def _has_table(conn, name):
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone()
+        is not None
+    )
+
+
+def trigger_names(table):
+    """Names of the insert and delete triggers counting the rows of ``table``."""
+    if table == "predictions":
+        return "prediction_stats_insert", "prediction_stats_delete"
+    return "{0}_stats_insert".format(table), "{0}_stats_delete".format(table)
+
+
+def create_triggers(conn, table):
+    """Count the rows inserted into and deleted from ``table``."""
+    insert, delete = trigger_names(table)
+    for ddl in TRIGGER_DDL:
+        conn.execute(ddl.format(table=table, insert=insert, delete=delete))
+
+
+def _tables(conn):
+    # the plain predictions table, or the partitions behind the view
+    if _has_table(conn, "predictions"):
+        return ["predictions"]
+    if _has_table(conn, "prediction_partitions"):
+        return [
+            row[0] for row in conn.execute("SELECT name FROM prediction_partitions")
+        ]
+    return None
+
+
+def rebuild(conn):
+    """Recount ``predictions`` into the aggregates, inside the caller's
+    transaction; latency aggregates are kept."""
+    conn.execute("UPDATE prediction_stats SET predictions = 0")
+    conn.execute(BACKFILL)
+    conn.execute(
+        "DELETE FROM prediction_stats WHERE predictions = 0 AND latency_count = 0"
+    )
+
+
+def install(conn):
+    """Create the aggregate table and its triggers on an open connection,
+    backfilling the counts of the rows already logged.
+
+    Returns False when the database has no predictions yet.
+    """
+    tables = _tables(conn)
+    if tables is None:
+        return False
+    triggers = {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+    }
+    if _has_table(conn, STATS_TABLE) and triggers.issuperset(
+        name for table in tables for name in trigger_names(table)
+    ):
+        return True
+
+    # take the write lock first so no row lands between the backfill and
+    # the triggers
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(CREATE_STATS_TABLE)
+        for table in _tables(conn):
+            create_triggers(conn, table)
+        rebuild(conn)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return True
+
+
+def backfill(db_file):
+    """Recount the predictions of ``db_file`` per hour and log type.
+
+    Latency aggregates are kept, they cannot be recovered from the rows.
+    Returns the number of predictions counted.
+    """
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        if not install(conn):
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rebuild(conn)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        return conn.execute(
+            "SELECT coalesce(sum(predictions), 0) FROM prediction_stats"
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def aggregate_latencies(rows):
+    """Fold ``(hour, log_type, latency)`` tuples into ``UPSERT_LATENCY``
+    parameters, one per hour and log type."""
+    totals = {}
+    for hour, log_type, latency in rows:
+        entry = totals.get((hour, log_type))
+        if entry is None:
+            entry = totals[(hour, log_type)] = [0, 0.0] + [0] * len(BUCKET_COLUMNS)
+        entry[0] += 1
+        entry[1] += latency
+        for idx, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                break
+        else:
+            idx = len(LATENCY_BUCKETS)
+        entry[2 + idx] += 1
+    return [key + tuple(entry) for key, entry in totals.items()]
+
+
+def summary(db_file, since=None, until=None):
+    """Prediction counts per log type and the latency histogram of
+    ``db_file``, optionally restricted to the hours in ``[since, until]``
+    (``datetime`` or ``"YYYY-MM-DD HH"``)."""
+    result = {
+        "predictions": {},
+        "latency": {
+            "count": 0,
+            "sum": 0.0,
+            "buckets": [[bound, 0] for bound in LATENCY_BUCKETS + (None,)],
+        },
+    }
+    if not os.path.exists(db_file):
+        return result
+
+    where, params = [], []
+    if since is not None:
+        where.append("hour >= ?")
+        params.append(_hour(since))
+    if until is not None:
+        where.append("hour <= ?")
+        params.append(_hour(until))
+
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        if not install(conn):
+            return result
+        rows = conn.execute(
+            "SELECT log_type, sum(predictions), sum(latency_count), "
+            "sum(latency_sum), {0} FROM prediction_stats {1} GROUP BY log_type".format(
+                ", ".join("sum({0})".format(column) for column in BUCKET_COLUMNS),
+                "WHERE " + " AND ".join(where) if where else "",
+            ),
+            params,
+        ).fetchall()
+    finally:
+        conn.close()
+
+    latency = result["latency"]
+    for row in rows:
+        log_type, predictions, count, total = row[:4]
+        if predictions:
+            result["predictions"][log_type] = predictions
+        latency["count"] += count
+        latency["sum"] += total
+        for bucket, value in zip(latency["buckets"], row[4:]):
+            bucket[1] += value
+    return result
+
+
+def quantile(latency, q):
+    """Upper bound of the bucket holding the ``q`` quantile of a ``summary``
+    latency histogram, None when nothing was recorded or it is unbounded."""
+    rank = q * latency["count"]
+    seen = 0
+    for bound, count in latency["buckets"]:
+        seen += count
+        if count and seen >= rank:
+            return bound
+    return None
+
+
+def _hour(value):
+    if isinstance(value, str):
+        return value[:13]
+    return value.strftime("%Y-%m-%d %H")
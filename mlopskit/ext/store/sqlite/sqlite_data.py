@@ -2,10 +2,10 @@ import os
 from typing import Optional
 from dotenv import load_dotenv
 from sqlmodel import create_engine, SQLModel, Session, Field
+from sqlalchemy.engine import make_url
 from mlopskit.utils.file_utils import path_to_local_sqlite_uri
 from datetime import datetime
 
-
 SQLALCHEMY_DATABASE_URL = os.getenv(
     "SQLALCHEMY_DATABASE_URL", path_to_local_sqlite_uri("sql_app.db")
 )
@@ -49,6 +49,26 @@ class SQLiteData:
                 w = dict(row._mapping.items())
                 yield (w)
 
+    def prediction_logger(self, **kwargs):
+        """A ``PredictionLogger`` writing to this database in the background."""
+        from .prediction_logger import PredictionLogger
+
+        return PredictionLogger(make_url(self.db_url).database, **kwargs)
+
+    def export_predictions(self, sink, **kwargs):
+        """Write the predictions of this database to a Parquet or Arrow file,
+        see ``prediction_export.export``."""
+        from .prediction_export import export
+
+        return export(make_url(self.db_url).database, sink, **kwargs)
+
+    def online_features(self, **kwargs):
+        """An ``OnlineStore`` serving the feature views materialized into
+        this database."""
+        from .online_features import OnlineStore
+
+        return OnlineStore(make_url(self.db_url).database, **kwargs)
+
 
 class BaseModel(SQLModel):
     id: Optional[int] = Field(default=None, primary_key=True)
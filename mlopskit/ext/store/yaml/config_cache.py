@@ -0,0 +1,120 @@
+"""Parsed YAML configs, cached per file.
+
+Configs are read on hot paths (``make("config/...")`` per request, helpers
+such as ``create_log_path``), and PyYAML's pure-Python parser is slow on
+large files. ``ConfigCache`` keeps each parsed document keyed by its path
+and checks the file's ``st_mtime_ns``, size and inode on every load: an
+unchanged file costs one ``stat`` and a dict lookup, a rewritten file is
+parsed again. Parsing uses libyaml's ``CSafeLoader`` when PyYAML was built
+with it.
+
+The documents are shared, so they are handed out as immutable views:
+``ConfigView`` (a ``dict``) and tuples in place of lists. ``thaw`` returns a
+mutable copy::
+
+    config = CONFIGS.load("~/.mlopskit/mlops_config.yml")
+    config["mlflow_url"]          # reads as a dict
+    config["mlflow_url"] = "..."  # TypeError
+    config = thaw(config)         # plain dicts and lists
+
+A file changed twice within ``RACY_SECONDS`` with the same size could keep
+its mtime, so documents parsed that soon after a change are parsed again on
+the next load.
+"""
+
+import os
+import threading
+import time
+
+import yaml
+
+# libyaml bindings, about ten times faster than the pure-Python parser
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+RACY_SECONDS = 2.0
+
+
+class ConfigView(dict):
+    """A read-only ``dict`` of a cached config."""
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("config views are read-only, use thaw() for a copy")
+
+    __setitem__ = _immutable
+    __delitem__ = _immutable
+    clear = _immutable
+    pop = _immutable
+    popitem = _immutable
+    setdefault = _immutable
+    update = _immutable
+    __ior__ = _immutable
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
+def freeze(value):
+    """Read-only view of a parsed YAML document."""
+    if isinstance(value, dict):
+        return ConfigView((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Mutable copy of a document or view: plain dicts and lists."""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+class ConfigCache:
+    def __init__(self, max_files=256):
+        """
+        :param max_files: documents kept, the oldest parsed first out
+        """
+        self.max_files = max_files
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """Read-only view of the YAML document in ``path``.
+
+        :raises FileNotFoundError: when ``path`` does not exist
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        info = os.stat(path)
+        stamp = (info.st_mtime_ns, info.st_size, info.st_ino)
+        cached = self._documents.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        parsed_at = time.time()
+        with open(path, "rb") as f:
+            document = freeze(yaml.load(f, Loader=Loader))
+        if parsed_at - info.st_mtime_ns / 1e9 > RACY_SECONDS:
+            with self._lock:
+                self._documents.pop(path, None)
+                self._documents[path] = (stamp, document)
+                while len(self._documents) > self.max_files:
+                    del self._documents[next(iter(self._documents))]
+        return document
+
+    def invalidate(self, path=None):
+        """Forget ``path``, every document by default."""
+        with self._lock:
+            if path is None:
+                self._documents.clear()
+            else:
+                self._documents.pop(os.path.abspath(os.path.expanduser(path)), None)
+
+
+CONFIGS = ConfigCache()
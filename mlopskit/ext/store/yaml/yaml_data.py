@@ -1,6 +1,8 @@
 """``YAMLDataSet`` loads/saves data from/to a YAML file using an underlying
 filesystem (e.g.: local, S3, GCS). It uses PyYAML to handle the YAML file.
+Local files are parsed once per change, see ``config_cache``.
 """
+
 from copy import deepcopy
 from pathlib import PurePosixPath
 from typing import Any, Dict, Union
@@ -17,6 +19,8 @@ from mlopskit.io.core import (
     get_protocol_and_path,
 )
 
+from .config_cache import CONFIGS, Loader, thaw
+
 
 class YAMLDataSet(AbstractVersionedDataSet):
     """``YAMLDataSet`` loads/saves data from/to a YAML file using an underlying
@@ -110,14 +114,21 @@ class YAMLDataSet(AbstractVersionedDataSet):
     def _load(self) -> Dict:
         load_path = get_filepath_str(self._get_load_path(), self._protocol)
 
+        if self._protocol == "file" and not self._fs_open_args_load:
+            # parsed once per change of the file; callers may modify the
+            # result, so they get their own copy
+            return thaw(CONFIGS.load(load_path))
+
         with self._fs.open(load_path, **self._fs_open_args_load) as fs_file:
-            return yaml.safe_load(fs_file)
+            return yaml.load(fs_file, Loader=Loader)
 
     def _save(self, data: Union[Dict, pd.DataFrame]) -> None:
         save_path = get_filepath_str(self._get_save_path(), self._protocol)
 
         if isinstance(data, pd.DataFrame):
             data = data.to_dict()
+        # cached config views dump as plain mappings
+        data = thaw(data)
 
         with self._fs.open(save_path, **self._fs_open_args_save) as fs_file:
             yaml.dump(data, fs_file, **self._save_args)
@@ -140,3 +151,5 @@ class YAMLDataSet(AbstractVersionedDataSet):
         """Invalidate underlying filesystem caches."""
         filepath = get_filepath_str(self._filepath, self._protocol)
         self._fs.invalidate_cache(filepath)
+        if self._protocol == "file":
+            CONFIGS.invalidate(filepath)
@@ -17,11 +17,19 @@ class RecomServer(Model):
         # 创建日志路径
         self.recom_logs_path = create_log_path("{{model_name}}", "recom_errors")
         self.recom_logs_debug = create_log_path("{{model_name}}", "recom_debugs")
-        self.debug_db = make("cache/feature_store-v1", db_name="debug_tests.db")
-
-        self.model_db = make(
-            "cache/{{model_name}}-v{{version}}", db_name="{{model_name}}.db"
-        )
+        # open the stores now, so a missing model fails at load time
+        self.debug_db
+        self.model_db
+
+    # looked up on use: make() shares one handle per process, and workers
+    # forked after _load (gunicorn --preload) open their own
+    @property
+    def debug_db(self):
+        return make("cache/feature_store-v1", db_name="debug_tests.db")
+
+    @property
+    def model_db(self):
+        return make("cache/{{model_name}}-v{{version}}", db_name="{{model_name}}.db")
 
     def _predict(self, items):
         uid = items.get("uid")
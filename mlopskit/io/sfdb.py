@@ -15,15 +15,24 @@ def log(*args, **kwargs):
 
 
 class Database:
+    # WAL journal: one writer connection behind the lock, and one read-only
+    # connection per thread that does not wait for it. Writes are batched in
+    # one transaction, committed before a read so that it sees them; scans
+    # read a snapshot.
     def __init__(self, filename):
         self._filename = filename
-        self._sqlite = sqlite3.connect(self._filename, check_same_thread=False)
+        self._sqlite = sqlite3.connect(
+            self._filename, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._sqlite.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps NORMAL durable against application crashes
+        self._sqlite.execute("PRAGMA synchronous=NORMAL")
         self._sqlite.execute(
             "CREATE TABLE IF NOT EXISTS DATA(ID TEXT NOT NULL UNIQUE, TIME TEXT NOT NULL, JSON TEXT NOT NULL, PRIMARY KEY (ID))"
         )
-        self._sqlite.commit()
         self._lock = threading.Lock()
-        self._iterating = False
+        self._local = threading.local()
+        self._readers = {}
         self._commit_timer = time.time()
         self._commit_counter = 0
         log(f"SFDB[{self._filename}] Database ready with {len(self)} rows.")
@@ -32,28 +41,57 @@ class Database:
         assert (
             self._sqlite is not None
         ), f"SFDB[{self._filename}] Database already closed."
-        assert (
-            not self._iterating
-        ), f"SFDB[{self._filename}] Database cannot be accessed inside an iterating loop."
 
     def _key_is_str(self, key):
         assert isinstance(
             key, str
         ), f'SFDB[{self._filename}] All keys must be str, get "{type(key).__name__}" instead.'
 
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self._filename,
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA query_only=1")
+            self._local.conn = conn
+            with self._lock:
+                # threads come and go in request handlers, drop their readers
+                for thread in [t for t in self._readers if not t.is_alive()]:
+                    self._readers.pop(thread).close()
+                self._readers[threading.current_thread()] = conn
+        return conn
+
+    def _flush(self):
+        # readers only see committed writes
+        if self._sqlite.in_transaction:
+            with self._lock:
+                if self._sqlite.in_transaction:
+                    self._sqlite.execute("COMMIT")
+
+    def _write(self, sql, params):
+        with self._lock:
+            if not self._sqlite.in_transaction:
+                self._sqlite.execute("BEGIN")
+            self._sqlite.execute(sql, params)
+            self._commit_counter += 1
+
+    def _fetchone(self, sql, params=()):
+        self._flush()
+        return self._reader().execute(sql, params).fetchone()
+
     def __len__(self):
         self._sanity_check()
-        with self._lock:
-            x = self._sqlite.execute("SELECT COUNT(ID) FROM DATA").fetchone()
-            return x[0] if x is not None else 0
+        x = self._fetchone("SELECT COUNT(ID) FROM DATA")
+        return x[0] if x is not None else 0
 
     def __getitem__(self, key):
         self._sanity_check()
         self._key_is_str(key)
-        with self._lock:
-            item = self._sqlite.execute(
-                "SELECT JSON FROM DATA WHERE ID = ?", (key,)
-            ).fetchone()
+        item = self._fetchone("SELECT JSON FROM DATA WHERE ID = ?", (key,))
         if item is None:
             raise KeyError(key)
         return json.loads(item[0])
@@ -61,41 +99,26 @@ class Database:
     def get(self, key, default=None):
         self._sanity_check()
         self._key_is_str(key)
-        with self._lock:
-            item = self._sqlite.execute(
-                "SELECT JSON FROM DATA WHERE ID = ?", (key,)
-            ).fetchone()
+        item = self._fetchone("SELECT JSON FROM DATA WHERE ID = ?", (key,))
         return json.loads(item[0]) if item is not None else default
 
     def __contains__(self, key):
         self._sanity_check()
         self._key_is_str(key)
-        with self._lock:
-            return (
-                self._sqlite.execute(
-                    "SELECT 1 FROM DATA WHERE ID = ?", (key,)
-                ).fetchone()
-                is not None
-            )
+        return self._fetchone("SELECT 1 FROM DATA WHERE ID = ?", (key,)) is not None
 
     def __setitem__(self, key, value):
         self._sanity_check()
         self._key_is_str(key)
         feed = (key, now(), json.dumps(value))
-        with self._lock:
-            self._sqlite.execute(
-                "INSERT OR REPLACE INTO DATA(ID, TIME, JSON) VALUES(?, ?, ?)", feed
-            )
-            self._commit_counter += 1
+        self._write("INSERT OR REPLACE INTO DATA(ID, TIME, JSON) VALUES(?, ?, ?)", feed)
         self._auto_commit()
         return
 
     def __delitem__(self, key):
         self._sanity_check()
         self._key_is_str(key)
-        with self._lock:
-            self._sqlite.execute("DELETE FROM DATA WHERE ID = ?", (key,))
-            self._commit_counter += 1
+        self._write("DELETE FROM DATA WHERE ID = ?", (key,))
         self._auto_commit()
         return
 
@@ -118,7 +141,8 @@ class Database:
     def commit(self):
         self._sanity_check()
         with self._lock:
-            self._sqlite.commit()
+            if self._sqlite.in_transaction:
+                self._sqlite.execute("COMMIT")
             log(
                 f'SFDB[{self._filename}] Committed {self._commit_counter} transactions during the last {"%.2f" % (time.time() - self._commit_timer)} seconds.'
             )
@@ -127,45 +151,47 @@ class Database:
         return
 
     def close(self):
-        if self._sqlite is None:
+        if getattr(self, "_sqlite", None) is None:
             return
-        self._sanity_check()
         self.commit()
         with self._lock:
+            for conn in self._readers.values():
+                conn.close()
+            self._readers = {}
             self._sqlite.close()
             self._sqlite = None
             log(f"SFDB[{self._filename}] Database connection closed.")
         return
 
+    def _snapshot(self, sql):
+        # one read statement: a consistent snapshot, writes go on meanwhile
+        self._sanity_check()
+        self._flush()
+        return self._reader().execute(sql)
+
     def __iter__(self):
+        # a connection of its own: the loop body may read and write, and see
+        # its writes, while the loop goes on over the snapshot
         self._sanity_check()
-        with self._lock:
-            try:
-                self._iterating = True
-                for item in self._sqlite.execute("SELECT ID, JSON FROM DATA"):
-                    yield item[0], json.loads(item[1])
-            finally:
-                self._iterating = False
+        self._flush()
+        conn = sqlite3.connect(self._filename, timeout=30, isolation_level=None)
+        try:
+            for item in conn.execute("SELECT ID, JSON FROM DATA"):
+                yield item[0], json.loads(item[1])
+        finally:
+            conn.close()
 
     def keys(self):
-        self._sanity_check()
-        with self._lock:
-            return [
-                x[0] for x in self._sqlite.execute("SELECT ID FROM DATA").fetchall()
-            ]
+        return [x[0] for x in self._snapshot("SELECT ID FROM DATA").fetchall()]
 
     def todict(self):
-        self._sanity_check()
-        with self._lock:
-            return {
-                x[0]: json.loads(x[1])
-                for x in self._sqlite.execute("SELECT ID, JSON FROM DATA").fetchall()
-            }
+        return {
+            x[0]: json.loads(x[1])
+            for x in self._snapshot("SELECT ID, JSON FROM DATA").fetchall()
+        }
 
     def tolist(self):
-        self._sanity_check()
-        with self._lock:
-            return [
-                (x[0], json.loads(x[1]))
-                for x in self._sqlite.execute("SELECT ID, JSON FROM DATA").fetchall()
-            ]
+        return [
+            (x[0], json.loads(x[1]))
+            for x in self._snapshot("SELECT ID, JSON FROM DATA").fetchall()
+        ]
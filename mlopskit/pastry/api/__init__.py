@@ -1 +1,2 @@
 from .registration import make
+from .handles import close_handles
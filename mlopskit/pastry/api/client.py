@@ -11,6 +11,7 @@ from mlopskit.utils.file_utils import (
     path_to_local_sqlite_uri,
 )
 from mlopskit.ext.store.yaml.yaml_data import YAMLDataSet
+from mlopskit.ext.store.yaml.config_cache import CONFIGS, freeze
 from mlopskit.ext.store.sqlite.sqlite_data import SQLiteData
 from mlopskit.pastry.mlflow_rest_client import MLflowRESTClient
 from mlopskit.io import sfdb
@@ -58,7 +59,7 @@ class HTTPClient(SDK):
         if config_file is None:
             self.config_file = default_config
 
-        self.config = YAMLDataSet(self.config_file).load()
+        self.config = CONFIGS.load(self.config_file)
 
         model_url = self.config.get("model_url")
         mlflow_url = self.config.get("mlflow_url")
@@ -202,19 +203,20 @@ class HTTPClient(SDK):
         yam_engine.save(config_content)
 
     def get_config(self, config_path=None):
+        """Read-only view of the config, parsed once per change of the file."""
         default_config = self.config_file
         if config_path:
             path = pathlib.Path(config_path)
             if path.is_file():
-                yam_engine = YAMLDataSet(config_path)
+                config_file = config_path
             else:
-                yam_engine = YAMLDataSet(os.path.join(config_path, "mlops_config.yml"))
+                config_file = os.path.join(config_path, "mlops_config.yml")
         else:
-            yam_engine = YAMLDataSet(default_config)
+            config_file = default_config
         try:
-            config = yam_engine.load()
+            config = CONFIGS.load(config_file)
         except:
-            config = DEFAULT_SERVER_CONFIG
+            config = freeze(DEFAULT_SERVER_CONFIG)
 
         return config
 
@@ -267,14 +269,21 @@ class HTTPClient(SDK):
             db[model_key] = meta
 
     def build_data_store(
-        self, name, version, db_name=None, db_type="sqlite", return_type="dbobj"
+        self,
+        name,
+        version,
+        db_name=None,
+        db_type="sqlite",
+        return_type="dbobj",
+        source=None,
     ):
         VALID_DB_TYPES = ("sqlite", "postgres")
         assert (
             db_type in VALID_DB_TYPES
         ), f"DB cache type {db_type} not supported. Valid db types are {VALID_DB_TYPES}"
         db_base_path = self.mlflow_art_path
-        source = self.mlflow_client.get_model_version_download_url(name, version)
+        if source is None:
+            source = self.mlflow_client.get_model_version_download_url(name, version)
         (path, filename) = os.path.split(source)
 
         if db_name is None:
@@ -297,6 +306,7 @@ class HTTPClient(SDK):
         db_name="rlite_model.cache",
         db_type="rlite",
         return_type="dbobj",
+        source=None,
     ):
         VALID_DB_TYPES = ("rlite", "redis", "diskcache", "sfdb")
         assert (
@@ -307,7 +317,9 @@ class HTTPClient(SDK):
             return_type in VALID_RETURN_TYPES
         ), f"Return type {return_type} not supported. Valid return types are {VALID_RETURN_TYPES}"
         db_base_path = self.mlflow_art_path
-        source = self.mlflow_client.get_model_version_download_url(name, version)
+        # source: the version's artifact path when already resolved
+        if source is None:
+            source = self.mlflow_client.get_model_version_download_url(name, version)
         (path, filename) = os.path.split(source)
         db_file = os.path.join(db_base_path, path, db_name)
         if db_type == "rlite":
@@ -0,0 +1,128 @@
+"""Process-wide registry of the clients and stores built by `make`.
+
+`make("cache/recomserver-v1")` builds an `HTTPClient` (a YAML load, a REST
+client and an HTTP session), asks the tracking server about the model and
+opens the store file. Serving code calls it from every worker and helpers
+call `make("config/...")` again and again, so the handles are kept here, one
+per (namespace, name, version, environment), and built once per process:
+
+    db = make("cache/recomserver-v1", db_name="recom.db")   # built
+    db = make("cache/recomserver-v1", db_name="recom.db")   # same object
+    make("cache/recomserver-v1", db_name="recom.db", shared=False)  # new one
+
+Handles are not carried across `fork`: the child starts with an empty
+registry and reopens what it uses, since sqlite connections, rlite handles
+and HTTP sessions must not be shared between processes. `close_handles`
+closes the handles explicitly; it also runs at exit.
+"""
+
+import atexit
+import os
+import threading
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class HandleRegistry:
+    def __init__(self):
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # handles of parent processes, see _after_fork
+        self._inherited = []
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._after_fork()
+
+    def _after_fork(self):
+        # handles of the parent process are set aside, never closed nor
+        # garbage collected: their finalizers would close the parent's
+        # connections from the child
+        if self._handles:
+            self._inherited.append(self._handles)
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Returns the handle registered under `key`, None when there is none."""
+        self._check_fork()
+        return self._handles.get(key)
+
+    def put(self, key: Hashable, handle: Any) -> Any:
+        """Registers `handle` under `key` unless another thread did first.
+        Returns:
+            The registered handle; `handle` is closed when it lost the race
+        """
+        self._check_fork()
+        with self._lock:
+            registered = self._handles.setdefault(key, handle)
+        if registered is not handle:
+            _close(handle)
+        return registered
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Returns the handle of `key`, built with `factory()` on first use.
+        `None` results are not registered."""
+        handle = self.peek(key)
+        if handle is None:
+            handle = factory()
+            if handle is not None:
+                handle = self.put(key, handle)
+        return handle
+
+    def close(self, key: Optional[Hashable] = None) -> None:
+        """Closes and forgets the handle of `key`, every handle by default."""
+        self.close_matching(lambda k: key is None or k == key)
+
+    def close_matching(self, match: Callable[[Hashable], bool]) -> None:
+        """Closes and forgets the handles whose key satisfies `match`."""
+        self._check_fork()
+        with self._lock:
+            keys = [key for key in self._handles if match(key)]
+            handles = [self._handles.pop(key) for key in keys]
+        for handle in handles:
+            _close(handle)
+
+    def __len__(self):
+        self._check_fork()
+        return len(self._handles)
+
+
+def _close(handle):
+    close = getattr(handle, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def handle_key(
+    namespace: str, name: str, version: Optional[str], env: dict
+) -> Tuple[Hashable, ...]:
+    """Key of a handle built by `make` with the keyword arguments `env`."""
+    return (namespace, name, version, tuple(sorted(env.items())))
+
+
+HANDLES = HandleRegistry()
+if hasattr(os, "register_at_fork"):
+    # also resets the lock, which may be held by another thread at fork time
+    os.register_at_fork(after_in_child=HANDLES._after_fork)
+atexit.register(HANDLES.close)
+
+
+def close_handles(id: Optional[str] = None) -> None:
+    """Closes the handles built by `make`.
+    Args:
+        id: `"cache/<name>-v<version>"` to close the stores of that model
+            version, whatever their `db_name`; every handle when omitted
+    """
+    if id is None:
+        HANDLES.close()
+        return
+    from .registration import parse_env_id
+
+    ns, name, version = parse_env_id(id)
+    version = None if version is None else str(version)
+    HANDLES.close_matching(lambda key: key[:3] == (ns, name, version))
@@ -0,0 +1,158 @@
+"""Local manifest of what `make` resolved against the tracking server.
+
+Before building a store, `make("cache/<name>-v<version>")` asks the
+tracking server whether the model exists, which versions it has and where
+the version's artifacts are. Those answers are kept in a JSON manifest in
+the mlopskit home directory (`make_manifest.json`, see `data_dir`):
+
+* the versions of a model are trusted for `MLOPSKIT_MANIFEST_TTL_S`
+  seconds (300 by default), then asked for again;
+* the artifact path of a version never changes once registered and is
+  kept until the model is pushed again;
+* when the tracking server cannot be reached, expired entries are used
+  with a warning rather than failing;
+* with `MLOPSKIT_OFFLINE=1` (or `make(..., offline=True)`) the tracking
+  server is never called: entries are used whatever their age and a
+  model missing from the manifest is an error.
+
+Resolve once while online (`make("cache/recomserver-v1")` or
+`mlopskit.pastry.api.manifest.MANIFEST.record(...)`), and services keep
+starting when the tracking server is slow or down.
+
+The manifest is read again only when its file changes; writes replace the
+file atomically, merged with what other processes wrote meanwhile.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from mlopskit.utils.file_utils import data_dir
+
+MANIFEST_FILE = "make_manifest.json"
+DEFAULT_TTL = 300
+OFFLINE_ENV = "MLOPSKIT_OFFLINE"
+TTL_ENV = "MLOPSKIT_MANIFEST_TTL_S"
+
+
+def offline_mode(offline: Optional[bool] = None) -> bool:
+    """Whether `make` must resolve from the manifest only."""
+    if offline is not None:
+        return bool(offline)
+    return os.environ.get(OFFLINE_ENV, "").lower() in ("1", "true", "yes")
+
+
+class Manifest:
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            path: manifest file, `make_manifest.json` in `data_dir()` by default
+            ttl: seconds the versions of a model are trusted,
+                `MLOPSKIT_MANIFEST_TTL_S` or 300 by default
+        """
+        self.path = path or os.path.join(data_dir(), MANIFEST_FILE)
+        self.ttl = float(
+            ttl if ttl is not None else os.environ.get(TTL_ENV, DEFAULT_TTL)
+        )
+        self._models: Dict[str, dict] = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, dict]:
+        # one stat per lookup, the file is parsed again only when it changed
+        try:
+            info = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+        stamp = (info.st_mtime_ns, info.st_size, info.st_ino)
+        if stamp != self._stamp:
+            try:
+                with open(self.path) as f:
+                    models = json.load(f)
+            except (OSError, ValueError):
+                # being replaced or corrupted, resolve online this time
+                return self._models
+            self._models, self._stamp = models, stamp
+        return self._models
+
+    def versions(
+        self, name: str, max_age: Optional[float] = None
+    ) -> Optional[List[int]]:
+        """Returns the recorded versions of model `name`, None when they are
+        unknown or older than `max_age` seconds."""
+        with self._lock:
+            entry = self._read().get(name)
+        if entry is None or "versions" not in entry:
+            return None
+        if max_age is not None and time.time() - entry["resolved_at"] > max_age:
+            return None
+        return entry["versions"]
+
+    def resolved_at(self, name: str) -> Optional[float]:
+        with self._lock:
+            entry = self._read().get(name)
+        return None if entry is None else entry.get("resolved_at")
+
+    def source(self, name: str, version) -> Optional[str]:
+        """Returns the recorded artifact path of `version` of model `name`."""
+        with self._lock:
+            entry = self._read().get(name)
+        if entry is None:
+            return None
+        return entry.get("sources", {}).get(str(version))
+
+    def record(
+        self,
+        name: str,
+        versions: Optional[List[int]] = None,
+        version=None,
+        source: Optional[str] = None,
+    ) -> None:
+        """Records the versions of model `name` and/or the artifact path
+        `source` of one of its `version`s."""
+
+        def update(entry):
+            if versions is not None:
+                entry["versions"] = sorted(int(v) for v in versions)
+                entry["resolved_at"] = time.time()
+            if source is not None:
+                entry.setdefault("sources", {})[str(version)] = source
+
+        self._write(name, update)
+
+    def forget(self, name: Optional[str] = None) -> None:
+        """Drops model `name`, every model by default."""
+        self._write(name, None)
+
+    def _write(self, name, update):
+        with self._lock:
+            # merge with the latest file, other processes write to it too
+            models = dict(self._read())
+            if update is None:
+                if name is None:
+                    models = {}
+                else:
+                    models.pop(name, None)
+            else:
+                entry = dict(models.get(name, {}))
+                entry["sources"] = dict(entry.get("sources", {}))
+                update(entry)
+                models[name] = entry
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".make_manifest")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(models, f, sort_keys=True)
+                os.replace(tmp, self.path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            self._models, self._stamp = models, None
+
+
+MANIFEST = Manifest()
@@ -5,6 +5,8 @@ import re
 import os
 from dataclasses import dataclass, field
 from .client import HTTPClient
+from .handles import HANDLES, handle_key
+from .manifest import MANIFEST, OFFLINE_ENV, offline_mode
 from mlopskit.pastry.utils import create_structure
 
 # from mlopskit.utils import logger
@@ -16,6 +18,7 @@ from typing import (
 )
 
 import datetime
+import time
 import pytz
 
 from mlopskit.pastry.api import error
@@ -130,6 +133,21 @@ class EnvSpec:
         return make(self, **kwargs)
 
 
+def _version_source(client: HTTPClient, name: str, version: str, offline: bool) -> str:
+    """Artifact path of a model version, from the manifest when recorded."""
+    source = MANIFEST.source(name, version)
+    if source is None:
+        if offline:
+            raise error.Error(
+                f"The artifact path of model {name} version {version} is not in "
+                f"the local manifest {MANIFEST.path}; resolve it once online "
+                f"before using offline mode."
+            )
+        source = client.mlflow_client.get_model_version_download_url(name, version)
+        MANIFEST.record(name, version=version, source=source)
+    return source
+
+
 # return_type = ["dbobj", "dblink"]
 def make(
     id: Union[str, EnvSpec] = None,
@@ -163,8 +181,11 @@ def make(
         _kwargs = kwargs.copy()
         host = _kwargs.get("host")
         config = _kwargs.get("config")
+        # clients and cache stores are built once per process, see handles.py
+        shared = _kwargs.pop("shared", True)
+        # resolve from the local manifest only, see manifest.py
+        offline = offline_mode(_kwargs.pop("offline", None))
 
-        client = HTTPClient(host=host, config_file=config)
         if id.startswith("client") and id.endswith("client"):
             p = {"host": "set/get, default:get", "config": "config file, default:None"}
             logger.info(
@@ -188,26 +209,82 @@ def make(
             return
         if version:
             version = str(version)
+        if ns == "cache" and shared and not help:
+            cache_key = handle_key(
+                ns,
+                name,
+                version,
+                {
+                    "host": host,
+                    "config": config,
+                    "db_name": _kwargs.get("db_name", "rlite_model.cache"),
+                    "db_type": _kwargs.get("db_type", "rlite"),
+                    "return_type": _kwargs.get("return_type", "dbobj"),
+                },
+            )
+            db = HANDLES.peek(cache_key)
+            if db is not None:
+                return db
+        if shared:
+            client = HANDLES.get(
+                handle_key("client", host, None, {"config": config}),
+                lambda: HTTPClient(host=host, config_file=config),
+            )
+        else:
+            client = HTTPClient(host=host, config_file=config)
+        if ns == "config" and not help and _kwargs.get("config_ops", "get") == "get":
+            # read per request by services: a cached view, without the
+            # usage logs below
+            return client.get_config(config_path=_kwargs.get("config_path"))
         logger.info(
             "APIs of mlopskit", ops_type=ns, model_name=name, model_version=version
         )
+        if ns == "model" and offline and not help:
+            raise error.Error(
+                f"Model operations need the tracking server, which offline mode "
+                f"({OFFLINE_ENV}) does not call."
+            )
         if ns in ["db", "cache", "model"]:
-            try:
-                model = client.mlflow_client.get_model(name)
-            except:
-                if ns in ["db", "cache"]:
-                    msg = f"Model {name} is not exist,To resolve this issue, you will need to create and register the {name} model using `push` method before create db/cache"
-                    logger.error(colorize(msg, "red", True, False))
-                    return
-                else:
-                    msg = f"->Model {name} is not exist,we will create and register it"
-                    logger.warning(colorize(msg, "yellow", True, False))
+            versions = None
+            if ns in ["db", "cache"]:
+                # any age when offline, trusted for the manifest's ttl otherwise
+                versions = MANIFEST.versions(
+                    name, max_age=None if offline else MANIFEST.ttl
+                )
+                if versions is None and offline:
+                    raise error.Error(
+                        f"Model {name} is not in the local manifest {MANIFEST.path}; "
+                        f"resolve it once online before using offline mode."
+                    )
+            if versions is None:
+                try:
+                    model = client.mlflow_client.get_model(name)
+                except:
+                    stale = MANIFEST.versions(name) if ns in ["db", "cache"] else None
+                    if stale is not None:
+                        # tracking server down or slow, keep serving
+                        versions = stale
+                        msg = (
+                            f"Could not reach the tracking server for model {name}, "
+                            f"using the versions resolved at "
+                            f"{time.ctime(MANIFEST.resolved_at(name))}"
+                        )
+                        logger.warning(colorize(msg, "yellow", True, False))
+                    elif ns in ["db", "cache"]:
+                        msg = f"Model {name} is not exist,To resolve this issue, you will need to create and register the {name} model using `push` method before create db/cache"
+                        logger.error(colorize(msg, "red", True, False))
+                        return
+                    else:
+                        msg = f"->Model {name} is not exist,we will create and register it"
+                        logger.warning(colorize(msg, "yellow", True, False))
 
             try:
-                versions = [
-                    int(v.version)
-                    for v in client.mlflow_client.list_model_all_versions(name)
-                ]
+                if versions is None:
+                    versions = [
+                        int(v.version)
+                        for v in client.mlflow_client.list_model_all_versions(name)
+                    ]
+                    MANIFEST.record(name, versions=versions)
                 latest_version = max(versions)
                 color_versions = colorize(versions, "green", True, True)
                 logger.info(
@@ -393,6 +470,8 @@ def make(
                 config_path = _kwargs.get("config_path")
                 config_content = _kwargs.get("config_content", {})
                 client.set_config(config_content, config_path=config_path)
+                # shared clients were built from the previous configuration
+                HANDLES.close_matching(lambda key: key[0] == "client")
             else:
                 print(colorize("暂不支持", "red", False, True))
                 return
@@ -406,7 +485,12 @@ def make(
             if help:
                 return
             db_type = _kwargs.get("db_type", "sqlite")
-            db = client.build_data_store(name, version, db_type=db_type)
+            db = client.build_data_store(
+                name,
+                version,
+                db_type=db_type,
+                source=_version_source(client, name, version, offline),
+            )
             return db
 
         if ns == "cache":
@@ -430,7 +514,10 @@ def make(
                 db_name=db_name,
                 db_type=db_type,
                 return_type=return_type,
+                source=_version_source(client, name, version, offline),
             )
+            if shared and db is not None:
+                db = HANDLES.put(cache_key, db)
             return db
 
         if ns == "model":
@@ -495,6 +582,8 @@ def make(
                     tags=tags,
                 )
                 ops_result = r
+                # a new version was registered
+                MANIFEST.forget(name)
                 msg = ops_result["details"]
                 if ops_result["status"] == "ok":
                     # print(colorize(msg, "green", False, True))
@@ -12,6 +12,7 @@ from mlopskit.ext.store.yaml.yaml_data import YAMLDataSet
 from mlopskit.utils import kill9_byport
 from mlopskit.utils.read_log import LogReader
 from mlopskit.utils.file_utils import data_dir
+from mlopskit.utils.dir_listing import LISTINGS, PAGE_SIZE
 import mlopskit.ext.shellkit as sh
 from mlopskit.ext.dpipe import api as pipe_api
 from mlopskit.ext.dpipe.io.file_base import get_relative_path, human_readable_file_size
@@ -19,7 +20,6 @@ from mlopskit.ext.dpipe.io.file_base import get_relative_path, human_readable_fi
 from datetime import datetime
 from time import ctime
 
-
 api = FastAPI()
 
 home_path = data_dir()
@@ -222,8 +222,9 @@ async def pipes(name: str, version: str, profile: str):
         else:
             dir_to_list = os.path.join(base_dir, name, version)
 
-    files = [str(file) for file in sh.walkfiles(dir_to_list)]
-    dirs = [str(file) for file in sh.walkdirs(dir_to_list)]
+    entries, dirs, _ = LISTINGS.walk(dir_to_list)
+    files = [entry.path for entry in entries]
+    dirs = [os.path.join(dir_to_list, path) for path in dirs]
     return {"files": files, "dirs": dirs, "status": "ok"}
 
 
@@ -239,9 +240,19 @@ async def file_exists(file_or_dir: str):
 
 
 @api.get("/api/git-bus/models/listdir_attr")
-async def listdir_attr(file_or_dir: str, name: str, version: str, profile: str):
+async def listdir_attr(
+    file_or_dir: str,
+    name: str,
+    version: str,
+    profile: str,
+    page: Optional[int] = None,
+    page_size: int = 1000,
+    prefix: str = "",
+):
 
     entries = list()
+    # from the query string, keep it positive and bounded
+    page_size = min(max(page_size, 1), 10 * PAGE_SIZE)
     try:
         pipe_api_instance = pipe_api.APIClient(profile=profile)
         base_dir = pipe_api_instance.dir
@@ -253,23 +264,31 @@ async def listdir_attr(file_or_dir: str, name: str, version: str, profile: str):
             else:
                 dir_to_list = os.path.join(base_dir, name, version)
 
-        for file in sh.walkfiles(dir_to_list):
-            human_size = human_readable_file_size(file.stat().st_size)
+        # cached directory snapshots, one stat per file returned
+        files, _, total = LISTINGS.walk(
+            dir_to_list, prefix=prefix, page=page, page_size=page_size
+        )
+        for file in files:
+            try:
+                file_stat = file.stat()
+            except FileNotFoundError:
+                continue
+            rel_path = get_relative_path(file.path, dir_to_list)
             entries.append(
                 {
-                    "human_size": human_size,
+                    "human_size": human_readable_file_size(file_stat.st_size),
                     "filename2": file.name,
-                    "filename": get_relative_path(str(file), dir_to_list),
-                    "size": file.stat().st_size,
-                    "rel_path": get_relative_path(str(file), dir_to_list),
-                    "modified_at": ctime(file.stat().st_mtime),
+                    "filename": rel_path,
+                    "size": file_stat.st_size,
+                    "rel_path": rel_path,
+                    "modified_at": ctime(file_stat.st_mtime),
                     "crc": "{}-{}".format(
-                        str(file.stat().st_mtime), str(file.stat().st_size)
+                        str(file_stat.st_mtime), str(file_stat.st_size)
                     ),
                 }
             )
 
-        return {"filesall": entries, "status": "ok"}
+        return {"filesall": entries, "total": total, "status": "ok"}
     except:
         return {"status": "failed", "details": str(traceback.format_exc())}
 
@@ -9,6 +9,9 @@ from mlflow.tracking import MlflowClient
 from colorama import init
 from .routes import ui_routes, path_to_local_sqlite_uri
 from .models import SysModelInit
+from .utils.registry_cache import CachedMlflowClient
+from .utils.dashboard_snapshot import SnapshotRefresher
+from .utils.misc import resume_experiment_deletions
 from mlopskit.ext.store.yaml.yaml_data import YAMLDataSet
 from mlopskit.utils.file_utils import data_dir
 
@@ -24,14 +27,20 @@ if default_config_exists:
     mlops_art_basepath = os.path.join(
         home_path, "mlflow_workspace"
     )  # config.get("mlflow_art_path", os.getcwd())
-    mlflow_client = MlflowClient(tracking_uri=mlflow_url_local)
+    # registry reads are cached for mlflow_cache_ttl seconds, 0 disables it
+    mlflow_client = CachedMlflowClient(
+        MlflowClient(tracking_uri=mlflow_url_local),
+        ttl=config.get("mlflow_cache_ttl", 60),
+    )
     mlflow_local_server_uri = mlflow_url_local
     mlops_sqlite_db = config.get("mlops_sqlite_db")
+    dashboard_refresh_interval = config.get("dashboard_refresh_interval", 300)
 else:
 
     mlflow_local_server_uri = CONFIG["mlflow_local_server_uri"]
     mlops_sqlite_db = CONFIG["mlops_sqlite_db"]
     mlops_art_basepath = CONFIG["mlops_art_basepath"]
+    dashboard_refresh_interval = 300
 
 mlops_sqlite_db = os.path.join(home_path, "mlflow_workspace/mlops_meta.sqlite")
 defa_db_uri = path_to_local_sqlite_uri(mlops_sqlite_db)
@@ -39,6 +48,18 @@ sys_db_uri = os.environ.get("DATABASE_URL", defa_db_uri)
 
 sql_db = SysModelInit(sys_db_uri)
 
+# dashboard and registry summaries, recomputed in the background every
+# dashboard_refresh_interval seconds and after registry writes
+dashboard_snapshots = SnapshotRefresher(
+    os.path.join(os.path.dirname(mlops_sqlite_db), "dashboard_snapshots.db"),
+    interval=dashboard_refresh_interval,
+)
+if default_config_exists:
+    mlflow_client.listeners.append(dashboard_snapshots.on_registry_change)
+
+# experiment purges interrupted by a restart or an error
+resume_experiment_deletions()
+
 
 if os.name == "nt":
     init(convert=True)
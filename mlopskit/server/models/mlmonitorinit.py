@@ -1,8 +1,13 @@
+import collections
 import contextlib
 import datetime
+import threading
+import time
 from typing import List, Optional, Type, TypeVar, Union
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, sessionmaker
 
@@ -13,14 +18,125 @@ from .monitormodels import Base
 logger = get_logger(__name__)
 
 
+class EngineRegistry(object):
+    """Process-wide SQLAlchemy engines of the monitoring databases.
+
+    One engine per (model name, version, db path), created with its schema
+    check on first use and reused by every request after that. Each engine
+    keeps a small bounded pool of sqlite connections, set up once when they
+    are opened (WAL, synchronous=NORMAL, mmap). Engines unused for
+    ``idle_timeout`` seconds, and the least recently used ones beyond
+    ``max_engines``, are disposed.
+    """
+
+    def __init__(
+        self,
+        pool_size=2,
+        max_overflow=3,
+        pool_timeout=30,
+        idle_timeout=600,
+        max_engines=32,
+        mmap_size=256 * 1024 * 1024,
+    ):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.idle_timeout = idle_timeout
+        self.max_engines = max_engines
+        self.mmap_size = mmap_size
+        # key -> (engine, session factory, last use), least recent first
+        self._engines = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db_uri, name=None, version=None):
+        """``(engine, sessionmaker)`` for ``db_uri``, created on first use."""
+        key = (name, version, make_url(db_uri).database)
+        with self._lock:
+            entry = self._engines.pop(key, None)
+            if entry is not None:
+                self._engines[key] = (entry[0], entry[1], time.monotonic())
+        if entry is None:
+            # outside of the lock: the schema check touches the file
+            engine, factory = self._create(db_uri)
+            with self._lock:
+                entry = self._engines.pop(key, None)
+                if entry is None:
+                    entry = (engine, factory)
+                else:
+                    # another thread got there first
+                    engine.dispose()
+                self._engines[key] = (entry[0], entry[1], time.monotonic())
+
+        with self._lock:
+            expired = self._expired(time.monotonic())
+        for engine in expired:
+            engine.dispose()
+        return entry[0], entry[1]
+
+    def _expired(self, now):
+        expired = []
+        for key, (engine, _, last_used) in list(self._engines.items()):
+            if (
+                len(self._engines) > self.max_engines
+                or now - last_used > self.idle_timeout
+            ):
+                del self._engines[key]
+                expired.append(engine)
+        return expired
+
+    def _create(self, db_uri):
+        logger.debug("Creating engine", db_uri=db_uri)
+        engine = create_engine(
+            db_uri,
+            poolclass=QueuePool,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_timeout=self.pool_timeout,
+            # pooled connections move between request threads
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+        event.listen(engine, "connect", self._on_connect)
+
+        Base.metadata.create_all(engine)
+        # create_all skips existing tables, add indexes introduced later;
+        # partitioned databases have a predictions view instead (see
+        # mlopskit.ext.store.sqlite.prediction_partitions)
+        tables = inspect(engine).get_table_names()
+        for table in Base.metadata.sorted_tables:
+            if table.name in tables:
+                for index in table.indexes:
+                    index.create(engine, checkfirst=True)
+        return engine, sessionmaker(bind=engine)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA mmap_size={0:d}".format(self.mmap_size))
+        cursor.close()
+
+    def dispose(self):
+        """Close every pooled connection and forget the engines."""
+        with self._lock:
+            engines = [engine for engine, _, _ in self._engines.values()]
+            self._engines.clear()
+        for engine in engines:
+            engine.dispose()
+
+    def __len__(self):
+        return len(self._engines)
+
+
+ENGINES = EngineRegistry()
+
+
 class MonitorModelInit(object):
     type = "sqlalchemy"
 
-    def __init__(self, db_uri: str):
+    def __init__(self, db_uri: str, name=None, version=None):
         self.db_uri = db_uri
-        self._engine = create_engine(db_uri)
-        Base.metadata.create_all(self._engine)
-        self._Session = sessionmaker(bind=self._engine)
+        # engines, pools and the schema check are shared by the process
+        self._engine, self._Session = ENGINES.get(db_uri, name=name, version=version)
         self._active_session = None
 
     @contextlib.contextmanager
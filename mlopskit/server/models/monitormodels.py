@@ -14,6 +14,7 @@ from sqlalchemy import (
     UniqueConstraint,
     Float,
     CheckConstraint,
+    Index,
 )
 
 SQL_OBJECT_FIELD = "_sqlalchemy_object"
@@ -73,6 +74,12 @@ class SPrediction(Base, Attaching):
     request_id = Column(String(100), unique=False, nullable=False)
     created_at = Column(DateTime, unique=False, nullable=False)
 
+    # keyset pagination in get_predictions walks (created_at, id)
+    __table_args__ = (
+        Index("ix_predictions_created_at_id", "created_at", "id"),
+        Index("ix_predictions_log_type_created_at_id", "log_type", "created_at", "id"),
+    )
+
     def to_obj(self) -> Prediction:
         p = Prediction(
             id=self.id,
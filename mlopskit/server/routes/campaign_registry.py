@@ -1,5 +1,6 @@
-from .. import app, auth, sql_db
-from flask import request
+from .. import app, auth, sql_db, dashboard_snapshots
+from flask import request, stream_with_context
+from flask import Response as StreamResponse
 from flask_cors import cross_origin
 import datetime
 import traceback
@@ -9,6 +10,7 @@ from sqlalchemy_paginator import Paginator
 from pyjackson import deserialize, serialize
 
 from .response import Response
+from mlopskit.ext.abtest.export import FORMATS, export
 from structlog import get_logger
 
 from ..utils.misc import (
@@ -22,6 +24,7 @@ from ..utils.misc import (
     toggle_experiment_archive,
     reset_experiment,
     toggle_experiment_pause,
+    deletion_progress,
 )
 
 logger = get_logger(__name__)
@@ -71,6 +74,7 @@ def del_campaigns():
                     else:
                         q.delete(synchronize_session=False)
 
+        dashboard_snapshots.mark_stale("dashboard")
         return rsp.success("删除成功")
     except:
         return rsp.delprojfailed("删除有误")
@@ -97,6 +101,7 @@ def add_campaign():
             creation_date=datetime.datetime.utcnow(),
         )
         sql_db._create_object(obj)
+        dashboard_snapshots.mark_stale("dashboard")
 
         return rsp.success("campaign added success!")
     except:
@@ -157,6 +162,7 @@ def del_campaign_exps():
                     else:
                         q.delete(synchronize_session=False)
 
+        dashboard_snapshots.mark_stale("dashboard")
         return rsp.success("删除成功")
     except:
         return rsp.delprojfailed("删除有误")
@@ -261,6 +267,7 @@ def add_ab_exp():
             creation_date=datetime.datetime.utcnow(),
         )
         sql_db._create_object(obj)
+        dashboard_snapshots.mark_stale("dashboard")
         return rsp.success("abexp added success!")
     except:
         exc_traceback = str(traceback.format_exc())
@@ -359,6 +366,8 @@ def registered_altlist():
 """
 A/B testing 详情及ops系列
 """
+
+
 # 查看ab case results
 @app.route("/api/abtesting/report/alt_table_report", methods=["GET"])
 @cross_origin()
@@ -404,6 +413,42 @@ def alt_table_report():
     return rsp.success(data)
 
 
+# 导出实验明细(流式)
+@app.route("/api/abtesting/report/export", methods=["GET"])
+@cross_origin()
+@auth.login_required
+def export_ab_exp():
+    ab_id = request.args.get("ab_id", 1)
+    export_format = request.args.get("format", "csv")
+    if export_format not in FORMATS:
+        return rsp.failed("unsupported export format: {}".format(export_format))
+
+    p = sql_db._get_objects(SAbExpCase, SAbExpCase.id == ab_id)
+    ab_info = [serialize(o) for o in p]
+
+    abname = ab_info[0]["name"]
+    bRet, experiment = find_or_404(abname)
+    if not bRet:
+        return rsp.failed("实验尚未开始")
+    if experiment.is_compacted():
+        return rsp.failed("实验数据已压缩，无法导出明细")
+
+    filename = "{}.{}".format(abname, export_format)
+    return StreamResponse(
+        stream_with_context(export(experiment, format=export_format)),
+        mimetype=FORMATS[export_format],
+        headers={"Content-Disposition": "attachment; filename={}".format(filename)},
+    )
+
+
+# 正在删除的实验及进度
+@app.route("/api/abtesting/report/deletions", methods=["GET"])
+@cross_origin()
+@auth.login_required
+def ab_exp_deletions():
+    return rsp.success(deletion_progress())
+
+
 # 设置胜利组
 @app.route("/api/abtesting/report/abset_winner", methods=["POST"])
 @cross_origin()
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from flask import jsonify, request
-from .. import app, auth, sql_db, mlflow_client
+from .. import app, auth, sql_db, mlflow_client, dashboard_snapshots
 from flask_cors import cross_origin
 import datetime
 
@@ -14,12 +14,7 @@ from .response import Response
 rsp = Response()
 
 
-# 获取dashboard信息
-@app.route("/api/dashboard/get_dashboard_info", methods=["GET"])
-@cross_origin()
-@auth.login_required
-def get_dashboard_info():
-    user_name = request.args.get("user_name", "")
+def _dashboard_summary():
     dashboard_all = []
     _p = sql_db._get_objects(SDataCampaign)
     campaign_info = [serialize(o) for o in _p]
@@ -32,14 +27,14 @@ def get_dashboard_info():
     exp_dict = {"cnt": len(ab_info), "title": "进行中的实验数", "link": "/campaigns"}
     dashboard_all.append(exp_dict)
 
+    models = mlflow_client.list_registered_models()
     model_dict = {
-        "cnt": len(mlflow_client.list_registered_models()),
+        "cnt": len(models),
         "title": "已注册的模型数",
         "link": "/models",
     }
 
     dashboard_all.append(model_dict)
-    models = mlflow_client.list_registered_models()
     model_versions_cnt = 0
     for model in models:
         name = model.name
@@ -49,5 +44,21 @@ def get_dashboard_info():
 
     model_v_dict = {"cnt": model_versions_cnt, "title": "模型版本数", "link": "/models"}
     dashboard_all.append(model_v_dict)
+    return dashboard_all
+
 
-    return rsp.success(dashboard_all)
+dashboard_snapshots.register("dashboard", _dashboard_summary)
+
+
+# 获取dashboard信息
+@app.route("/api/dashboard/get_dashboard_info", methods=["GET"])
+@cross_origin()
+@auth.login_required
+def get_dashboard_info():
+    user_name = request.args.get("user_name", "")
+    # precomputed in the background, refresh=1 recomputes it now
+    if request.args.get("refresh"):
+        dashboard_all, refreshed_at = dashboard_snapshots.refresh("dashboard")
+    else:
+        dashboard_all, refreshed_at = dashboard_snapshots.get("dashboard")
+    return rsp.success(dashboard_all, refreshed_at=refreshed_at)
@@ -13,6 +13,7 @@ from .response import Response
 from .. import mlops_art_basepath
 from ..models.featureinit import FeatureModelInit
 from ..models.feature_store import SFeatureBase, SFeatureModel
+from mlopskit.ext.store.sqlite.online_features import OnlineStore
 
 
 def get_featuremeta_db():
@@ -24,6 +25,19 @@ def get_featuremeta_db():
     return new_sql_db
 
 
+_online_store = None
+
+
+def get_online_store():
+    # one store per process: it keeps a connection per serving thread
+    global _online_store
+    if _online_store is None:
+        _online_store = OnlineStore(
+            os.path.join(mlops_art_basepath, "online_features.db")
+        )
+    return _online_store
+
+
 rsp = Response()
 
 import re
@@ -485,3 +499,45 @@ def get_feature_metadata():
         exc_traceback = str(traceback.format_exc())
         # print(exc_traceback,"exc_traceback")
         return rsp.failed(exc_traceback)
+
+
+# 在线特征服务
+@app.route("/api/features/online", methods=["POST"])
+@cross_origin()
+@auth.login_required
+def get_online_features():
+    try:
+        entity_ids = request.get_json()["entity_ids"]
+        features = request.get_json()["features"]
+        result = get_online_store().get_online_features(entity_ids, features)
+        return rsp.success(result)
+    except (KeyError, ValueError) as e:
+        return rsp.failed(e.args[0])
+    except:
+        exc_traceback = str(traceback.format_exc())
+        return rsp.failed(exc_traceback)
+
+
+@app.route("/api/features/online/materialize", methods=["POST"])
+@cross_origin()
+@auth.login_required
+def materialize_online_features():
+    try:
+        view = request.get_json()["view"]
+        rows = request.get_json()["rows"]
+        entity_key = request.get_json().get("entity_key", "entity_id")
+        replace = request.get_json().get("replace", True)
+        written = get_online_store().materialize(
+            view, rows, entity_key=entity_key, replace=replace
+        )
+        return rsp.success({"view": view, "rows": written})
+    except:
+        exc_traceback = str(traceback.format_exc())
+        return rsp.failed(exc_traceback)
+
+
+@app.route("/api/features/online/views", methods=["GET"])
+@cross_origin()
+@auth.login_required
+def online_feature_views():
+    return rsp.success(get_online_store().views())
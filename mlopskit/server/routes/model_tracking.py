@@ -1,10 +1,18 @@
-from .. import app, auth, sql_db, mlflow_client
+from .. import app, auth, sql_db, mlflow_client, dashboard_snapshots
 from flask import request, Response, send_file, make_response, Markup
+from flask import Response as StreamResponse, stream_with_context
 from flask_cors import cross_origin
+import base64
+import binascii
+import contextlib
 import datetime
+import math
 import traceback
 import json
 import os
+import pathlib
+import sqlite3
+import time
 import nbformat
 from mlopskit.ext import format_sql
 
@@ -29,7 +37,9 @@ else:
 # 1. Import the exporter
 from nbconvert import HTMLExporter
 
-from sqlalchemy_paginator import Paginator
+from sqlalchemy import MetaData, tuple_
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import aliased
 from pyjackson import deserialize, serialize
 
 from .response import Response
@@ -40,9 +50,20 @@ from ..utils.misc import (
     is_valid_subpath,
     get_parent_directory,
     cat_file_content,
+    cat_file_range,
+    TEXT_EXTENSIONS,
+    RENDERED_EXTENSIONS,
+    MAX_RENDER_BYTES,
 )
+from mlopskit.utils.file_range import PREVIEW_BYTES, parse_range
 from mlopskit.utils.file_utils import path_to_local_sqlite_uri
+from mlopskit.utils.dir_listing import LISTINGS, PAGE_SIZE
 from mlopskit.io import sfdb
+from mlopskit.ext.store.sqlite import (
+    prediction_export,
+    prediction_partitions,
+    prediction_stats,
+)
 
 from mlflow.protos.service_pb2 import ListExperiments
 from mlflow.protos.model_registry_pb2 import (
@@ -74,6 +95,8 @@ rsp = Response()
 
 model_meta_file = os.path.join(mlops_art_basepath, "model_meta.db")
 
+CURSOR_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
 
 @app.route("/api/experiments/get_model_experiments", methods=["GET"])
 @cross_origin()
@@ -123,18 +146,8 @@ def add_model_experiment():
         return rsp.failed(exc_traceback)
 
 
-@app.route("/api/models/get_registered_models", methods=["GET"])
-@cross_origin()
-@auth.login_required
-def getRegisteredModels():
-    import json
-
-    page = request.args.get("page", 1, type=int)
-    name = request.args.get("name", "")
-    user_name = request.args.get("user_key", "")
-
+def _registered_models_summary():
     models = mlflow_client.list_registered_models()
-    total_pages = 1
 
     response_message = ListRegisteredModels.Response()
     response_message.registered_models.extend([m.to_proto() for m in models])
@@ -143,7 +156,6 @@ def getRegisteredModels():
     registered_models = []
     # with open("/Users/leepand/Downloads/codes/mlops-test/modelinfo.json", "w") as f:
     #    json.dump(data, f)
-    model_meta = {}
     if data:
         for model in data["registered_models"]:
             model_new_dict = {}
@@ -153,20 +165,6 @@ def getRegisteredModels():
             model_new_dict["description"] = model.get("description", "无")
             model_new_dict["tags"] = model.get("tags", [])
 
-            with sfdb.Database(filename=model_meta_file) as db:
-                _name = model["name"]
-                model_key = f"{_name}:port"
-                modelservice = db.get(model_key)
-                if modelservice is not None:
-                    model_meta[_name] = modelservice
-                else:
-                    model_meta[_name] = {
-                        "name": _name,
-                        "port": "null",
-                        "status": "stoped",
-                    }
-                    db[model_key] = model_meta[_name]
-
             if "latest_versions" in model:
                 model_new_dict["latest_version"] = model["latest_versions"][-1][
                     "version"
@@ -182,12 +180,68 @@ def getRegisteredModels():
                 model_new_dict["latest_version"] = ""
 
             registered_models.append(model_new_dict)
+    return registered_models
+
+
+dashboard_snapshots.register("registered_models", _registered_models_summary)
+
+
+def _snapshot(name, compute):
+    """``(payload, refreshed_at)`` of the snapshot ``name``, registered with
+    ``compute`` by the first request for it and dropped once pages stop
+    reading it."""
+    new = dashboard_snapshots.register(name, compute, expires=True)
+    try:
+        return dashboard_snapshots.get(
+            name, refresh=new or bool(request.args.get("refresh"))
+        )
+    except Exception:
+        if new:
+            # e.g. an unknown model version, do not keep refreshing it
+            dashboard_snapshots.forget(name)
+        raise
+
+
+@app.route("/api/models/get_registered_models", methods=["GET"])
+@cross_origin()
+@auth.login_required
+def getRegisteredModels():
+    page = request.args.get("page", 1, type=int)
+    name = request.args.get("name", "")
+    user_name = request.args.get("user_key", "")
+
+    # precomputed in the background, refresh=1 recomputes it now
+    if request.args.get("refresh"):
+        registered_models, refreshed_at = dashboard_snapshots.refresh(
+            "registered_models"
+        )
+    else:
+        registered_models, refreshed_at = dashboard_snapshots.get("registered_models")
+    total_pages = 1
+
+    # service ports and status change outside the registry, read them live
+    model_meta = {}
+    with sfdb.Database(filename=model_meta_file) as db:
+        for model in registered_models:
+            _name = model["name"]
+            model_key = f"{_name}:port"
+            modelservice = db.get(model_key)
+            if modelservice is not None:
+                model_meta[_name] = modelservice
+            else:
+                model_meta[_name] = {
+                    "name": _name,
+                    "port": "null",
+                    "status": "stoped",
+                }
+                db[model_key] = model_meta[_name]
 
     result = {
         "data": registered_models,
         "page": page,
         "total": total_pages,
         "model_meta": model_meta,
+        "refreshed_at": refreshed_at,
     }
     return rsp.success(result)
 
@@ -447,15 +501,18 @@ def get_model_runs():
     experiment_id = request.args.get("experiment_id", "")
     user_name = request.args.get("user_name", "")
 
-    experiment_ids = [experiment_id]
-    run_entities = mlflow_client.search_runs(
-        experiment_ids, filter_string="", max_results=1000, order_by=None
-    )
-    response_message = SearchRuns.Response()
-    response_message.runs.extend([r.to_proto() for r in run_entities])
-    json_data = json.loads(message_to_json(response_message))
-    result = json_data.get("runs", [])
-    return rsp.success(result)
+    def compute():
+        run_entities = mlflow_client.search_runs(
+            [experiment_id], filter_string="", max_results=1000, order_by=None
+        )
+        response_message = SearchRuns.Response()
+        response_message.runs.extend([r.to_proto() for r in run_entities])
+        json_data = json.loads(message_to_json(response_message))
+        return json_data.get("runs", [])
+
+    # runs and their latest metrics, precomputed in the background
+    result, refreshed_at = _snapshot("runs:{0}".format(experiment_id), compute)
+    return rsp.success(result, refreshed_at=refreshed_at)
 
 
 @app.route("/api/experiments/get_model_run", methods=["GET"])
@@ -492,7 +549,7 @@ def get_model_monitor_db(name, version):
     db_file = os.path.join(mlops_art_basepath, dir_name, "sqlite_logs.db")
     # print(db_file, "db_file")
     defa_db_uri = path_to_local_sqlite_uri(db_file)
-    new_sql_db = MonitorModelInit(defa_db_uri)
+    new_sql_db = MonitorModelInit(defa_db_uri, name=name, version=version)
     return new_sql_db
 
 
@@ -502,80 +559,261 @@ def get_model_monitor_db(name, version):
 def get_model_monitorinfo():
     model_name = request.args.get("name", "")
     version_id = request.args.get("version_id", "")
-    new_sql_db = get_model_monitor_db(model_name, version_id)
-    table_name = "predictions"
-    new_sql_db = get_model_monitor_file(model_name, version_id)
-    initialize_app(new_sql_db)
-    # with new_sql_db._session() as s:
-    #    q_all = s.query(SPrediction).filter(SPrediction.id > 0)
-    #    q_errors = s.query(SPrediction).filter(SPrediction.log_type == "errors")
-    #    data_all = [serialize(o.to_obj()) for o in q_all.all()]
-    #    data_errors = [serialize(o.to_obj()) for o in q_errors.all()]
-    data = []
-    sql = "select count(*) as cnt,log_type from predictions group by log_type"
-    try:
-        cursor = dataset.query(sql)
-    except Exception as exc:
-        error = str(exc)
-    else:
-        # total_rows = len(cursor.fetchall())
 
-        # total_pages = int(math.ceil(total_rows / float(rows_per_page)))
-        # Restrict bounds.
-        # page_number = min(page_number, total_pages)
-        # page_number = max(page_number, 1)
-
-        # previous_page = page_number - 1 if page_number > 1 else None
-        # next_page = page_number + 1 if page_number < total_pages else None
+    def compute():
+        db_file = get_model_monitor_file(model_name, version_id)
+        # read from the hourly aggregates rather than counting every prediction
+        stats = prediction_stats.summary(db_file)
+        counts = stats["predictions"]
+        latency = stats["latency"]
+        return {
+            "all_predict_cnt": sum(counts.values()),
+            "errors_cnt": counts.get("errors", 0),
+            "latency": {
+                "count": latency["count"],
+                "avg": latency["sum"] / latency["count"] if latency["count"] else None,
+                "p50": prediction_stats.quantile(latency, 0.5),
+                "p99": prediction_stats.quantile(latency, 0.99),
+            },
+        }
 
-        data = cursor.fetchall()[:10000]
-    all_predict_cnt = 0
-    errors_cnt = 0
-    if len(data) > 0:
-        for cnt, log_type in data:
-            all_predict_cnt += cnt
-            if log_type == "errors":
-                errors_cnt += cnt
-    # print(data,"datasql")
-    # result = {"all_predict_cnt": len(data_all), "errors_cnt": len(data_errors)}
-    result = {"all_predict_cnt": all_predict_cnt, "errors_cnt": errors_cnt}
-    return rsp.success(result)
+    result, refreshed_at = _snapshot(
+        "monitor:{0}:{1}".format(model_name, version_id), compute
+    )
+    return rsp.success(result, refreshed_at=refreshed_at)
 
 
 @app.route("/api/models/get_predictions", methods=["GET"])
 @cross_origin()
 @auth.login_required
 def get_predictions():
+    """Page through the logged predictions in (created_at, id) order.
+
+    Pass the ``next_cursor``/``prev_cursor`` of a page as ``cursor`` to get
+    the next/previous one, every page then costs the same index seek. A bare
+    ``page_pred`` is still accepted and locates its first row on the index.
+    ``start``/``end`` restrict the pages to a time range; on a partitioned
+    database only the partitions overlapping it are read.
+    """
     model_name = request.args.get("name", "")
     version_id = request.args.get("version_id", "")
     user_name = request.args.get("user_name", "")
     page_pred = request.args.get("page_pred", "")
     process_btn = request.args.get("process_btn", "all")
+    cursor = request.args.get("cursor", "")
     page_size = 10
-    # source = mlflow_client.get_model_version_download_url(model_name, model_version)
-    # (path, filename) = os.path.split(source)
-    # db_file = os.path.join(mlops_art_basepath, path, "sqlite_logs.db")
-    # with open("/Users/leepand/Downloads/codes/mlops-test/path.txt","w") as f:
-    #    f.write(os.path.join( mlops_art_basepath, dir_name,path))
-
-    # data_store = SQLDataStore(path_to_local_sqlite_uri(db_file))
-    # data_store.build()
+    try:
+        start_at = _parse_datetime_arg(request.args.get("start", ""))
+        end_at = _parse_datetime_arg(request.args.get("end", ""))
+    except ValueError:
+        return rsp.failed("invalid start or end")
     new_sql_db = get_model_monitor_db(model_name, version_id)
+    db_file = make_url(new_sql_db.db_uri).database
+
+    # totals come from the hourly aggregates instead of a count(*) per page
+    # hour granularity, so totals of a range are approximate
+    counts = prediction_stats.summary(
+        db_file,
+        since=start_at,
+        until=end_at - datetime.timedelta(microseconds=1) if end_at else None,
+    )["predictions"]
+    if process_btn == "all":
+        total = sum(counts.values())
+    else:
+        total = counts.get("errors", 0)
+    total_pages = int(math.ceil(total / float(page_size)))
+
+    with contextlib.closing(sqlite3.connect(db_file)) as conn:
+        partitions = prediction_partitions.partitions(
+            conn, since=start_at, until=end_at
+        )
 
     with new_sql_db._session() as s:
-        if process_btn == "all":
-            q = s.query(SPrediction).filter(SPrediction.id > 0)
+        bound, inclusive, page = None, False, None
+
+        def query(entity):
+            q = s.query(entity)
+            if process_btn != "all":
+                q = q.filter(entity.log_type == "errors")
+            if start_at is not None:
+                q = q.filter(entity.created_at >= start_at)
+            if end_at is not None:
+                q = q.filter(entity.created_at < end_at)
+            if bound is not None:
+                key = tuple_(entity.created_at, entity.id)
+                if direction == "before":
+                    q = q.filter(key < bound)
+                elif inclusive:
+                    q = q.filter(key >= bound)
+                else:
+                    q = q.filter(key > bound)
+            return q
+
+        if cursor:
+            try:
+                direction, created_at, _id = _decode_cursor(cursor)
+            except ValueError:
+                return rsp.failed("invalid cursor")
+            bound = (created_at, _id)
+        else:
+            direction = "after"
+            try:
+                page = max(int(page_pred or 1), 1)
+            except ValueError:
+                page = 1
+            skip = (page - 1) * page_size
+            empty = False
+            if skip:
+                # locate the first row of the page on the index, skipping
+                # whole partitions by their row count
+                empty = True
+                for partition in partitions:
+                    entity = _prediction_entity(partition.name)
+                    if len(partitions) > 1:
+                        count = query(entity).count()
+                        if skip >= count:
+                            skip -= count
+                            continue
+                    first = (
+                        query(entity)
+                        .with_entities(entity.created_at, entity.id)
+                        .order_by(entity.created_at, entity.id)
+                        .offset(skip)
+                        .first()
+                    )
+                    if first is not None:
+                        bound, inclusive, empty = tuple(first), True, False
+                    break
+            if empty:
+                partitions = []
+
+        if bound is not None and direction == "before":
+            partitions = [
+                p
+                for p in partitions
+                if p.start_at is None or p.start_at <= _cursor_str(bound)
+            ]
+            partitions.reverse()
+        elif bound is not None:
+            partitions = [
+                p
+                for p in partitions
+                if p.end_at is None or p.end_at > _cursor_str(bound)
+            ]
+
+        # one extra row tells whether there is a page beyond this one
+        rows = []
+        for partition in partitions:
+            entity = _prediction_entity(partition.name)
+            q = query(entity)
+            if direction == "before":
+                q = q.order_by(entity.created_at.desc(), entity.id.desc())
+            else:
+                q = q.order_by(entity.created_at, entity.id)
+            rows += q.limit(page_size + 1 - len(rows)).all()
+            if len(rows) > page_size:
+                break
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if direction == "before":
+            rows.reverse()
+            has_prev, has_next = has_more, True
         else:
-            q = s.query(SPrediction).filter(SPrediction.log_type == "errors")
-        paginator = Paginator(q, page_size)
-        _page = paginator.page(page_pred)
-        total_pages = _page.paginator.total_pages
-        data = [serialize(o.to_obj()) for o in _page.object_list]
+            has_prev, has_next = bool(cursor) or page > 1, has_more
+        data = [serialize(o.to_obj()) for o in rows]
+        next_cursor = _encode_cursor("after", rows[-1]) if rows and has_next else None
+        prev_cursor = _encode_cursor("before", rows[0]) if rows and has_prev else None
 
-    result = {"data": data, "page": page_pred, "total": total_pages}
+    result = {
+        "data": data,
+        "page": page_pred,
+        "total": total_pages,
+        "count": total,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+    }
     return rsp.success(result)
 
 
+@app.route("/api/models/export_predictions", methods=["GET"])
+@cross_origin()
+@auth.login_required
+def export_predictions():
+    model_name = request.args.get("name", "")
+    version_id = request.args.get("version_id", "")
+    process_btn = request.args.get("process_btn", "all")
+    export_format = request.args.get("format", "parquet")
+    if export_format not in prediction_export.FORMATS:
+        return rsp.failed("unsupported export format: {}".format(export_format))
+    try:
+        start_at = _parse_datetime_arg(request.args.get("start", ""))
+        end_at = _parse_datetime_arg(request.args.get("end", ""))
+    except ValueError:
+        return rsp.failed("invalid start or end")
+    try:
+        prediction_export.schema()
+    except ImportError as e:
+        return rsp.failed(str(e))
+
+    db_file = get_model_monitor_file(model_name, version_id)
+    if not os.path.exists(db_file):
+        return rsp.failed("no predictions logged for this model version")
+
+    chunks = prediction_export.stream(
+        db_file,
+        format=export_format,
+        since=start_at,
+        until=end_at,
+        log_type=None if process_btn == "all" else "errors",
+    )
+    filename = "{}-{}-predictions.{}".format(model_name, version_id, export_format)
+    return StreamResponse(
+        stream_with_context(chunks),
+        mimetype=prediction_export.FORMATS[export_format],
+        headers={"Content-Disposition": "attachment; filename={}".format(filename)},
+    )
+
+
+_partition_metadata = MetaData()
+
+
+def _prediction_entity(table_name):
+    # SPrediction mapped onto one partition table of a partitioned database
+    if table_name == SPrediction.__tablename__:
+        return SPrediction
+    table = _partition_metadata.tables.get(table_name)
+    if table is None:
+        table = SPrediction.__table__.to_metadata(_partition_metadata, name=table_name)
+    return aliased(SPrediction, table, adapt_on_names=True)
+
+
+def _parse_datetime_arg(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def _cursor_str(bound):
+    return bound[0].strftime(CURSOR_DATETIME_FORMAT)
+
+
+def _encode_cursor(direction, prediction):
+    created_at = prediction.created_at.strftime(CURSOR_DATETIME_FORMAT)
+    return base64.urlsafe_b64encode(
+        json.dumps([direction, created_at, prediction.id]).encode("utf-8")
+    ).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        direction, created_at, _id = json.loads(base64.urlsafe_b64decode(cursor))
+        created_at = datetime.datetime.strptime(created_at, CURSOR_DATETIME_FORMAT)
+        _id = int(_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError("invalid cursor") from e
+    if direction not in ("after", "before"):
+        raise ValueError("invalid cursor")
+    return direction, created_at, _id
+
+
 @app.route("/api/experiments/edit_modelrun_description", methods=["POST"])
 @cross_origin()
 @auth.login_required
@@ -722,8 +960,11 @@ def del_file_dir():
 @cross_origin()
 @auth.login_required
 def get_model_files():
-    page_size = 10
     page = request.args.get("page", 1, type=int)
+    page_size = request.args.get("page_size", PAGE_SIZE, type=int)
+    # from the query string, keep it positive and bounded
+    page_size = min(max(page_size, 1), 10 * PAGE_SIZE)
+    prefix = request.args.get("prefix", "")
     _path = request.args.get("path", None)
     is_dir = request.args.get("is_dir", None)
     model_name = request.args.get("model_name")
@@ -786,8 +1027,13 @@ def get_model_files():
             print(send_as_attachment, requested_path, "requested_pathddd")
             try:
                 print(send_as_attachment, requested_path, "requested_path")
+                # streamed in blocks; conditional answers Range requests
+                # with 206 and the requested bytes only
                 return send_file(
-                    requested_path, mimetype=mimetype, as_attachment=send_as_attachment
+                    requested_path,
+                    mimetype=mimetype,
+                    as_attachment=send_as_attachment,
+                    conditional=True,
                 )
             except PermissionError:
                 rsp.failed("Read Permission Denied: " + requested_path)
@@ -801,22 +1047,31 @@ def get_model_files():
         # Read the files
         try:
             exclude = ["venv"]
+            # only the entries of the page are stat-ed
+            entries, count = LISTINGS.listdir(
+                requested_path,
+                prefix=prefix,
+                page=page if p_type == "list" else None,
+                page_size=page_size,
+                exclude=exclude,
+            )
             directory_files = process_files(
-                os.scandir(requested_path),
+                entries,
                 base_directory,
                 exclude=exclude,
                 p_type=p_type,
             )
         except PermissionError:
-            rsp.failed("Read Permission Denied: " + requested_path)
+            return rsp.failed("Read Permission Denied: " + requested_path)
 
         result = {
             "files": directory_files,
             "back": back,
             "directory": requested_path,
             "is_subdirectory": is_subdirectory,
-            "page": 1,
-            "total": 1,
+            "page": page,
+            "total": max(1, int(math.ceil(count / float(page_size)))),
+            "count": count,
             "version": "v1.0",
         }
         print(result, "model_results")
@@ -868,14 +1123,40 @@ def cat_file_contents():
     _requested_path = os.path.join(base_directory, curr_path)
     (requested_path, _filename) = os.path.split(_requested_path)
     back = requested_path
+    # offset/length (or a Range header) and tail select the bytes previewed
+    params = request.get_json()
     try:
-        file_content = cat_file_content(_requested_path, _filename)
+        offset = int(params.get("offset") or 0)
+        length = int(params.get("length") or PREVIEW_BYTES)
+        tail = int(params.get("tail") or 0)
+        size = os.path.getsize(_requested_path)
+        byte_range = parse_range(request.headers.get("Range"), size)
+    except (TypeError, ValueError) as e:
+        return rsp.failed("invalid range: {}".format(e))
+    except OSError:
+        return rsp.failed("file not found: " + curr_path)
+    if byte_range is not None:
+        offset, length = byte_range[0], byte_range[1] - byte_range[0]
+    ranged = _filename.endswith(TEXT_EXTENSIONS) or (
+        _filename.endswith(RENDERED_EXTENSIONS)
+        and (size > MAX_RENDER_BYTES or offset or tail or byte_range is not None)
+    )
+    try:
+        if ranged:
+            preview = cat_file_range(_requested_path, offset, length, tail)
+        else:
+            preview = {
+                "file_content": cat_file_content(_requested_path, _filename),
+                "offset": 0,
+                "next_offset": size,
+                "size": size,
+                "more": False,
+            }
     except PermissionError:
-        rsp.failed("Read Permission Denied: " + requested_path)
+        return rsp.failed("Read Permission Denied: " + requested_path)
     if back == base_directory:
         back = ""
     result = {
-        "file_content": file_content,
         "back": back,
         "directory": requested_path,
         "is_subdirectory": is_subdirectory,
@@ -884,6 +1165,7 @@ def cat_file_contents():
         "total": 1,
         "version": "v1.0",
     }
+    result.update(preview)
     # print(result,"result")
     return rsp.success(result)
 
@@ -926,7 +1208,6 @@ def upload_model_files():
 
 from peewee import *
 from peewee import IndexMetadata
-from peewee import sqlite3
 from playhouse.dataset import DataSet
 from playhouse.migrate import migrate
 from collections import namedtuple, OrderedDict
@@ -1058,18 +1339,9 @@ def initialize_app(filename, read_only=False, password=None, url_prefix=None):
         install_auth_handler(password)
 
     if read_only:
-        if sys.version_info < (3, 4, 0):
-            die("Python 3.4.0 or newer is required for read-only access.")
-        if peewee_version < (3, 5, 1):
-            die("Peewee 3.5.1 or newer is required for read-only access.")
         db = SqliteDatabase("file:%s?mode=ro" % filename, uri=True)
-        try:
-            db.connect()
-        except OperationalError:
-            die(
-                "Unable to open database file in read-only mode. Ensure that "
-                "the database exists in order to use read-only mode."
-            )
+        # fails when the database does not exist
+        db.connect()
         db.close()
         dataset = SqliteDataSet(db, bare_fields=True)
     else:
@@ -1165,7 +1437,6 @@ def sql_script_excute():
     else:
         table_name = "predictions"
     new_sql_db = get_model_monitor_file(model_name, version_id)
-    initialize_app(new_sql_db)
     table = table_name
 
     MAX_RESULT_SIZE = 1000
@@ -1176,56 +1447,105 @@ def sql_script_excute():
     export_csv = request.get_json()["exportCsv"]
 
     page_number = int(page)
-    rows_per_page = 100
 
-    data = []
-    data_description = error = row_count = sql = None
     sql = sqlScript
 
+    if export_json or export_csv:
+        initialize_app(new_sql_db, read_only=True)
     if export_json:
-        print(export(table, sql, "json"), "dddd")
-        data = export(table, sql, "json")
-        result = {"data": data, "downloadtype": "export_json"}
-        # return rsp.success(result)
-        return data
+        return export(table, sql, "json")
     elif export_csv:
         return export(table, sql, "csv")
 
-    try:
-        cursor = dataset.query(sql)
-    except Exception as exc:
-        error = str(exc)
-    else:
-        # total_rows = len(cursor.fetchall())
+    stats = run_console_query(
+        new_sql_db,
+        sql,
+        max_rows=MAX_RESULT_SIZE,
+        timeout=CONFIG.get("sql_console_timeout", SQL_CONSOLE_TIMEOUT),
+    )
+    result = {
+        "tableData": stats["rows"],
+        "page": page_number,
+        "query_data_len": len(stats["rows"]),
+        "tableHeader": stats["description"],
+        "defaultSql": sql,
+        "error": stats["error"],
+        "truncated": stats["truncated"],
+        "elapsed_ms": stats["elapsed_ms"],
+        "rows_returned": stats["rows_returned"],
+        "vm_steps": stats["vm_steps"],
+    }
+    return rsp.success(result)
 
-        # total_pages = int(math.ceil(total_rows / float(rows_per_page)))
-        # Restrict bounds.
-        # page_number = min(page_number, total_pages)
-        # page_number = max(page_number, 1)
 
-        # previous_page = page_number - 1 if page_number > 1 else None
-        # next_page = page_number + 1 if page_number < total_pages else None
+# seconds a console query may run, overridable with sql_console_timeout
+SQL_CONSOLE_TIMEOUT = 10
+# virtual machine instructions between two deadline checks
+PROGRESS_INTERVAL = 1000
 
-        data = cursor.fetchall()[:MAX_RESULT_SIZE]
 
-        data_description = cursor.description
-        row_count = cursor.rowcount
+def run_console_query(db_file, sql, max_rows=1000, timeout=SQL_CONSOLE_TIMEOUT):
+    """Run one statement on a read-only connection to ``db_file``.
 
-    # table_sql = dataset.query(
-    #    'SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type = ?',
-    #    [table, 'table']).fetchone()[0]
-    tableHeader = []
-    columns = dataset.get_columns(table)
-    column_names = [column.name for column in columns]
+    Rows are fetched with ``fetchmany`` and no more than ``max_rows`` are
+    kept; a progress handler interrupts the statement once it has run for
+    ``timeout`` seconds. Returns the rows and their description together with
+    the elapsed time, the rows the statement returned (``rows_returned``, at
+    most one past ``max_rows``) and the approximate number of virtual machine
+    instructions executed (``vm_steps``), or the error message.
+    """
     result = {
-        "tableData": data,
-        "page": page_number,
-        "query_data_len": len(data),
-        "tableHeader": data_description,
-        "defaultSql": sql,
+        "rows": [],
+        "description": None,
+        "error": None,
+        "truncated": False,
+        "elapsed_ms": 0.0,
+        "rows_returned": 0,
+        "vm_steps": 0,
     }
-    print(data_description, data, row_count, error, new_sql_db, "select")
-    return rsp.success(result)
+    ticks = [0]
+    start = time.monotonic()
+    deadline = start + timeout
+
+    def check_deadline():
+        ticks[0] += 1
+        # a non-zero return aborts the statement with "interrupted"
+        return time.monotonic() > deadline
+
+    uri = "{0}?mode=ro".format(pathlib.Path(os.path.abspath(db_file)).as_uri())
+    try:
+        conn = sqlite3.connect(uri, uri=True)
+    except sqlite3.Error as exc:
+        result["error"] = str(exc)
+        return result
+
+    try:
+        conn.set_progress_handler(check_deadline, PROGRESS_INTERVAL)
+        cursor = conn.execute(sql)
+        result["description"] = cursor.description
+        rows = result["rows"]
+        while len(rows) <= max_rows:
+            chunk = cursor.fetchmany(min(100, max_rows + 1 - len(rows)))
+            if not chunk:
+                break
+            rows.extend(chunk)
+        result["rows_returned"] = len(rows)
+        if len(rows) > max_rows:
+            result["truncated"] = True
+            del rows[max_rows:]
+    except sqlite3.Error as exc:
+        if time.monotonic() > deadline:
+            result["error"] = "query exceeded the {0}s time limit".format(timeout)
+        else:
+            result["error"] = str(exc)
+    except sqlite3.Warning as exc:
+        # older sqlite3 modules refuse several statements in one execute()
+        result["error"] = str(exc)
+    finally:
+        conn.close()
+    result["elapsed_ms"] = (time.monotonic() - start) * 1000
+    result["vm_steps"] = ticks[0] * PROGRESS_INTERVAL
+    return result
 
 
 try:
@@ -1257,10 +1577,15 @@ def table_structure():
     ds_table = dataset[table]
     model_class = ds_table.model_class
 
-    table_sql = dataset.query(
-        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type = ?",
-        [table, "table"],
-    ).fetchone()[0]
+    # a partitioned ``predictions`` is a view over its partitions
+    row = dataset.query(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? "
+        "AND type IN ('table', 'view')",
+        [table],
+    ).fetchone()
+    if row is None:
+        return rsp.failed("table %s not found" % table)
+    table_sql = row[0]
     columns = dataset.get_columns(table)
     indexes = dataset.get_indexes(table)
     _table_sql = _format_create_table(table_sql)
@@ -1310,9 +1635,17 @@ def drop_table():
     new_sql_db = get_model_monitor_file(model_name, version_id)
     initialize_app(new_sql_db)
     table = table_name
-    model_class = dataset[table].model_class
-    # model_class.drop_table()
-    model_class.truncate_table()
+    with contextlib.closing(sqlite3.connect(new_sql_db)) as conn:
+        partitioned = table == SPrediction.__tablename__ and (
+            prediction_partitions.is_partitioned(conn)
+        )
+        if partitioned:
+            # the view cannot be deleted from, empty its partitions instead
+            prediction_partitions.truncate(conn)
+    if not partitioned:
+        model_class = dataset[table].model_class
+        # model_class.drop_table()
+        model_class.truncate_table()
     dataset.update_cache()  # Update all tables.
 
     return rsp.success("del table success")
@@ -2,8 +2,8 @@ from flask import jsonify
 
 
 class Response(object):
-    def success(self, data=[]):
-        return jsonify({"code": "999999", "msg": "成功！", "data": data})
+    def success(self, data=[], **extra):
+        return jsonify(dict({"code": "999999", "msg": "成功！", "data": data}, **extra))
 
     def failed(self, msg=""):
         return jsonify({"code": "999998", "msg": "失败！错误信息：" + str(msg) + "，请联系管理员。"})
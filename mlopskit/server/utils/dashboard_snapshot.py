@@ -0,0 +1,234 @@
+"""Precomputed summaries for the dashboard and registry pages.
+
+Building the home page means listing every registered model, then searching
+the versions of each one on the tracking server, and counting campaigns and
+experiments in the metadata database. ``SnapshotRefresher`` runs these
+computations in a background thread and keeps their results in one local
+sqlite table, so a page load is a single primary key read::
+
+    snapshots = SnapshotRefresher("dashboard_snapshots.db", interval=300)
+    snapshots.register("dashboard", compute_dashboard)
+
+    payload, refreshed_at = snapshots.get("dashboard")
+
+Snapshots are recomputed every ``interval`` seconds and shortly after
+``mark_stale`` is called, which the server does on registry writes (see
+``CachedMlflowClient.listeners``) and campaign changes. Calls within
+``debounce`` seconds of each other trigger a single refresh. The first
+``get`` of a summary that was never computed computes it in the request.
+``refreshed_at`` (UTC) is returned with every snapshot so pages can show
+how fresh they are.
+
+Summaries of one model version or experiment are registered by the page
+that first asks for them, under names such as ``monitor:<name>:<version>``,
+and refreshed with the others until no page has read them for
+``IDLE_INTERVALS`` intervals. A registry write only marks the dashboard, the
+registered models and the snapshots of the model written stale.
+"""
+
+import atexit
+import datetime
+import json
+import sqlite3
+import threading
+import time
+
+from structlog import get_logger
+
+logger = get_logger(__name__)
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+    name VARCHAR(64) NOT NULL,
+    payload TEXT NOT NULL,
+    refreshed_at VARCHAR(26) NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    PRIMARY KEY (name)
+)
+"""
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# scheduled refreshes an expiring snapshot may go unread before it is dropped
+IDLE_INTERVALS = 3
+
+
+class SnapshotRefresher(object):
+    def __init__(self, db_file, interval=300, debounce=1.0):
+        """
+        :param db_file: path of the sqlite snapshot database, created if
+            missing
+        :param interval: seconds between two scheduled refreshes
+        :param debounce: seconds to wait after ``mark_stale`` for other
+            changes before refreshing
+        """
+        self.db_file = db_file
+        self.interval = interval
+        self.debounce = debounce
+        self._computes = {}
+        self._stale = set()
+        # last get() of the snapshots registered with expires=True
+        self._read_at = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # one computation per summary at a time
+        self._refreshing = {}
+        self._local = threading.local()
+        self._thread = None
+
+        conn = self._connect()
+        conn.execute(CREATE_TABLE)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def register(self, name, compute, expires=False):
+        """Refresh ``name`` with ``compute()``, which returns a JSON-able
+        payload.
+
+        :param expires: forget ``name`` once it has not been read for
+            ``IDLE_INTERVALS`` intervals
+        :returns: whether ``name`` was not registered yet
+        """
+        with self._lock:
+            new = name not in self._computes
+            self._computes[name] = compute
+            self._refreshing.setdefault(name, threading.Lock())
+            if expires:
+                self._read_at.setdefault(name, time.time())
+        return new
+
+    def forget(self, name):
+        """Stop refreshing ``name`` and drop its snapshot."""
+        with self._lock:
+            self._computes.pop(name, None)
+            self._stale.discard(name)
+            self._read_at.pop(name, None)
+        self._connect().execute(
+            "DELETE FROM dashboard_snapshots WHERE name = ?", (name,)
+        )
+
+    def _expire(self):
+        deadline = time.time() - IDLE_INTERVALS * self.interval
+        with self._lock:
+            idle = [name for name, at in self._read_at.items() if at < deadline]
+        for name in idle:
+            logger.debug("Dropping unread dashboard snapshot", name=name)
+            self.forget(name)
+
+    def start(self):
+        """Start the refresher thread, once."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="dashboard-snapshots", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.close)
+
+    def get(self, name, refresh=False):
+        """``(payload, refreshed_at)`` of the latest snapshot of ``name``.
+
+        :param refresh: recompute it now instead
+        """
+        self.start()
+        with self._lock:
+            if name in self._read_at:
+                self._read_at[name] = time.time()
+        if refresh:
+            return self.refresh(name)
+        row = (
+            self._connect()
+            .execute(
+                "SELECT payload, refreshed_at FROM dashboard_snapshots WHERE name = ?",
+                (name,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return self.refresh(name)
+        return json.loads(row[0]), row[1]
+
+    def mark_stale(self, *names):
+        """Have ``names``, every summary by default, refreshed soon."""
+        with self._lock:
+            self._stale.update(names or self._computes)
+        self._wake.set()
+
+    def on_registry_change(self, namespace=None, name=None):
+        # CachedMlflowClient listener
+        names = ["dashboard", "registered_models"]
+        if namespace == "models":
+            with self._lock:
+                for key in self._computes:
+                    if not key.startswith("monitor:"):
+                        continue
+                    # monitor:<name>:<version>, model names may hold colons
+                    model = key[len("monitor:") :].rsplit(":", 1)[0]
+                    if name is None or model == name:
+                        names.append(key)
+        self.mark_stale(*names)
+
+    def refresh(self, name):
+        """Compute and store ``name`` now.
+
+        :returns: ``(payload, refreshed_at)``
+        """
+        with self._lock:
+            compute = self._computes[name]
+            lock = self._refreshing[name]
+        with lock:
+            start = time.time()
+            payload = compute()
+            refreshed_at = datetime.datetime.utcnow().strftime(DATETIME_FORMAT)
+            self._connect().execute(
+                "INSERT OR REPLACE INTO dashboard_snapshots "
+                "(name, payload, refreshed_at, duration_ms) VALUES (?, ?, ?, ?)",
+                (
+                    name,
+                    json.dumps(payload, default=str),
+                    refreshed_at,
+                    int((time.time() - start) * 1000),
+                ),
+            )
+        return payload, refreshed_at
+
+    def _run(self):
+        next_run = 0
+        while not self._stop.is_set():
+            self._wake.wait(max(next_run - time.time(), 0))
+            if self._stop.is_set():
+                break
+            if self._wake.is_set():
+                # let a burst of changes settle
+                self._wake.clear()
+                self._stop.wait(self.debounce)
+                with self._lock:
+                    names, self._stale = self._stale, set()
+            else:
+                self._expire()
+                with self._lock:
+                    names = set(self._computes)
+                next_run = time.time() + self.interval
+            for name in sorted(names):
+                try:
+                    self.refresh(name)
+                except Exception:
+                    # keep serving the previous snapshot
+                    logger.exception("Failed to refresh dashboard snapshot", name=name)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -22,6 +22,14 @@ from pygments.formatters import html
 
 import nbformat
 
+from mlopskit.utils.file_range import (
+    MIN_PREVIEW_BYTES,
+    PREVIEW_BYTES,
+    decode,
+    read_range,
+    read_tail,
+)
+
 # 1. Import the exporter
 from nbconvert import HTMLExporter
 
@@ -103,6 +111,37 @@ def human_readable_file_size(size):
     return "{:.4g} {}".format(size / (1 << (order * 10)), _suffixes[order])
 
 
+# previewed by byte range
+TEXT_EXTENSIONS = (".log", ".txt", ".sh", ".json", ".html", ".csv", ".out", ".err")
+# rendered whole, or previewed as text by byte range when larger than
+# MAX_RENDER_BYTES or a range is asked for
+RENDERED_EXTENSIONS = (".py", ".md", ".MD", ".ipynb")
+MAX_RENDER_BYTES = 5 << 20
+
+
+def cat_file_range(file, offset=0, length=PREVIEW_BYTES, tail=None):
+    """Preview ``length`` bytes of ``file`` from ``offset``, or its last
+    ``tail`` lines, without reading the rest of it.
+
+    :returns: dict with the ``file_content`` text, its ``offset`` in the
+        file, the ``next_offset`` to continue from, the file ``size`` and
+        whether there is ``more`` after it
+    """
+    length = max(int(length), MIN_PREVIEW_BYTES)
+    if tail:
+        chunk = read_tail(file, lines=int(tail), max_bytes=length)
+    else:
+        chunk = read_range(file, offset=offset, length=length)
+    text, start, end = decode(chunk, whole_lines=True)
+    return {
+        "file_content": text,
+        "offset": start,
+        "next_offset": end,
+        "size": chunk.size,
+        "more": end < chunk.size,
+    }
+
+
 def cat_file_content(file, fname):
     if fname.endswith(".py"):
         with open(file, "rb") as f:
@@ -119,13 +158,7 @@ def cat_file_content(file, fname):
         code_content = highlight(source, lexer, formatter)
         # code_css =formatters.HtmlFormatter().get_style_defs('.highlight')
         # code_content = highlight_filter(source)
-    elif (
-        fname.endswith(".log")
-        or fname.endswith(".txt")
-        or fname.endswith(".sh")
-        or fname.endswith(".json")
-        or fname.endswith(".html")
-    ):
+    elif fname.endswith(TEXT_EXTENSIONS):
         with open(file, "rb") as f:
             code_content = f.read().decode()
     elif fname.endswith(".MD") or fname.endswith(".md"):
@@ -420,12 +453,9 @@ def reset_experiment_old(experiment_name):
 def reset_experiment(experiment_name):
     bRet, experiment = find_or_404(experiment_name)
     if experiment:
-        exp_name = experiment.name
-        exp_desc = experiment.description
-        exp_alts = experiment.get_alternative_names()
-        experiment.delete()
-        new_exp = Experiment.find_or_create(exp_name, exp_alts, redis=db.REDIS)
-        new_exp.update_description(exp_desc)
+        # the keys are purged in the background, the experiment is recreated
+        # once they are gone
+        experiment.reset(background=True)
         return True, "Sucess"
     else:
         return False, "None experiment is found"
@@ -454,17 +484,32 @@ def toggle_experiment_archive(experiment_name):
     if experiment.is_archived():
         return False, "Exp has already archived"
     else:
-        experiment.archive()
+        experiment.archive(compact=True)
     return True, "Sucess"
 
 
 # Delete experiment
 def delete_experiment(experiment_name):
     bRet, experiment = find_or_404(experiment_name)
-    experiment.delete()
+    experiment.delete(background=True)
     return True, "Sucess"
 
 
+def deletion_progress():
+    return Experiment.deletions(redis=db.REDIS)
+
+
+def resume_experiment_deletions():
+    """Restart the experiment deletions left unfinished by a previous run,
+    in background threads, so their names are not locked for good."""
+    try:
+        return Experiment.resume_deletions(redis=db.REDIS)
+    except Exception as e:
+        # the abtest backend may not be up yet, retried on the next start
+        print("Could not resume experiment deletions: {}".format(e))
+        return []
+
+
 def reset_winner(experiment_name):
     bRet, experiment = find_or_404(experiment_name)
     experiment.reset_winner()
@@ -0,0 +1,218 @@
+"""TTL cache in front of the server's ``MlflowClient``.
+
+Every dashboard page asks the tracking server for registered models and
+model versions, one HTTP round trip per lookup. ``CachedMlflowClient`` keeps
+the results of the registry and experiment reads for ``ttl`` seconds, so a
+warm page renders without calling the tracking server:
+
+* concurrent misses on the same lookup share one call (request coalescing);
+* writes made through the client (register, update, transition, delete...)
+  drop the cached entries of the model or experiments they touch, and the
+  listings, before returning;
+* run lookups and everything else are passed through uncached.
+
+Changes made by other processes (a pipeline registering a version) show up
+once their entries expire; ``invalidate()`` drops everything. Callables in
+``listeners`` are called with ``(namespace, name)`` after each successful
+write; their errors are logged, never raised to the writer.
+"""
+
+import threading
+
+import cachetools
+from structlog import get_logger
+
+logger = get_logger(__name__)
+
+MODELS = "models"
+EXPERIMENTS = "experiments"
+
+# cached read -> (namespace, whether the first argument is a model name)
+CACHED = {
+    "get_registered_model": (MODELS, True),
+    "get_latest_versions": (MODELS, True),
+    "get_model_version": (MODELS, True),
+    "get_model_version_download_uri": (MODELS, True),
+    "list_registered_models": (MODELS, False),
+    "search_registered_models": (MODELS, False),
+    "search_model_versions": (MODELS, False),
+    "list_experiments": (EXPERIMENTS, False),
+    "search_experiments": (EXPERIMENTS, False),
+    "get_experiment": (EXPERIMENTS, False),
+    "get_experiment_by_name": (EXPERIMENTS, False),
+}
+# write -> (namespace, whether the first argument is a model name)
+INVALIDATES = {
+    "create_registered_model": (MODELS, True),
+    "update_registered_model": (MODELS, True),
+    "rename_registered_model": (MODELS, True),
+    "delete_registered_model": (MODELS, True),
+    "set_registered_model_tag": (MODELS, True),
+    "delete_registered_model_tag": (MODELS, True),
+    "create_model_version": (MODELS, True),
+    "update_model_version": (MODELS, True),
+    "transition_model_version_stage": (MODELS, True),
+    "delete_model_version": (MODELS, True),
+    "set_model_version_tag": (MODELS, True),
+    "delete_model_version_tag": (MODELS, True),
+    "create_experiment": (EXPERIMENTS, False),
+    "rename_experiment": (EXPERIMENTS, False),
+    "delete_experiment": (EXPERIMENTS, False),
+    "restore_experiment": (EXPERIMENTS, False),
+    "set_experiment_tag": (EXPERIMENTS, False),
+}
+
+
+class _Call(object):
+    # one lookup in flight, awaited by the requests that missed meanwhile
+    def __init__(self):
+        self.stale = False
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class CachedMlflowClient(object):
+    def __init__(self, client, ttl=60, maxsize=1024):
+        """
+        :param client: the ``mlflow.tracking.MlflowClient`` to wrap
+        :param ttl: seconds a registry read is served from the cache,
+            0 disables caching
+        :param maxsize: maximum number of cached lookups
+        """
+        self.client = client
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = cachetools.TTLCache(maxsize=maxsize, ttl=ttl) if ttl else None
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.listeners = []
+
+    def __getattr__(self, attr):
+        value = getattr(self.client, attr)
+        if not callable(value):
+            return value
+        if attr in CACHED and self._cache is not None:
+
+            def cached(*args, **kwargs):
+                key = (attr, _freeze(args), _freeze(sorted(kwargs.items())))
+                try:
+                    hash(key)
+                except TypeError:
+                    return value(*args, **kwargs)
+                return self._get(key, lambda: value(*args, **kwargs))
+
+            return cached
+        if attr in INVALIDATES:
+            namespace, by_name = INVALIDATES[attr]
+
+            def write(*args, **kwargs):
+                name = _model_name(args, kwargs) if by_name else None
+                try:
+                    result = value(*args, **kwargs)
+                finally:
+                    # a failed write may still have been applied
+                    self.invalidate(namespace, name)
+                    if attr == "rename_registered_model":
+                        self.invalidate(namespace, _new_name(args, kwargs))
+                self._notify(namespace, name)
+                return result
+
+            return write
+        return value
+
+    def _notify(self, namespace, name):
+        for listener in list(self.listeners):
+            try:
+                listener(namespace, name)
+            except Exception:
+                logger.exception(
+                    "Registry listener failed", namespace=namespace, name=name
+                )
+
+    def _get(self, key, load):
+        with self._lock:
+            try:
+                value = self._cache[key]
+                self.hits += 1
+                return value
+            except KeyError:
+                pass
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.misses += 1
+        if not leader:
+            return call.wait()
+
+        try:
+            call.value = load()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                # an invalidation while loading means the value may be stale
+                if call.error is None and not call.stale:
+                    self._cache[key] = call.value
+            call.done.set()
+        return call.value
+
+    def invalidate(self, namespace=None, name=None):
+        """Drop the cached lookups of model ``name`` and the listings of
+        ``namespace``; everything when called without arguments."""
+        if self._cache is None:
+            return
+        with self._lock:
+            for key in list(self._cache.keys()):
+                if _matches(key, namespace, name):
+                    self._cache.pop(key, None)
+            for key, call in list(self._calls.items()):
+                if _matches(key, namespace, name):
+                    call.stale = True
+                    del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._cache) if self._cache is not None else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _matches(key, namespace, name):
+    if namespace is None:
+        return True
+    key_namespace, by_name = CACHED[key[0]]
+    if key_namespace != namespace:
+        return False
+    if name is None or not by_name:
+        return True
+    return _model_name(key[1], dict(key[2])) == name
+
+
+def _freeze(values):
+    # stages=["Production", "Staging"] -> hashable key
+    return tuple(
+        _freeze(value) if isinstance(value, (list, tuple)) else value
+        for value in values
+    )
+
+
+def _model_name(args, kwargs):
+    return args[0] if args else kwargs.get("name")
+
+
+def _new_name(args, kwargs):
+    return args[1] if len(args) > 1 else kwargs.get("new_name")
@@ -0,0 +1,238 @@
+"""Cached, paginated directory listings.
+
+Reading a directory of 100k files and stat-ing every entry on each request
+makes file browsers slow. ``DirectoryListing`` keeps a snapshot of the names
+(and file/directory type) of every directory it lists, keyed by the
+directory's ``st_mtime_ns``: creating, deleting or renaming an entry bumps
+the directory's mtime, so one ``stat`` of the directory tells whether the
+snapshot still holds. Recursive listings walk the cached snapshots and only
+re-read the directories that changed.
+
+Sizes and modification times are not cached, since rewriting a file in place
+leaves its directory untouched. They are read when the entries are used,
+once per entry, and a page only stats the entries it returns::
+
+    entries, total = LISTINGS.listdir(path, prefix="model", page=2, page_size=100)
+    for entry in entries:  # os.DirEntry-like: name, path, is_dir(), stat()
+        ...
+
+Snapshots taken within ``RACY_SECONDS`` of a directory change are not
+trusted, since another change in the same mtime tick would go unnoticed.
+"""
+
+import bisect
+import collections
+import os
+import stat
+import threading
+import time
+
+PAGE_SIZE = 500
+RACY_SECONDS = 2.0
+
+# dir_names and file_names are sorted
+_Snapshot = collections.namedtuple(
+    "_Snapshot", ("mtime_ns", "ino", "taken_at", "dir_names", "file_names")
+)
+# the snapshots a recursive listing was built from, and its result
+_Walk = collections.namedtuple("_Walk", ("snapshots", "files", "dirs"))
+
+
+class Entry(object):
+    # the os.DirEntry interface used by the listing endpoints
+    __slots__ = ("name", "path", "_is_dir", "_stat")
+
+    def __init__(self, name, path, is_dir):
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+        self._stat = None
+
+    def is_dir(self):
+        return self._is_dir
+
+    def is_file(self):
+        return not self._is_dir
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return "<Entry {0!r}>".format(self.path)
+
+
+class DirectoryListing(object):
+    def __init__(self, max_directories=4096):
+        """
+        :param max_directories: snapshots kept, least recently used first out
+        """
+        self.max_directories = max_directories
+        self._snapshots = collections.OrderedDict()
+        self._walks = {}
+        self._lock = threading.Lock()
+
+    def _snapshot(self, directory):
+        info = os.stat(directory)
+        if not stat.S_ISDIR(info.st_mode):
+            raise NotADirectoryError(directory)
+        with self._lock:
+            snapshot = self._snapshots.pop(directory, None)
+            if (
+                snapshot is not None
+                and snapshot.mtime_ns == info.st_mtime_ns
+                and snapshot.ino == info.st_ino
+                and snapshot.taken_at - info.st_mtime_ns / 1e9 > RACY_SECONDS
+            ):
+                self._snapshots[directory] = snapshot
+                return snapshot
+
+        taken_at = time.time()
+        entries = []
+        with os.scandir(directory) as scanner:
+            for entry in scanner:
+                try:
+                    # d_type from readdir, no stat unless the file system
+                    # does not report it
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                entries.append((entry.name, is_dir))
+        entries.sort()
+        snapshot = _Snapshot(
+            info.st_mtime_ns,
+            info.st_ino,
+            taken_at,
+            tuple(name for name, is_dir in entries if is_dir),
+            tuple(name for name, is_dir in entries if not is_dir),
+        )
+        with self._lock:
+            self._snapshots[directory] = snapshot
+            while len(self._snapshots) > self.max_directories:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def listdir(self, directory, prefix="", page=None, page_size=PAGE_SIZE, exclude=()):
+        """Entries of ``directory`` whose name starts with ``prefix``,
+        directories first, each sorted by name.
+
+        :param page: 1-based page of ``page_size`` entries, all when None
+        :returns: ``(entries, total)``, ``total`` counting every match
+        """
+        snapshot = self._snapshot(directory)
+        dirs = _filter(snapshot.dir_names, prefix, exclude)
+        files = _filter(snapshot.file_names, prefix, exclude)
+        if page is None:
+            start, end = 0, len(dirs) + len(files)
+        else:
+            start = (max(int(page), 1) - 1) * page_size
+            end = start + page_size
+        # directories occupy positions [0, len(dirs)) of the listing
+        entries = [
+            Entry(name, os.path.join(directory, name), True) for name in dirs[start:end]
+        ]
+        entries += [
+            Entry(name, os.path.join(directory, name), False)
+            for name in files[max(start - len(dirs), 0) : max(end - len(dirs), 0)]
+        ]
+        return entries, len(dirs) + len(files)
+
+    def walk(self, root, prefix="", page=None, page_size=PAGE_SIZE, exclude=()):
+        """Files under ``root``, recursively, sorted by relative path.
+
+        :param prefix: keep the relative paths (``/`` separated) starting
+            with it
+        :param exclude: directory or file names skipped at any depth
+        :returns: ``(entries, dirs, total)``: the page of file entries, every
+            directory walked and the number of matching files
+        """
+        key = (root, tuple(sorted(exclude)))
+        with self._lock:
+            cached = self._walks.get(key)
+        if cached is None or not self._unchanged(cached.snapshots):
+            cached = self._walk(root, exclude)
+            with self._lock:
+                self._walks[key] = cached
+        files = _filter(cached.files, prefix, ())
+        return (
+            [
+                Entry(path.rsplit("/", 1)[-1], os.path.join(root, path), False)
+                for path in _page(files, page, page_size)
+            ],
+            list(cached.dirs),
+            len(files),
+        )
+
+    def _unchanged(self, snapshots):
+        # one stat per directory
+        for directory, snapshot in snapshots:
+            try:
+                if self._snapshot(directory) is not snapshot:
+                    return False
+            except (FileNotFoundError, NotADirectoryError):
+                return False
+        return True
+
+    def _walk(self, root, exclude):
+        snapshots, files, dirs = [], [], []
+        pending = [""]
+        while pending:
+            relative = pending.pop()
+            directory = os.path.join(root, relative) if relative else root
+            try:
+                snapshot = self._snapshot(directory)
+            except (FileNotFoundError, NotADirectoryError):
+                # removed while walking
+                continue
+            snapshots.append((directory, snapshot))
+            base = relative + "/" if relative else ""
+            for name in snapshot.dir_names:
+                if name not in exclude:
+                    dirs.append(base + name)
+                    pending.append(base + name)
+            files.extend(
+                base + name for name in snapshot.file_names if name not in exclude
+            )
+        files.sort()
+        dirs.sort()
+        return _Walk(tuple(snapshots), tuple(files), tuple(dirs))
+
+    def invalidate(self, directory=None):
+        """Forget the snapshot of ``directory``, every snapshot by default."""
+        with self._lock:
+            if directory is None:
+                self._snapshots.clear()
+                self._walks.clear()
+            else:
+                self._snapshots.pop(directory, None)
+
+
+def _filter(names, prefix, exclude):
+    # names are sorted: the matches of prefix are one contiguous slice
+    if prefix:
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\U0010ffff", start)
+        names = names[start:end]
+    # a full pass only when an excluded name is actually there
+    if any(_contains(names, name) for name in exclude):
+        names = tuple(name for name in names if name not in exclude)
+    return names
+
+
+def _contains(names, name):
+    idx = bisect.bisect_left(names, name)
+    return idx < len(names) and names[idx] == name
+
+
+def _page(items, page, page_size):
+    if page is None:
+        return items
+    page = max(int(page), 1)
+    return items[(page - 1) * page_size : page * page_size]
+
+
+LISTINGS = DirectoryListing()
@@ -0,0 +1,165 @@
+"""Ranged reads of large files.
+
+Previewing a multi-GB log or artifact must not read it whole. These helpers
+memory-map the file and copy out only the bytes asked for, so the cost of a
+preview is the size of the preview::
+
+    chunk = read_range(path, offset=4096, length=PREVIEW_BYTES)
+    chunk.data, chunk.offset, chunk.size   # bytes, where they start, file size
+    chunk = read_tail(path, lines=200)     # the last 200 lines
+    start, end = parse_range("bytes=0-1023", size)
+
+Text is cut on line or UTF-8 character boundaries by ``decode``, never in
+the middle of a character.
+"""
+
+import collections
+import mmap
+import os
+import re
+
+PREVIEW_BYTES = 1 << 20
+MAX_PREVIEW_BYTES = 16 << 20
+# holds a whole UTF-8 character wherever the range starts
+MIN_PREVIEW_BYTES = 8
+# steps of the backward search for line breaks
+TAIL_STEP = 64 << 10
+
+Chunk = collections.namedtuple("Chunk", ("data", "offset", "size"))
+Chunk.__doc__ = """``data`` read at ``offset`` of a file of ``size`` bytes."""
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _map(f, size):
+    # mmap refuses empty files
+    if not size:
+        return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_range(path, offset=0, length=PREVIEW_BYTES):
+    """Read ``length`` bytes of ``path`` from ``offset``, fewer at its end.
+
+    A negative ``offset`` counts from the end of the file.
+    """
+    length = min(max(int(length), 0), MAX_PREVIEW_BYTES)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = int(offset)
+        if offset < 0:
+            offset = max(size + offset, 0)
+        offset = min(offset, size)
+        mapped = _map(f, size)
+        if mapped is None:
+            return Chunk(b"", 0, 0)
+        with mapped:
+            return Chunk(mapped[offset : offset + length], offset, size)
+
+
+def read_tail(path, lines=100, max_bytes=PREVIEW_BYTES):
+    """The last ``lines`` lines of ``path``, at most ``max_bytes`` of them."""
+    max_bytes = min(max(int(max_bytes), 0), MAX_PREVIEW_BYTES)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        mapped = _map(f, size)
+        if mapped is None:
+            return Chunk(b"", 0, 0)
+        with mapped:
+            floor = max(size - max_bytes, 0)
+            # a trailing line break does not start an empty line
+            end = size - 1 if mapped[size - 1 : size] == b"\n" else size
+            start = end
+            found = 0
+            while found < lines and start > floor:
+                # scan back step by step instead of searching the whole file
+                low = max(start - TAIL_STEP, floor)
+                idx = mapped.rfind(b"\n", low, start)
+                while idx >= 0 and found < lines:
+                    found += 1
+                    start = idx
+                    if found < lines:
+                        idx = mapped.rfind(b"\n", low, start)
+                if found < lines:
+                    start = low
+            if found == lines:
+                # drop the line break before the first line
+                start += 1
+            return Chunk(mapped[start:size], start, size)
+
+
+def iter_range(path, start=0, end=None, chunk_size=256 << 10):
+    """Yield the bytes of ``path`` from ``start`` up to ``end`` (excluded) in
+    ``chunk_size`` blocks, for streamed responses."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def parse_range(header, size):
+    """``(start, end)``, ``end`` excluded, of a ``Range: bytes=...`` header
+    for a file of ``size`` bytes; ``None`` without a usable single range.
+
+    :raises ValueError: when the range starts past the end of the file
+    """
+    match = _RANGE_RE.match((header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-500: the last 500 bytes
+        if not int(last):
+            raise ValueError("range not satisfiable: {0}".format(header))
+        return max(size - int(last), 0), size
+    start = int(first)
+    end = size if not last else min(int(last) + 1, size)
+    if start >= size or end <= start:
+        raise ValueError("range not satisfiable: {0}".format(header))
+    return start, end
+
+
+def decode(chunk, whole_lines=False):
+    """Text of ``chunk``, cut to whole UTF-8 characters, or whole lines when
+    ``whole_lines`` and the chunk does not reach the end of the file.
+
+    :returns: ``(text, offset, next_offset)``, where the text starts in the
+        file and where the next chunk should; ``next_offset`` is past
+        ``offset`` for any non-empty chunk
+    """
+    data, offset = chunk.data, chunk.offset
+    end = offset + len(data)
+    # skip continuation bytes of a character begun before the chunk
+    head = 0
+    while head < min(len(data), 3) and 0x80 <= data[head] < 0xC0:
+        head += 1
+    if end < chunk.size:
+        if whole_lines and data.rfind(b"\n", head) >= 0:
+            cut = data.rfind(b"\n", head) + 1
+        else:
+            cut = _char_boundary(data)
+        if cut > head:
+            data = data[:cut]
+        # else shorter than its first character: keep it whole, so that the
+        # next chunk starts further on
+    text = data[head:].decode("utf-8", errors="replace")
+    return text, offset + head, offset + len(data)
+
+
+def _char_boundary(data):
+    # length of data without a character cut at its end
+    for back in range(1, min(len(data), 4) + 1):
+        byte = data[-back]
+        if byte < 0x80:
+            return len(data)
+        if byte >= 0xC0:
+            needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return len(data) if back >= needed else len(data) - back
+    return len(data)